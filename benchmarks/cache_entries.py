@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Benchmark eager versus lazy cache entry decoding for keyword-only scans.
+
+Generates a synthetic md5-cache and compares scanning the KEYWORDS of every
+entry (similar to what pshowkw or ``pquery --attr keywords`` do) using the
+lazily decoded entries against eagerly splitting every line into a dict.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from snakeoil.osutils import pjoin
+
+from pkgcore.cache import flat_hash
+
+ENTRY = (
+    'BDEPEND=virtual/pkgconfig\n'
+    'DEFINED_PHASES=compile configure install prepare test\n'
+    'DEPEND=>=dev-libs/glib-2.40:2 sys-libs/zlib:= ssl? ( dev-libs/openssl:0= )\n'
+    'DESCRIPTION=Synthetic package number {i} used for benchmarking\n'
+    'EAPI=7\n'
+    'HOMEPAGE=https://example.com/pkg{i}\n'
+    'IUSE=debug doc ssl static-libs test\n'
+    'KEYWORDS=~alpha amd64 arm arm64 ~hppa ~ia64 ppc ppc64 ~s390 sparc x86\n'
+    'LICENSE=GPL-2+ LGPL-2.1\n'
+    'RDEPEND=>=dev-libs/glib-2.40:2 sys-libs/zlib:= ssl? ( dev-libs/openssl:0= )\n'
+    'RESTRICT=!test? ( test )\n'
+    'SLOT=0/{i}\n'
+    'SRC_URI=https://example.com/pkg{i}-1.0.tar.xz\n'
+    '_eclasses_=toolchain-funcs\t{md5}\tmultilib\t{md5}\teutils\t{md5}\n'
+    '_md5_={md5}\n'
+)
+
+
+class eager_md5_cache(flat_hash.md5_cache):
+    """md5_cache variant splitting every line of an entry into a dict."""
+
+    def _parse_data(self, data, mtime):
+        d = self._cdict_kls()
+        known = self._known_keys
+        for x in data.splitlines():
+            k, v = x.split('=', 1)
+            if k in known:
+                d[k] = v
+        d[self._chf_key] = self._chf_deserializer(d[self._chf_key])
+        return d
+
+
+def generate(location, count):
+    md5 = 'd41d8cd98f00b204e9800998ecf8427e'
+    cpvs = []
+    for i in range(count):
+        cat = f'cat-{i % 100}'
+        path = pjoin(location, 'metadata', 'md5-cache', cat)
+        os.makedirs(path, exist_ok=True)
+        with open(pjoin(path, f'pkg{i}-1.0'), 'w') as f:
+            f.write(ENTRY.format(i=i, md5=md5))
+        cpvs.append(f'{cat}/pkg{i}-1.0')
+    return cpvs
+
+
+def scan(cache, cpvs):
+    """Pull keywords for all entries, retaining them as package objects do."""
+    entries = [cache[cpv] for cpv in cpvs]
+    for d in entries:
+        tuple(d['KEYWORDS'].split())
+    return entries
+
+
+def run(kls, location, cpvs, rounds):
+    cache = kls(location, readonly=True)
+    # warm up the page cache
+    scan(cache, cpvs)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        scan(cache, cpvs)
+    elapsed = (time.perf_counter() - start) / rounds
+
+    tracemalloc.start()
+    entries = scan(cache, cpvs)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del entries
+    return elapsed, retained, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--entries', type=int, default=10000)
+    parser.add_argument('-r', '--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as location:
+        cpvs = generate(location, args.entries)
+        print(f'{args.entries} entries, keyword-only scan')
+        print(f"{'mode':<8}{'time (s)':>12}{'retained (KiB)':>16}{'peak (KiB)':>14}")
+        for name, kls in (('eager', eager_md5_cache), ('lazy', flat_hash.md5_cache)):
+            elapsed, retained, peak = run(kls, location, cpvs, args.rounds)
+            print(f'{name:<8}{elapsed:>12.3f}{retained / 1024:>16.1f}{peak / 1024:>14.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""Benchmark slot and blocker tracking of the resolver plan state.
+
+Generates a synthetic repo where each package depends on a couple of slots of
+a heavily slotted package while blocking others, similar to the slotted
+python and perl deps and blockers in the gentoo tree. It compares
+PigeonHoledSlots against a reference implementation that scans every obj and
+limiter of a key, both for raw slotting operations and for a full resolution.
+"""
+
+import argparse
+import time
+
+from pkgcore.ebuild import resolver
+from pkgcore.ebuild.atom import atom
+from pkgcore.resolver.pigeonholes import PigeonHoledSlots
+from pkgcore.test.misc import FakePkg, FakeRepo
+
+SLOTTED = 'dev-lang/python'
+
+
+class linear_slots(PigeonHoledSlots):
+    """PigeonHoledSlots variant without the (key, slot) and limiter indexes."""
+
+    def fill_slotting(self, obj, force=False):
+        l = self.check_limiters(obj)
+        l.extend(x for x in self.slot_dict.get(obj.key, ()) if x.slot == obj.slot)
+        if not l or force:
+            super().fill_slotting(obj, force=True)
+        return l
+
+    def get_conflicting_slot(self, pkg):
+        for x in self.slot_dict.get(pkg.key, ()):
+            if pkg.slot == x.slot:
+                return x
+        return None
+
+    def find_atom_matches(self, atom, key=None):
+        if key is None:
+            key = atom.key
+        return list(filter(atom.match, self.slot_dict.get(key, ())))
+
+    def check_limiters(self, obj):
+        return [x for x in self.limiters.get(obj.key, ()) if x.match(obj)]
+
+
+class keyed_repo(FakeRepo):
+    """FakeRepo indexing its pkgs by key to keep queries out of the timings."""
+
+    def add_pkgs(self, pkgs):
+        self.pkgs = list(self.pkgs) + pkgs
+        self.keys = {}
+        for pkg in self.pkgs:
+            self.keys.setdefault(pkg.key, []).append(pkg)
+
+    def itermatch(self, restrict, sorter=iter, **kwargs):
+        pkgs = self.keys.get(getattr(restrict, 'key', None))
+        if pkgs is None:
+            pkgs = self.pkgs
+        return filter(restrict.match, list(sorter(pkgs)))
+
+
+def generate(count, slots):
+    repo = keyed_repo(repo_id='synthetic', livefs=False)
+    pkgs = [FakePkg(f'{SLOTTED}-{s + 1}.0', slot=str(s), repo=repo) for s in range(slots)]
+    for i in range(count):
+        used = (i % slots, (i * 7 + 1) % slots)
+        deps = [f'{SLOTTED}:{s}' for s in used]
+        # blockers on slots and versions that are never installed
+        deps.extend(f'!{SLOTTED}:{slots + (i + j) % slots}' for j in range(4))
+        deps.append(f'!<{SLOTTED}-0.{i}')
+        pkgs.append(FakePkg(
+            f'app-misc/pkg{i}-1', repo=repo, eapi='5', data={'RDEPEND': ' '.join(deps)}))
+    repo.add_pkgs(pkgs)
+    return repo
+
+
+def slotting(kls, slots, blockers, rounds):
+    """Time filling, matching, and removing slots with many limiters present."""
+    pkgs = [FakePkg(f'{SLOTTED}-{s + 1}.0', slot=str(s)) for s in range(slots)]
+    atoms = [atom(f'{SLOTTED}:{s}') for s in range(slots)]
+    c = kls()
+    for i in range(blockers):
+        if i % 2:
+            c.add_limiter(atom(f'!{SLOTTED}:{slots + i}'))
+        else:
+            c.add_limiter(atom(f'!<{SLOTTED}-0.{i}'))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for pkg in pkgs:
+            c.fill_slotting(pkg)
+        for a in atoms:
+            c.find_atom_matches(a)
+        for pkg in pkgs:
+            c.get_conflicting_slot(pkg)
+            c.remove_slotting(pkg)
+    return (time.perf_counter() - start) / rounds
+
+
+def resolve(kls, repo, count):
+    vdb = FakeRepo(repo_id='vdb', livefs=True)
+    r = resolver.upgrade_resolver([vdb], [repo])
+    r.state.state = kls()
+    r.state.match_atom = r.state.state.find_atom_matches
+    atoms = [atom(f'app-misc/pkg{i}') for i in range(count)]
+    start = time.perf_counter()
+    ret = r.add_atoms(atoms, finalize=True)
+    elapsed = time.perf_counter() - start
+    assert not ret, f'resolution failed: {ret[0][0]}'
+    return elapsed, [str(x) for x in r.state.iter_ops()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--packages', type=int, default=500)
+    parser.add_argument('-s', '--slots', type=int, default=40)
+    parser.add_argument('-b', '--blockers', type=int, default=2000)
+    parser.add_argument('-r', '--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    impls = (('linear', linear_slots), ('indexed', PigeonHoledSlots))
+    print(f'{args.slots} slots, {args.blockers} limiters, slotting operations')
+    print(f"{'mode':<10}{'time (s)':>12}")
+    for name, kls in impls:
+        elapsed = slotting(kls, args.slots, args.blockers, args.rounds)
+        print(f'{name:<10}{elapsed:>12.4f}')
+
+    repo = generate(args.packages, args.slots)
+    print(f'\n{args.packages} packages, {args.slots} slots, resolution')
+    print(f"{'mode':<10}{'time (s)':>12}")
+    results = []
+    for name, kls in impls:
+        elapsed, ops = resolve(kls, repo, args.packages)
+        results.append(ops)
+        print(f'{name:<10}{elapsed:>12.3f}')
+    assert results[0] == results[1], 'implementations resolved differently'
+
+
+if __name__ == '__main__':
+    main()
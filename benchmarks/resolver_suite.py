@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Benchmark dependency resolution against synthetic repos.
+
+Generates synthetic repos and vdbs of the requested sizes and times
+merge_plan.add_atoms() end to end for several scenarios:
+
+- world: update all installed packages
+- install: install the packages with the deepest dep graphs
+- emptytree: rebuild all installed packages and their deps
+
+Results can be written to a JSON file and compared against an earlier run to
+catch performance regressions; the exit status is nonzero if any case got
+slower than the given tolerance.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from pkgcore.ebuild import resolver
+from pkgcore.ebuild.atom import atom
+from pkgcore.resolver import sat
+from pkgcore.resolver.plan import merge_plan
+
+from synthetic_repo import synthetic_repos
+
+RESOLVERS = {
+    'backtrack': lambda kls: kls,
+    'sat': sat.generate_sat_resolver_kls,
+}
+
+
+def scenarios(repos, targets):
+    """Yield (name, resolver class, targets) for each scenario."""
+    yield 'world', merge_plan, repos.world
+    world = set(map(str, repos.world))
+    yield 'install', merge_plan, [
+        atom(x) for x in reversed(repos.keys) if x not in world][:targets]
+    yield 'emptytree', resolver.empty_tree_merge_plan, repos.world
+
+
+def run(resolver_cls, repos, atoms, rounds, preload=False):
+    best = None
+    for _ in range(rounds):
+        r = resolver.upgrade_resolver([repos.vdb], [repos.source], resolver_cls=resolver_cls)
+        start = time.perf_counter()
+        if preload:
+            r.load_vdb_state(bulk=True)
+        ret = r.add_atoms(atoms, finalize=True)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    ops = 0 if ret else sum(1 for _ in r.state.iter_ops())
+    return best, ops, bool(ret)
+
+
+def compare(results, baseline, tolerance):
+    """Return the cases that got slower than the baseline allows."""
+    def case(x):
+        return (x['packages'], x['scenario'], x['resolver'])
+
+    previous = {case(x): x for x in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get(case(result))
+        if old is not None and result['time'] > old['time'] * (1 + tolerance):
+            regressions.append((result, old))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        '-n', '--packages', type=int, nargs='+', default=[500, 2000],
+        help='repo sizes in number of package keys')
+    parser.add_argument('--versions', type=int, default=3)
+    parser.add_argument('--fanout', type=int, default=4)
+    parser.add_argument('--slot-ratio', type=float, default=0.1)
+    parser.add_argument('--slots', type=int, default=3)
+    parser.add_argument('--blocker-ratio', type=float, default=0.05)
+    parser.add_argument('--use-ratio', type=float, default=0.3)
+    parser.add_argument('--any-of-ratio', type=float, default=0.1)
+    parser.add_argument('--installed-ratio', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--targets', type=int, default=50, help='number of targets for the install scenario')
+    parser.add_argument(
+        '-s', '--scenario', action='append', choices=('world', 'install', 'emptytree'),
+        help='scenarios to run, defaults to all')
+    parser.add_argument(
+        '-R', '--resolver', action='append', choices=sorted(RESOLVERS),
+        help='resolvers to run, defaults to all')
+    parser.add_argument('-r', '--rounds', type=int, default=3)
+    parser.add_argument(
+        '-p', '--preload-vdb-state', action='store_true',
+        help='bulk preload the vdb state before resolving, included in the timings')
+    parser.add_argument('-o', '--output', help='write results as JSON to a file')
+    parser.add_argument('-b', '--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument(
+        '-t', '--tolerance', type=float, default=0.2,
+        help='allowed slowdown relative to the baseline')
+    args = parser.parse_args()
+
+    params = {
+        x: getattr(args, x) for x in (
+            'versions', 'fanout', 'slot_ratio', 'slots', 'blocker_ratio',
+            'use_ratio', 'any_of_ratio', 'installed_ratio', 'seed')}
+    resolvers = args.resolver or sorted(RESOLVERS)
+
+    results = []
+    print(f"{'packages':>8} {'installed':>9} {'scenario':<10}{'resolver':<10}"
+          f"{'ops':>7}{'time (s)':>10}")
+    for packages in args.packages:
+        start = time.perf_counter()
+        repos = synthetic_repos(packages, **params)
+        generation = time.perf_counter() - start
+        for scenario, kls, atoms in scenarios(repos, args.targets):
+            if args.scenario and scenario not in args.scenario:
+                continue
+            for name in resolvers:
+                elapsed, ops, failed = run(
+                    RESOLVERS[name](kls), repos, atoms, args.rounds,
+                    preload=args.preload_vdb_state)
+                results.append({
+                    'packages': packages, 'installed': repos.installed,
+                    'scenario': scenario, 'resolver': name, 'targets': len(atoms),
+                    'time': elapsed, 'ops': ops, 'failed': failed,
+                    'generation': generation,
+                })
+                ops = 'failed' if failed else ops
+                print(f'{packages:>8} {repos.installed:>9} {scenario:<10}{name:<10}'
+                      f'{ops:>7}{elapsed:>10.3f}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'params': params, 'results': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['params'] != params:
+            print('warning: baseline was generated with different parameters', file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        for result, old in regressions:
+            print(f"regression: {result['packages']} packages {result['scenario']} "
+                  f"{result['resolver']}: {old['time']:.3f}s -> {result['time']:.3f}s",
+                  file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
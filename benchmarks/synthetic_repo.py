@@ -0,0 +1,148 @@
+"""Generate synthetic ebuild repos and vdbs for resolver benchmarks.
+
+Repos are built in memory from SimpleTree and FakePkg ebuilds and wrapped in
+a configured tree evaluating USE conditionals against a fixed set of enabled
+flags, similar to what a domain does for real repos. Generation is seeded so
+the same parameters always produce the same repos.
+"""
+
+import random
+
+from snakeoil import klass
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.repository import configured
+from pkgcore.repository.util import SimpleTree
+from pkgcore.test.misc import FakePkg
+
+DEP_ATTRS = ('bdepend', 'depend', 'rdepend', 'pdepend')
+USE_FLAGS = tuple(f'flag{i}' for i in range(16))
+ENABLED_USE = frozenset(USE_FLAGS[::2])
+
+
+class built_pkg(FakePkg):
+    """FakePkg variant marked as built, as installed pkgs are."""
+
+    built = True
+
+
+class use_configured_tree(configured.tree):
+    """Configured tree binding a fixed set of enabled USE flags to all pkgs."""
+
+    configurable = 'use'
+
+    def __init__(self, raw_repo, enabled_use=ENABLED_USE):
+        self._enabled_use = enabled_use
+        super().__init__(
+            raw_repo, {x: klass.alias_method('evaluate_depset') for x in DEP_ATTRS})
+        self.livefs = raw_repo.livefs
+
+    def _get_pkg_kwds(self, pkg):
+        return {'initial_settings': self._enabled_use}
+
+
+class synthetic_repos:
+    """Synthetic source repo and vdb.
+
+    :param packages: number of package keys
+    :param versions: number of versions per key
+    :param fanout: average number of deps per package
+    :param slot_ratio: fraction of keys with versions spread over multiple slots
+    :param slots: number of slots used by slotted keys
+    :param blocker_ratio: fraction of keys blocking older versions of a dep
+    :param use_ratio: fraction of deps that are USE conditional
+    :param any_of_ratio: fraction of deps that are any-of groups
+    :param installed_ratio: fraction of keys with a version installed
+    :param seed: random seed
+    :ivar source: configured source repo
+    :ivar vdb: configured vdb
+    :ivar world: unversioned atoms of all installed keys
+    :ivar keys: all package keys, with deps only pointing to earlier keys
+    """
+
+    def __init__(self, packages=1000, versions=3, fanout=4, slot_ratio=0.1, slots=3,
+                 blocker_ratio=0.05, use_ratio=0.3, any_of_ratio=0.1,
+                 installed_ratio=0.5, seed=0):
+        self.versions = versions
+        self.slots = slots
+        self._rng = rng = random.Random(seed)
+        self.keys = [f'cat-{i % 50}/pkg{i}' for i in range(packages)]
+        self.slotted = {key for key in self.keys[1:] if rng.random() < slot_ratio}
+
+        metadata = {}
+        installed = {}
+        installed_keys = set()
+        for i, key in enumerate(self.keys):
+            deps = []
+            if i:
+                for _ in range(rng.randint(0, fanout * 2)):
+                    dep = self._dep(i, any_of_ratio)
+                    if rng.random() < use_ratio:
+                        dep = f'{rng.choice(USE_FLAGS)}? ( {dep} )'
+                    deps.append(dep)
+                if rng.random() < blocker_ratio:
+                    target = self._target(i)
+                    if target not in self.slotted:
+                        deps.append(f'!<{target}-{versions}')
+            data = {
+                'DEPEND': ' '.join(deps),
+                'RDEPEND': ' '.join(deps),
+                'BDEPEND': ' '.join(deps[:1]),
+                'IUSE': ' '.join(USE_FLAGS),
+            }
+            for ver in range(1, versions + 1):
+                metadata[f'{key}-{ver}'] = (self._slot(key, ver), data)
+            if rng.random() < installed_ratio:
+                ver = rng.randint(1, versions)
+                installed[f'{key}-{ver}'] = (self._slot(key, ver), data)
+                installed_keys.add(key)
+
+        self.source = use_configured_tree(self._tree(metadata, FakePkg, 'synthetic'))
+        self.vdb = use_configured_tree(self._tree(installed, built_pkg, 'vdb', livefs=True))
+        self.world = [atom(key) for key in self.keys if key in installed_keys]
+        self.installed = len(installed)
+
+    def _target(self, i):
+        return self.keys[self._rng.randrange(i)]
+
+    def _slot(self, key, ver):
+        if key in self.slotted:
+            return str(ver % self.slots)
+        return '0'
+
+    def _atom(self, i):
+        key = self._target(i)
+        rng = self._rng
+        if key in self.slotted:
+            return f'{key}:{rng.randrange(min(self.slots, self.versions))}'
+        if rng.random() < 0.3:
+            return f'>={key}-{rng.randint(1, self.versions)}'
+        return key
+
+    def _dep(self, i, any_of_ratio):
+        if self._rng.random() < any_of_ratio:
+            return f'|| ( {self._atom(i)} {self._atom(i)} )'
+        return self._atom(i)
+
+    @staticmethod
+    def _tree(metadata, pkg_kls, repo_id, livefs=False):
+        cpv_dict = {}
+        for cpv in metadata:
+            key, ver = cpv.rsplit('-', 1)
+            cat, pkg = key.split('/')
+            cpv_dict.setdefault(cat, {}).setdefault(pkg, []).append(ver)
+        tree = SimpleTree(cpv_dict, livefs=livefs, repo_id=repo_id)
+        pkgs = {}
+
+        def _pkg(cat, pkg, ver):
+            cpv = f'{cat}/{pkg}-{ver}'
+            obj = pkgs.get(cpv)
+            if obj is None:
+                slot, data = metadata[cpv]
+                obj = pkgs[cpv] = pkg_kls(
+                    cpv, eapi='7', slot=slot, data=dict(data), repo=tree)
+            return obj
+
+        tree.package_class = _pkg
+        return tree
+
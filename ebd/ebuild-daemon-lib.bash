@@ -111,6 +111,12 @@ __internal_inherit() {
 		__qa_invoke "${PKGCORE_PRELOADED_ECLASSES[$1]}"
 		return
 	fi
+	if [[ -n ${PKGCORE_ECLASS_PATHS[$1]} ]]; then
+		__qa_invoke source "${PKGCORE_ECLASS_PATHS[$1]}" >&2 || die "failed eclass inherit: $1"
+		return
+	fi
+	# eclass paths are set when requests are queued, so python can't be asked
+	[[ ${#PKGCORE_ECLASS_PATHS[@]} -gt 0 ]] && die "inherit requires unknown eclass: $1.eclass"
 	__ebd_write_line "request_inherit $1"
 	__ebd_read_line line
 	if [[ ${line} == "path" ]]; then
@@ -128,7 +128,7 @@ __ebd_exec_main() {
 	# protect ourselves
 	declare -rx PKGCORE_EBD_PATH=${PKGCORE_EBD_PATH}
 
-	declare -A PKGCORE_PRELOADED_ECLASSES
+	declare -A PKGCORE_PRELOADED_ECLASSES PKGCORE_ECLASS_PATHS
 
 	trap __ebd_sigint_handler SIGINT
 	trap __ebd_sigterm_handler SIGTERM
@@ -327,6 +327,75 @@ __make_preloaded_eclass_func() {
 	PKGCORE_PRELOADED_ECLASSES[$1]=__preloaded_eclass_$1
 }
 
+__ebd_process_command() {
+	local com=$1
+	case ${com} in
+		process_ebuild*)
+			# cleanse whitespace.
+			local phases=$(echo ${com#process_ebuild})
+			__ebd_process_ebuild_phases ${phases}
+			if [[ $? -eq 0 ]]; then
+				__ebd_write_line "phases succeeded"
+			else
+				__ebd_write_line "phases failed ebd::${com% *} failed"
+			fi
+			;;
+		preload_eclass\ *)
+			success="succeeded"
+			com=${com#preload_eclass }
+			for e in ${com}; do
+				x=${e##*/}
+				x=${x%.eclass}
+				if ! $(type -P bash) -n "${e}"; then
+					echo "errors detected in '${e}'" >&2
+					success='failed'
+					break
+				fi
+				__make_preloaded_eclass_func "${x}" "$(< "${e}")"
+			done
+			__ebd_write_line "preload_eclass ${success}"
+			unset -v e x success
+			;;
+		set_eclass_paths\ *)
+			# eclass name to path mapping used to resolve inherits without
+			# requesting them from python
+			line=${com#set_eclass_paths }
+			__ebd_read_size "${line}" line
+			PKGCORE_ECLASS_PATHS=()
+			while read -r x e; do
+				[[ -n ${x} ]] && PKGCORE_ECLASS_PATHS[${x}]=${e}
+			done <<< "${line}"
+			unset -v e x
+			__ebd_write_line "eclass_paths_received"
+			;;
+		set_metadata_path\ *)
+			line=${com#set_metadata_path }
+			__ebd_read_size "${line}" PKGCORE_METADATA_PATH
+			__ebd_write_line "metadata_path_received"
+			;;
+		gen_metadata\ *|gen_ebuild_env\ *)
+			local __mode="depend"
+			local error_output
+			[[ ${com} == gen_ebuild_env* ]] && __mode="generate_env"
+			line=${com#* }
+			# capture sourcing stderr output
+			error_output=$(__ebd_process_metadata "${line}" "${__mode}" 2>&1 1>/dev/null)
+			if [[ $? -eq 0 ]]; then
+				__ebd_write_line "phases succeeded"
+			else
+				[[ -n ${error_output} ]] || error_output="ebd::${com% *} failed"
+				__ebd_write_line "phases failed ${error_output}"
+			fi
+			;;
+		alive)
+			__ebd_write_line "yep!"
+			;;
+		*)
+			die "unknown ebd com: '${com}'"
+			;;
+	esac
+}
+
 __ebd_main_loop() {
 	PKGCORE_BLACKLIST_VARS+=( __mode com is_depends phases line cont )
 	SANDBOX_ON=1
@@ -336,64 +405,23 @@ __ebd_main_loop() {
 		# exit.
 		__ebd_read_line_nonfatal com || com="shutdown_daemon"
 		case ${com} in
-			process_ebuild*)
-				# cleanse whitespace.
-				local phases=$(echo ${com#process_ebuild})
-				__ebd_process_ebuild_phases ${phases}
-				if [[ $? -eq 0 ]]; then
-					__ebd_write_line "phases succeeded"
-				else
-					__ebd_write_line "phases failed ebd::${com% *} failed"
-				fi
-				;;
 			shutdown_daemon)
 				break
 				;;
-			preload_eclass\ *)
-				success="succeeded"
-				com=${com#preload_eclass }
-				for e in ${com}; do
-					x=${e##*/}
-					x=${x%.eclass}
-					if ! $(type -P bash) -n "${e}"; then
-						echo "errors detected in '${e}'" >&2
-						success='failed'
-						break
-					fi
-					__make_preloaded_eclass_func "${x}" "$(< "${e}")"
-				done
-				__ebd_write_line "preload_eclass ${success}"
-				unset -v e x success
-				;;
 			clear_preloaded_eclasses)
-				unset -v PKGCORE_PRELOADED_ECLASSES
-				declare -A PKGCORE_PRELOADED_ECLASSES
+				PKGCORE_PRELOADED_ECLASSES=()
 				__ebd_write_line "clear_preloaded_eclasses succeeded"
 				;;
-			set_metadata_path\ *)
-				line=${com#set_metadata_path }
-				__ebd_read_size "${line}" PKGCORE_METADATA_PATH
-				__ebd_write_line "metadata_path_received"
-				;;
-			gen_metadata\ *|gen_ebuild_env\ *)
-				local __mode="depend"
-				local error_output
-				[[ ${com} == gen_ebuild_env* ]] && __mode="generate_env"
-				line=${com#* }
-				# capture sourcing stderr output
-				error_output=$(__ebd_process_metadata "${line}" "${__mode}" 2>&1 1>/dev/null)
-				if [[ $? -eq 0 ]]; then
-					__ebd_write_line "phases succeeded"
-				else
-					[[ -n ${error_output} ]] || error_output="ebd::${com% *} failed"
-					__ebd_write_line "phases failed ${error_output}"
-				fi
-				;;
-			alive)
-				__ebd_write_line "yep!"
+			request\ *)
+				# framed request, its replies are enclosed by reply lines tagged
+				# with the request ID allowing multiple requests to be queued
+				com=${com#request }
+				__ebd_write_line "reply ${com%% *}"
+				__ebd_process_command "${com#* }"
+				__ebd_write_line "reply_end ${com%% *}"
 				;;
 			*)
-				die "unknown ebd com: '${com}'"
+				__ebd_process_command "${com}"
 				;;
 		esac
 	done
@@ -2,21 +2,113 @@
 cache subsystem, typically used for storing package metadata
 """
 
-__all__ = ("base", "bulk")
+__all__ = (
+    "base", "bulk", "LazyEntry", "LazyKeyValueEntry", "CacheStats", "null_stats",
+)
 
 import math
 import operator
 import os
+import re
+import sys
+import threading
+import time
+from collections.abc import MutableMapping
+from contextlib import contextmanager, nullcontext
 from functools import partial
 
 from snakeoil import klass
-from snakeoil.chksum import get_handler
+from snakeoil.chksum import LazilyHashedPath, get_handler
 from snakeoil.mappings import ProtectedDict
+from snakeoil.osutils import pjoin
 
 from ..ebuild.const import metadata_keys
 from . import errors
 
 
+class CacheStats:
+    """Thread-safe counters and timings for metadata cache usage.
+
+    Counters:
+
+    - hits: entries found in a cache
+    - misses: lookups without a matching cache entry
+    - stale_chf: entries invalidated due to ebuild checksum mismatches
+    - stale_eclass: entries invalidated due to changed eclasses
+    - regens: metadata regenerations stored to the cache
+
+    Timings are wall-clock seconds per phase (cache lookup, entry
+    validation, bash sourcing, metadata parsing, and cache storage) summed
+    across threads, so they can exceed the total runtime of parallel runs.
+    """
+
+    counters = ('hits', 'misses', 'stale_chf', 'stale_eclass', 'regens')
+    phases = ('lookup', 'validate', 'regen', 'parse', 'store')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Zero all counters and timings."""
+        with self._lock:
+            self.counts = dict.fromkeys(self.counters, 0)
+            self.timings = dict.fromkeys(self.phases, 0.0)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+
+    @contextmanager
+    def timer(self, phase):
+        """Context manager adding the time spent in its block to a phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.timings[phase] += elapsed
+
+    def as_dict(self):
+        with self._lock:
+            return {'counts': dict(self.counts), 'timings': dict(self.timings)}
+
+    def summary(self):
+        """Return a list of human readable summary lines."""
+        counts = self.counts
+        stale = counts['stale_chf'] + counts['stale_eclass']
+        timings = ', '.join(f'{k} {v:.2f}s' for k, v in self.timings.items())
+        return [
+            f"cache stats: {counts['hits']} hits, {counts['misses']} misses, "
+            f"{stale} stale ({counts['stale_chf']} checksum, "
+            f"{counts['stale_eclass']} eclass), {counts['regens']} regenerations",
+            f"cache timings: {timings}",
+        ]
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        del d['_lock']
+        return d
+
+    def __setstate__(self, state):
+        self.__dict__ = state.copy()
+        self._lock = threading.Lock()
+
+
+class _NullStats:
+    """No-op stand-in used when stats collection is disabled."""
+
+    def count(self, name, amount=1):
+        pass
+
+    def timer(self, phase):
+        return nullcontext()
+
+
+null_stats = _NullStats()
+
+
 class base:
     # this is for metadata/cache transfer.
     # basically flags the cache needs be updated when transfered cache to cache.
@@ -27,6 +119,8 @@ class base:
         or queues up updates.
     :ivar cleanse_keys: Boolean controlling whether the template should drop
         empty keys for storing.
+    :ivar stats: :obj:`CacheStats` instance collecting usage stats, disabled
+        by default
     """
 
     autocommits = False
@@ -37,6 +131,7 @@ class base:
     eclass_splitter = '\t'
 
     default_keys = metadata_keys
+    stats = null_stats
 
     frozen = klass.alias_attr('readonly')
 
@@ -125,7 +220,13 @@ class base:
         handles it, they can override it.
         """
         self._sync_if_needed()
-        d = self._getitem(cpv)
+        with self.stats.timer('lookup'):
+            try:
+                d = self._getitem(cpv)
+            except KeyError:
+                self.stats.count('misses')
+                raise
+        self.stats.count('hits')
         if "_eclasses_" in d:
             d["_eclasses_"] = self.reconstruct_eclasses(cpv, d["_eclasses_"])
         return d
@@ -155,7 +256,11 @@ class base:
         elif "_eclasses_" in values:
             d["_eclasses_"] = self.deconstruct_eclasses(d["_eclasses_"])
 
-        d[self._chf_key] = self._chf_serializer(d.pop('_chf_'))
+        chf = d.pop('_chf_', None)
+        if chf is None:
+            # entry pulled from a cache using the same chf type, e.g. when cloning
+            chf = LazilyHashedPath(cpv, **{self.chf_type: d[self._chf_key]})
+        d[self._chf_key] = self._chf_serializer(chf)
         self._setitem(cpv, d)
         self._sync_if_needed(True)
 
@@ -215,14 +320,28 @@ class base:
             raise NotImplementedError
 
     def deconstruct_eclasses(self, eclass_dict):
-        """takes a dict, returns a string representing said dict"""
+        """takes a dict, returns a string representing said dict
+
+        The sequence form returned by :obj:`reconstruct_eclasses` is also
+        accepted, allowing entries to be transferred between caches.
+        """
         l = []
         converters = self.eclass_chf_serializers
+        if not hasattr(eclass_dict, 'items'):
+            eclass_dict = {
+                eclass: self._eclass_chf_obj(eclass, chfs)
+                for eclass, chfs in eclass_dict}
         for eclass, data in eclass_dict.items():
             l.append(eclass)
             l.extend(f(data) for f in converters)
         return self.eclass_splitter.join(l)
 
+    @staticmethod
+    def _eclass_chf_obj(eclass, chfs):
+        chfs = dict(chfs)
+        path = pjoin(chfs.get('eclassdir', ''), f'{eclass}.eclass')
+        return LazilyHashedPath(path, **chfs)
+
     def _deserialize_eclass_chfs(self, data):
         data = zip(self.eclass_chf_deserializers, data)
         for (chf, convert), item in data:
@@ -263,18 +382,21 @@ class base:
                 cpv, f'ValueError reading {eclass_string!r}') from e
 
     def validate_entry(self, cache_item, ebuild_hash_item, eclass_db):
-        chf_hash = cache_item.get(self._chf_key)
-        if (chf_hash is None or
-            chf_hash != getattr(ebuild_hash_item, self.chf_type, None)):
-            return False
-        eclass_data = cache_item.get('_eclasses_')
-        if eclass_data is None:
+        with self.stats.timer('validate'):
+            chf_hash = cache_item.get(self._chf_key)
+            if (chf_hash is None or
+                chf_hash != getattr(ebuild_hash_item, self.chf_type, None)):
+                self.stats.count('stale_chf')
+                return False
+            eclass_data = cache_item.get('_eclasses_')
+            if eclass_data is None:
+                return True
+            update = eclass_db.rebuild_cache_entry(eclass_data)
+            if update is None:
+                self.stats.count('stale_eclass')
+                return False
+            cache_item['_eclasses_'] = update
             return True
-        update = eclass_db.rebuild_cache_entry(eclass_data)
-        if update is None:
-            return False
-        cache_item['_eclasses_'] = update
-        return True
 
 
 class bulk(base):
@@ -315,3 +437,134 @@ class bulk(base):
         if self._pending_updates or force:
             self._write_data()
             self._pending_updates = []
+
+
+class LazyEntry(MutableMapping):
+    """Cache entry mapping that decodes raw values on first access.
+
+    Derivatives provide access to the raw, undecoded data via
+    :obj:`_raw_get` and :obj:`_raw_keys`; decoded values are cached and
+    overridden or deleted keys mask the raw data.
+
+    :param converters: mapping of key to callable used to deserialize the
+        raw value for that key
+    """
+
+    __slots__ = ('_data', '_masked', '_converters')
+
+    def __init__(self, converters=None):
+        self._data = {}
+        self._masked = set()
+        self._converters = converters if converters is not None else {}
+
+    def _raw_get(self, key):
+        """Return the raw value for a key, raising KeyError if it doesn't exist."""
+        raise NotImplementedError(self, '_raw_get')
+
+    def _raw_keys(self):
+        """Return an iterable of all keys in the raw data."""
+        raise NotImplementedError(self, '_raw_keys')
+
+    def _raw_contains(self, key):
+        try:
+            self._raw_get(key)
+        except KeyError:
+            return False
+        return True
+
+    def _raw_size(self):
+        """Return the approximate size of the raw data in bytes."""
+        return 0
+
+    def __sizeof__(self):
+        return (
+            object.__sizeof__(self) + sys.getsizeof(self._data) +
+            sum(sys.getsizeof(v) for v in self._data.values()) + self._raw_size())
+
+    def __getitem__(self, key):
+        try:
+            return self._data[key]
+        except KeyError:
+            if key in self._masked:
+                raise
+        val = self._raw_get(key)
+        convert = self._converters.get(key)
+        if convert is not None:
+            val = convert(val)
+        self._data[key] = val
+        self._masked.add(key)
+        return val
+
+    def __setitem__(self, key, val):
+        self._data[key] = val
+        self._masked.add(key)
+
+    def __delitem__(self, key):
+        if key in self._data:
+            del self._data[key]
+        elif key in self._masked:
+            raise KeyError(key)
+        else:
+            self._raw_get(key)
+            self._masked.add(key)
+
+    def __contains__(self, key):
+        if key in self._data:
+            return True
+        return key not in self._masked and self._raw_contains(key)
+
+    def __iter__(self):
+        yield from tuple(self._data)
+        masked = self._masked
+        yield from tuple(k for k in self._raw_keys() if k not in masked)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class LazyKeyValueEntry(LazyEntry):
+    """Lazily decoded entry backed by a buffer of newline separated key=value lines.
+
+    Values are located via substring search on access, avoiding splitting
+    the buffer and allocating strings for keys that are never used.
+
+    :param data: raw entry buffer
+    :param known_keys: container of keys allowed to be exposed
+    :raise ValueError: if the buffer contains lines lacking a key=value pair
+    """
+
+    __slots__ = ('_buffer', '_known_keys')
+
+    # lines without a separator, ignoring a trailing newline
+    _malformed_re = re.compile(r'^(?:[^=\n]*\n|[^=\n]+\Z)', re.M)
+
+    def __init__(self, data, known_keys, converters=None):
+        super().__init__(converters)
+        malformed = self._malformed_re.search(data)
+        if malformed is not None:
+            raise ValueError(f'malformed line: {malformed.group().rstrip()!r}')
+        # prefix a newline so every key is found via the same pattern
+        self._buffer = '\n' + data
+        self._known_keys = known_keys
+
+    def _raw_get(self, key):
+        if key not in self._known_keys:
+            raise KeyError(key)
+        buf = self._buffer
+        # later lines override earlier ones
+        start = buf.rfind(f'\n{key}=')
+        if start == -1:
+            raise KeyError(key)
+        start += len(key) + 2
+        end = buf.find('\n', start)
+        if end == -1:
+            end = len(buf)
+        return buf[start:end].strip()
+
+    def _raw_size(self):
+        return sys.getsizeof(self._buffer)
+
+    def _raw_keys(self):
+        known = self._known_keys
+        keys = (x.partition('=')[0] for x in self._buffer.split('\n'))
+        return {k: None for k in keys if k in known}
@@ -7,11 +7,10 @@ __all__ = ("database",)
 import os
 import stat
 
-from snakeoil.fileutils import readlines_utf8
 from snakeoil.osutils import pjoin
 
 from ..config.hint import ConfigHint
-from . import errors, fs_template
+from . import LazyKeyValueEntry, errors, fs_template
 
 
 class database(fs_template.FsBased):
@@ -32,28 +31,26 @@ class database(fs_template.FsBased):
     def _getitem(self, cpv):
         path = pjoin(self.location, cpv)
         try:
-            data = readlines_utf8(path, True, True, True)
-            if data is None:
-                raise KeyError(cpv)
-            return self._parse_data(data, data.mtime)
+            with open(path, 'r', encoding='utf8') as f:
+                data = f.read()
+                mtime = None
+                if self._mtime_used and not self.mtime_in_entry:
+                    mtime = os.fstat(f.fileno()).st_mtime
+            return self._parse_data(data, mtime)
+        except FileNotFoundError:
+            raise KeyError(cpv)
         except (EnvironmentError, ValueError) as e:
             raise errors.CacheCorruption(cpv, e) from e
 
     def _parse_data(self, data, mtime):
-        d = self._cdict_kls()
-        known = self._known_keys
-        for x in data:
-            k, v = x.split("=", 1)
-            if k in known:
-                d[k] = v
-
-        if self._mtime_used:
-            if self.mtime_in_entry:
-                d[self._chf_key] = self._chf_deserializer(d[self._chf_key])
-            else:
-                d[self._chf_key] = int(mtime)
+        """Return a lazily decoded entry for the raw key=value buffer."""
+        d = LazyKeyValueEntry(
+            data, self._known_keys, {self._chf_key: self._chf_deserializer})
+        if self._mtime_used and not self.mtime_in_entry:
+            d[self._chf_key] = int(mtime)
         else:
-            d[self._chf_key] = self._chf_deserializer(d[self._chf_key])
+            # decode the chf eagerly so corrupt values are caught on load
+            d[self._chf_key]
         return d
 
     def _setitem(self, cpv, values):
@@ -120,7 +117,8 @@ class database(fs_template.FsBased):
             except EnvironmentError as e:
                 raise KeyError(cpv, f"access failure: {e}")
             for l in os.listdir(d):
-                if l.endswith(".cpickle"):
+                # skip hidden files, e.g. in progress updates and indexes
+                if l.endswith(".cpickle") or l.startswith("."):
                     continue
                 p = pjoin(d, l)
                 try:
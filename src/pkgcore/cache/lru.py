@@ -0,0 +1,187 @@
+"""
+in memory, size bounded LRU cache layered over another cache backend
+"""
+
+__all__ = ("database",)
+
+import sys
+import threading
+from collections import OrderedDict
+
+from snakeoil import klass
+
+from ..config.hint import ConfigHint
+from . import LazyEntry, base, errors
+
+
+class _EntryView(LazyEntry):
+    """Copy-on-write view of an entry kept in memory.
+
+    Modifications, e.g. eclass data updates during validation, only affect
+    the view so the kept entry stays in the form returned by the backend.
+    """
+
+    __slots__ = ('_entry',)
+
+    def __init__(self, entry):
+        super().__init__()
+        self._entry = entry
+
+    def _raw_get(self, key):
+        return self._entry[key]
+
+    def _raw_contains(self, key):
+        return key in self._entry
+
+    def _raw_keys(self):
+        return self._entry.keys()
+
+
+def _entry_size(entry):
+    """Return the approximate memory usage of a cache entry in bytes."""
+    size = sys.getsizeof(entry)
+    if not isinstance(entry, LazyEntry):
+        size += sum(sys.getsizeof(v) for v in entry.values())
+    return size
+
+
+class database(base):
+    """Keep recently used entries of another cache in memory.
+
+    Decoded entries read from the wrapped cache are kept until either the
+    entry or byte budget is exceeded, at which point the least recently used
+    ones are evicted. Updates and deletions are passed through to the
+    wrapped cache, invalidating the kept entry.
+
+    Entry sizes are estimated when they're first kept, values decoded
+    afterwards aren't accounted for.
+    """
+
+    pkgcore_config_type = ConfigHint(
+        {'cache': 'ref:cache', 'max_entries': 'int', 'max_bytes': 'int'},
+        required=['cache'],
+        positional=['cache'],
+        typename='cache')
+
+    readonly = klass.alias_attr('backend.readonly')
+    autocommits = klass.alias_attr('backend.autocommits')
+    chf_type = klass.alias_attr('backend.chf_type')
+    eclass_chf_types = klass.alias_attr('backend.eclass_chf_types')
+    location = klass.alias_attr('backend.location')
+
+    def __init__(self, cache, max_entries=10000, max_bytes=None):
+        """
+        :param cache: cache instance to wrap
+        :param max_entries: maximum number of entries to keep in memory
+        :param max_bytes: maximum estimated memory usage in bytes
+        """
+        # Note the base initializer isn't used since all storage related
+        # state is handled by the wrapped cache.
+        if max_entries is None and max_bytes is None:
+            raise errors.InitializationError(
+                self.__class__, 'either max_entries or max_bytes must be set')
+        self.backend = cache
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        # bumped on invalidation to avoid keeping entries read before updates
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self):
+        return self.backend.stats
+
+    @stats.setter
+    def stats(self, value):
+        self.backend.stats = value
+
+    @property
+    def sync_rate(self):
+        return self.backend.sync_rate
+
+    def set_sync_rate(self, rate=0):
+        self.backend.set_sync_rate(rate)
+
+    @property
+    def kept(self):
+        """Number of entries kept in memory."""
+        return len(self._entries)
+
+    @property
+    def size(self):
+        """Estimated memory usage of the kept entries in bytes."""
+        return self._size
+
+    def __getitem__(self, cpv):
+        with self._lock:
+            kept = self._entries.get(cpv)
+            if kept is not None:
+                self._entries.move_to_end(cpv)
+            generation = self._generation
+        if kept is not None:
+            self.stats.count('hits')
+            return _EntryView(kept[0])
+
+        entry = self.backend[cpv]
+        size = _entry_size(entry) if self.max_bytes is not None else 0
+        with self._lock:
+            if generation == self._generation:
+                self._keep(cpv, entry, size)
+        return _EntryView(entry)
+
+    def _keep(self, cpv, entry, size):
+        old = self._entries.pop(cpv, None)
+        if old is not None:
+            self._size -= old[1]
+        self._entries[cpv] = (entry, size)
+        self._size += size
+        while self._entries and (
+                (self.max_entries is not None and len(self._entries) > self.max_entries) or
+                (self.max_bytes is not None and self._size > self.max_bytes)):
+            _cpv, (_entry, size) = self._entries.popitem(last=False)
+            self._size -= size
+
+    def invalidate(self, cpv=None):
+        """Drop a kept entry, or all of them if no cpv is given."""
+        with self._lock:
+            self._generation += 1
+            if cpv is None:
+                self._entries.clear()
+                self._size = 0
+            else:
+                old = self._entries.pop(cpv, None)
+                if old is not None:
+                    self._size -= old[1]
+
+    def __setitem__(self, cpv, values):
+        self.invalidate(cpv)
+        self.backend[cpv] = values
+
+    def __delitem__(self, cpv):
+        self.invalidate(cpv)
+        del self.backend[cpv]
+
+    def __contains__(self, cpv):
+        return cpv in self._entries or cpv in self.backend
+
+    def keys(self):
+        return self.backend.keys()
+
+    def validate_entry(self, cache_item, ebuild_hash_item, eclass_db):
+        return self.backend.validate_entry(cache_item, ebuild_hash_item, eclass_db)
+
+    def commit(self, force=False):
+        self.backend.commit(force=force)
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        del d['_lock']
+        d['_entries'] = OrderedDict()
+        d['_size'] = 0
+        return d
+
+    def __setstate__(self, state):
+        self.__dict__ = state.copy()
+        self._lock = threading.Lock()
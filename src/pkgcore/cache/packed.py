@@ -0,0 +1,289 @@
+"""
+memory mapped, packed single file backend
+
+The on disk format is a header, a table of the metadata keys in use, a cpv
+index sorted by cpv, per entry field tables, and a deduplicated string pool.
+Readers mmap the file and only decode the values that are actually accessed,
+allowing multiple processes to share the same page cache pages.
+
+Since every flush rewrites the whole file, the format is intended to be
+generated in bulk from an existing cache, e.g. via pclonecache.
+"""
+
+__all__ = ("database",)
+
+import mmap
+import struct
+import sys
+
+from snakeoil import klass
+from snakeoil.fileutils import AtomicWriteFile
+from snakeoil.osutils import pjoin
+
+from ..config.hint import ConfigHint
+from . import LazyEntry, errors, fs_template
+
+_MAGIC = b'PKGCPACK'
+_VERSION = 1
+
+# magic, version, key count, entry count, string pool offset
+_header = struct.Struct('<8sHHII')
+_key_len = struct.Struct('<H')
+# cpv pool offset, cpv length, entry offset
+_index_entry = struct.Struct('<III')
+_field_count = struct.Struct('<H')
+# key index, value pool offset, value length
+_field = struct.Struct('<HII')
+
+
+class _PackedFile:
+    """Read-only view of a packed cache file."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, nkeys, self._count, self._pool = \
+                _header.unpack_from(self._mm)
+        except struct.error:
+            magic = version = None
+        if magic != _MAGIC or version != _VERSION:
+            self.close()
+            raise errors.GeneralCacheCorruption(
+                f'invalid packed cache file: {path!r}')
+
+        keys = []
+        offset = _header.size
+        for _ in range(nkeys):
+            (length,) = _key_len.unpack_from(self._mm, offset)
+            offset += _key_len.size
+            keys.append(self._mm[offset:offset + length].decode())
+            offset += length
+        self.keys = tuple(keys)
+        self._index = offset
+
+    def close(self):
+        self._mm.close()
+
+    def __len__(self):
+        return self._count
+
+    def string(self, offset, length):
+        offset += self._pool
+        return self._mm[offset:offset + length].decode()
+
+    def _cpv(self, i):
+        offset, length, _ = _index_entry.unpack_from(
+            self._mm, self._index + i * _index_entry.size)
+        offset += self._pool
+        return self._mm[offset:offset + length]
+
+    def find(self, cpv):
+        """Return the field table for a cpv, or None if it doesn't exist."""
+        cpv = cpv.encode()
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._cpv(mid) < cpv:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self._count or self._cpv(lo) != cpv:
+            return None
+        _, _, offset = _index_entry.unpack_from(
+            self._mm, self._index + lo * _index_entry.size)
+        return self._fields(offset)
+
+    def _fields(self, offset):
+        (count,) = _field_count.unpack_from(self._mm, offset)
+        offset += _field_count.size
+        keys = self.keys
+        d = {}
+        for _ in range(count):
+            key, val_offset, val_len = _field.unpack_from(self._mm, offset)
+            d[keys[key]] = (val_offset, val_len)
+            offset += _field.size
+        return d
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self._cpv(i).decode()
+
+    @staticmethod
+    def write(f, entries):
+        """Serialize a mapping of cpv to key/value mappings to a file object."""
+        keys = sorted({k for d in entries.values() for k in d})
+        key_idx = {k: i for i, k in enumerate(keys)}
+        pool = bytearray()
+        pool_offsets = {}
+
+        def intern_str(s):
+            s = s.encode()
+            offset = pool_offsets.get(s)
+            if offset is None:
+                offset = pool_offsets[s] = len(pool)
+                pool.extend(s)
+            return offset, len(s)
+
+        key_table = b''.join(
+            _key_len.pack(len(k)) + k for k in (x.encode() for x in keys))
+        cpvs = sorted(entries, key=str.encode)
+        entry_offset = _header.size + len(key_table) + len(cpvs) * _index_entry.size
+        index = []
+        blobs = []
+        for cpv in cpvs:
+            index.append(_index_entry.pack(*intern_str(cpv), entry_offset))
+            values = sorted(entries[cpv].items())
+            blob = _field_count.pack(len(values)) + b''.join(
+                _field.pack(key_idx[k], *intern_str(str(v))) for k, v in values)
+            blobs.append(blob)
+            entry_offset += len(blob)
+
+        f.write(_header.pack(_MAGIC, _VERSION, len(keys), len(cpvs), entry_offset))
+        f.write(key_table)
+        f.write(b''.join(index))
+        f.write(b''.join(blobs))
+        f.write(pool)
+
+
+class _PackedEntry(LazyEntry):
+    """Cache entry decoding values from the packed file on first access."""
+
+    __slots__ = ('_packed', '_raw')
+
+    def __init__(self, packed, raw, converters):
+        super().__init__(converters)
+        self._packed = packed
+        self._raw = raw
+
+    def _raw_get(self, key):
+        return self._packed.string(*self._raw[key])
+
+    def _raw_contains(self, key):
+        return key in self._raw
+
+    def _raw_keys(self):
+        return self._raw
+
+    def _raw_size(self):
+        # values themselves are backed by the shared mapping
+        return sys.getsizeof(self._raw)
+
+
+class database(fs_template.FsBased):
+    """Stores all cache entries in a single memory mapped file.
+
+    Lookups are done via binary search over the sorted cpv index and only
+    the values that are accessed get decoded. Updates are queued in memory
+    and the file is regenerated on commit.
+    """
+
+    pkgcore_config_type = ConfigHint(
+        {'readonly': 'bool', 'location': 'str', 'label': 'str',
+         'auxdbkeys': 'list'},
+        required=['location'],
+        positional=['location'],
+        typename='cache')
+
+    autocommits = False
+    # every flush rewrites the entire file, so only do it on explicit commits
+    default_sync_rate = sys.maxsize
+    chf_type = 'md5'
+    eclass_chf_types = ('md5',)
+    filename = 'metadata.packed'
+
+    def __init__(self, *args, **config):
+        super().__init__(*args, **config)
+        self._path = pjoin(self.location, self.filename)
+        self._pending = {}
+
+    @klass.jit_attr
+    def packed(self):
+        try:
+            return _PackedFile(self._path)
+        except FileNotFoundError:
+            return None
+        except (EnvironmentError, ValueError) as e:
+            raise errors.GeneralCacheCorruption(e) from e
+
+    def _getitem(self, cpv):
+        if cpv in self._pending:
+            values = self._pending[cpv]
+            if values is None:
+                raise KeyError(cpv)
+            d = self._cdict_kls(values)
+            d[self._chf_key] = self._chf_deserializer(d[self._chf_key])
+            return d
+        packed = self.packed
+        raw = packed.find(cpv) if packed is not None else None
+        if raw is None:
+            raise KeyError(cpv)
+        known = self._known_keys
+        raw = {k: v for k, v in raw.items() if k in known}
+        if self._chf_key not in raw:
+            raise errors.CacheCorruption(cpv, f'missing {self._chf_key} key')
+        d = _PackedEntry(packed, raw, {self._chf_key: self._chf_deserializer})
+        try:
+            # decode the chf eagerly so corrupt values are caught on load
+            d[self._chf_key]
+        except ValueError as e:
+            raise errors.CacheCorruption(cpv, e) from e
+        return d
+
+    def _setitem(self, cpv, values):
+        self._pending[cpv] = dict(values.items())
+
+    def _delitem(self, cpv):
+        if cpv not in self:
+            raise KeyError(cpv)
+        self._pending[cpv] = None
+
+    def __contains__(self, cpv):
+        if cpv in self._pending:
+            return self._pending[cpv] is not None
+        packed = self.packed
+        return packed is not None and packed.find(cpv) is not None
+
+    def keys(self):
+        packed = self.packed
+        existing = iter(packed) if packed is not None else ()
+        pending = self._pending
+        for cpv in existing:
+            if cpv not in pending:
+                yield cpv
+        yield from tuple(k for k, v in pending.items() if v is not None)
+
+    def commit(self, force=False):
+        if not self._pending and not force:
+            return
+        if self.readonly:
+            raise errors.ReadOnly()
+
+        entries = {}
+        packed = self.packed
+        if packed is not None:
+            for cpv in packed:
+                if cpv not in self._pending:
+                    entries[cpv] = {
+                        k: packed.string(*v) for k, v in packed.find(cpv).items()}
+        entries.update((k, v) for k, v in self._pending.items() if v is not None)
+
+        if not self._ensure_dirs():
+            raise errors.GeneralCacheCorruption(
+                f'failed creating cache dir: {self.location!r}')
+        try:
+            with AtomicWriteFile(self._path, binary=True) as f:
+                _PackedFile.write(f, entries)
+        except EnvironmentError as e:
+            raise errors.GeneralCacheCorruption(e) from e
+        self._ensure_access(self._path)
+
+        # force remapping; existing entries may still reference the old
+        # mapping so leave it to be closed when it's garbage collected
+        self.__dict__.pop('_packed', None)
+        self._pending = {}
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        d.pop('_packed', None)
+        return d
@@ -0,0 +1,168 @@
+"""
+single file sqlite based backend
+"""
+
+__all__ = ("database",)
+
+import os
+import sqlite3
+import threading
+
+from snakeoil import klass
+from snakeoil.osutils import pjoin
+
+from ..config.hint import ConfigHint
+from . import LazyKeyValueEntry, errors, fs_template
+
+
+class database(fs_template.FsBased):
+    """Stores all cache entries in a single, cpv indexed sqlite database.
+
+    Each entry is stored using the same serialized key=value form as
+    :obj:`pkgcore.cache.flat_hash.database`, thus validation semantics are
+    identical; the difference is that lookups don't require a file open per
+    entry and updates are batched into transactions based on the sync rate.
+    By default each update is committed as it's made; bulk operations such
+    as regen raise the sync rate and commit once they're finished. Updates
+    that haven't been committed when the cache is closed via :obj:`close`
+    are committed, otherwise they're rolled back.
+    """
+
+    pkgcore_config_type = ConfigHint(
+        {'readonly': 'bool', 'location': 'str', 'label': 'str',
+         'auxdbkeys': 'list'},
+        required=['location'],
+        positional=['location'],
+        typename='cache')
+
+    autocommits = False
+    eclass_chf_types = ('eclassdir', 'mtime')
+    filename = 'metadata.sqlite'
+    schema_version = 1
+
+    def __init__(self, *args, **config):
+        super().__init__(*args, **config)
+        self._db_path = pjoin(self.location, self.filename)
+        # connections are shared between regen threads, serialize access
+        self._lock = threading.RLock()
+
+    @klass.jit_attr
+    def connection(self):
+        if self.readonly:
+            if not os.path.exists(self._db_path):
+                return None
+            uri = f'file:{self._db_path}?mode=ro'
+            try:
+                return sqlite3.connect(uri, uri=True, check_same_thread=False)
+            except sqlite3.Error as e:
+                raise errors.InitializationError(self.__class__, e) from e
+
+        if not self._ensure_dirs():
+            raise errors.InitializationError(
+                self.__class__, f'failed creating cache dir: {self.location!r}')
+        try:
+            db = sqlite3.connect(self._db_path, check_same_thread=False)
+            version = db.execute('PRAGMA user_version').fetchone()[0]
+            if version not in (0, self.schema_version):
+                db.close()
+                raise errors.InitializationError(
+                    self.__class__, f'unsupported schema version: {version}')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS metadata '
+                '(cpv TEXT PRIMARY KEY NOT NULL, data TEXT NOT NULL)')
+            db.execute(f'PRAGMA user_version = {self.schema_version}')
+            db.commit()
+        except sqlite3.Error as e:
+            raise errors.InitializationError(self.__class__, e) from e
+        self._ensure_access(self._db_path)
+        return db
+
+    def _execute(self, cpv, query, *args):
+        try:
+            return self.connection.execute(query, args)
+        except sqlite3.Error as e:
+            raise errors.CacheCorruption(cpv, e) from e
+
+    def _getitem(self, cpv):
+        with self._lock:
+            if self.connection is None:
+                raise KeyError(cpv)
+            row = self._execute(
+                cpv, 'SELECT data FROM metadata WHERE cpv = ?', cpv).fetchone()
+        if row is None:
+            raise KeyError(cpv)
+        try:
+            d = LazyKeyValueEntry(
+                row[0], self._known_keys, {self._chf_key: self._chf_deserializer})
+            # decode the chf eagerly so corrupt values are caught on load
+            d[self._chf_key]
+        except ValueError as e:
+            raise errors.CacheCorruption(cpv, e) from e
+        return d
+
+    def _setitem(self, cpv, values):
+        data = '\n'.join(f'{k}={v}' for k, v in sorted(values.items()))
+        with self._lock:
+            self._execute(
+                cpv, 'INSERT OR REPLACE INTO metadata (cpv, data) VALUES (?, ?)',
+                cpv, data)
+
+    def _delitem(self, cpv):
+        with self._lock:
+            cursor = self._execute(
+                cpv, 'DELETE FROM metadata WHERE cpv = ?', cpv)
+        if not cursor.rowcount:
+            raise KeyError(cpv)
+
+    def __contains__(self, cpv):
+        with self._lock:
+            if self.connection is None:
+                return False
+            row = self._execute(
+                cpv, 'SELECT 1 FROM metadata WHERE cpv = ?', cpv).fetchone()
+        return row is not None
+
+    def keys(self):
+        with self._lock:
+            if self.connection is None:
+                return iter(())
+            # collapse results so callers can mutate the db while iterating
+            rows = self._execute(None, 'SELECT cpv FROM metadata').fetchall()
+        return (row[0] for row in rows)
+
+    def commit(self, force=False):
+        with self._lock:
+            if self.readonly or self.connection is None:
+                return
+            try:
+                self.connection.commit()
+            except sqlite3.Error as e:
+                raise errors.GeneralCacheCorruption(e) from e
+
+    def sync(self):
+        """Commit all pending updates."""
+        self.commit(force=True)
+
+    def close(self):
+        """Commit all pending updates and close the database connection."""
+        with self._lock:
+            connection = self.__dict__.pop('_connection', None)
+            if connection is None:
+                return
+            try:
+                if not self.readonly:
+                    connection.commit()
+            except sqlite3.Error as e:
+                raise errors.GeneralCacheCorruption(e) from e
+            finally:
+                connection.close()
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        d.pop('_lock', None)
+        d.pop('_connection', None)
+        return d
+
+    def __setstate__(self, state):
+        self.__dict__ = state.copy()
+        self._lock = threading.RLock()
@@ -5,6 +5,7 @@ package class for buildable ebuilds
 __all__ = ("base", "package", "package_factory")
 
 import os
+from concurrent.futures import wait
 from functools import partial
 from itertools import chain
 from sys import intern
@@ -15,11 +16,13 @@ from snakeoil.mappings import OrderedFrozenSet
 
 from .. import fetch
 from ..cache import errors as cache_errors
+from ..cache import null_stats
 from ..log import logger
 from ..package import errors as metadata_errors
 from ..package import metadata
 from ..package.base import DynamicGetattrSetter
 from ..restrictions import boolean, values
+from ..util.thread_pool import map_async
 from . import conditionals
 from . import errors as ebuild_errors
 from . import processor
@@ -393,11 +396,25 @@ class package_factory(metadata.factory):
     # For the plugin system.
     priority = 5
 
+    # optional eclass_cache.ConsumerIndex recording the eclasses inherited by
+    # each package as its metadata is validated or regenerated
+    eclass_index = None
+
+    # cache.CacheStats instance collecting regen stats
+    stats = null_stats
+
+    # max number of primed or prefetching metadata entries awaiting use,
+    # further ones aren't kept until earlier ones are consumed or cleared
+    prime_limit = 1000
+
     def __init__(self, parent, cachedb, eclass_cache, mirrors, default_mirrors,
                  *args, **kwargs):
         super().__init__(parent, *args, **kwargs)
         self._cache = cachedb
         self._ecache = eclass_cache
+        self._primed = {}
+        # cpv -> future of pending metadata prefetches
+        self._prefetching = {}
 
         if mirrors:
             mirrors = {k: fetch.mirror(v, k) for k, v in mirrors.items()}
@@ -418,15 +435,29 @@ class package_factory(metadata.factory):
         return os.stat(self._get_ebuild_path(pkg)).st_mtime
 
     def _get_metadata(self, pkg, ebp=None, force_regen=False):
-        caches = self._cache
-        if force_regen:
-            caches = ()
+        if not force_regen:
+            future = self._prefetching.pop(pkg.cpvstr, None)
+            if future is not None and not future.cancel():
+                # already in progress, wait for it instead of loading it twice
+                wait((future,))
+            data = self._primed.pop(pkg.cpvstr, None)
+            if data is None:
+                data = self._get_cached_metadata(pkg)
+            if data is not None:
+                return data
+
+        # no cache entries, regen
+        return self._update_metadata(pkg, ebp=ebp)
+
+    def _get_cached_metadata(self, pkg):
+        """Return the first valid cache entry for a package, None otherwise."""
         ebuild_hash = chksum.LazilyHashedPath(pkg.path)
-        for cache in caches:
+        for cache in self._cache:
             if cache is not None:
                 try:
                     data = cache[pkg.cpvstr]
                     if cache.validate_entry(data, ebuild_hash, self._ecache):
+                        self._index_eclasses(pkg, data)
                         return data
                     if not cache.readonly:
                         del cache[pkg.cpvstr]
@@ -436,22 +467,150 @@ class package_factory(metadata.factory):
                     logger.warning("caught cache error: %s", e)
                     del e
                     continue
-
-        # no cache entries, regen
-        return self._update_metadata(pkg, ebp=ebp)
+        return None
+
+    def _index_eclasses(self, pkg, data):
+        if self.eclass_index is not None:
+            self.eclass_index.update(pkg.cpvstr, data.get('_eclasses_', {}))
+
+    def validate_metadata(self, pkgs, threads=None, prime=False):
+        """Validate the cache entries for multiple packages in bulk.
+
+        Ebuild checksums are computed and cache entries are pulled in a
+        thread pool while each distinct set of inherited eclasses is only
+        checked once by the eclass cache.
+
+        :param pkgs: sequence of packages to validate
+        :param threads: number of threads to use, defaults to the number of CPUs
+        :param prime: store the valid entries so they're used for the next
+            metadata request for each package instead of hitting the cache
+            again, up to :obj:`prime_limit` entries in the given package order
+        :return: mapping of package cpv strings to their valid cache entries,
+            packages without valid entries are omitted
+        """
+        valid = {}
+
+        def _validate(pkgs):
+            for pkg in pkgs:
+                data = self._get_cached_metadata(pkg)
+                if data is not None:
+                    valid[pkg.cpvstr] = data
+
+        map_async(pkgs, _validate, threads=threads)
+        if prime:
+            for pkg in pkgs:
+                data = valid.get(pkg.cpvstr)
+                if data is not None and not self._prime(pkg.cpvstr, data):
+                    break
+        return valid
+
+    def _prime(self, cpvstr, data):
+        """Keep metadata for the next request of a package if there's room.
+
+        :return: True if the metadata was kept, False otherwise
+        """
+        if len(self._primed) >= self.prime_limit:
+            return False
+        self._primed[cpvstr] = data
+        return True
+
+    def clear_primed(self):
+        """Drop primed metadata entries that haven't been used.
+
+        Pending prefetches should be finished or cancelled beforehand.
+        """
+        self._primed.clear()
+        self._prefetching.clear()
+
+    def prefetch_metadata(self, pkgs, executor):
+        """Load the metadata for packages in the background.
+
+        Metadata is pulled from the cache or regenerated in the given
+        executor and primed for the next metadata request of each package,
+        which waits for the prefetch if it's still running. Packages with
+        loaded or pending metadata are skipped, as are all remaining ones
+        once :obj:`prime_limit` entries are awaiting use.
+
+        :param pkgs: iterable of packages
+        :param executor: :obj:`concurrent.futures.Executor` instance
+        :return: list of futures for the submitted packages
+        """
+        futures = []
+        for pkg in pkgs:
+            if len(self._primed) + len(self._prefetching) >= self.prime_limit:
+                break
+            cpvstr = pkg.cpvstr
+            if cpvstr in self._prefetching or cpvstr in self._primed:
+                continue
+            try:
+                # avoid triggering a metadata load
+                object.__getattribute__(pkg, 'data')
+                continue
+            except AttributeError:
+                pass
+            future = self._prefetching[cpvstr] = executor.submit(self._prefetch, pkg)
+            future.add_done_callback(partial(self._prefetched, cpvstr))
+            futures.append(future)
+        return futures
+
+    def _prefetched(self, cpvstr, future):
+        # finished prefetches are tracked via their primed entry
+        if self._prefetching.get(cpvstr) is future:
+            self._prefetching.pop(cpvstr, None)
+
+    def _prefetch(self, pkg):
+        data = self._get_cached_metadata(pkg)
+        if data is None:
+            data = self._update_metadata(pkg)
+        self._prime(pkg.cpvstr, data)
 
     def _update_metadata(self, pkg, ebp=None):
         parsed_eapi = pkg.eapi
         if not parsed_eapi.is_supported:
             return {'EAPI': str(parsed_eapi)}
 
-        with processor.reuse_or_request(ebp) as my_proc:
+        mydata = self._generate_metadata(pkg, ebp=ebp)
+        self._store_metadata(pkg, mydata)
+        return mydata
+
+    def _generate_metadata(self, pkg, ebp=None):
+        """Source a package's ebuild, returning its metadata."""
+        parsed_eapi = pkg.eapi
+        with self.stats.timer('regen'), processor.reuse_or_request(ebp) as my_proc:
             try:
                 mydata = my_proc.get_keys(pkg, self._ecache)
             except processor.ProcessorError as e:
                 raise metadata_errors.MetadataException(
                     pkg, 'data', 'failed sourcing ebuild', e)
+        with self.stats.timer('parse'):
+            return self._parse_metadata(pkg, parsed_eapi, mydata)
+
+    def _submit_metadata(self, pkg, ebp):
+        """Queue sourcing a package's ebuild on a processor.
+
+        The metadata is stored and returned by :obj:`_complete_metadata`.
+        """
+        return ebp.submit_get_keys(pkg)
 
+    def _complete_metadata(self, pkg, ebp, request):
+        """Wait for a queued ebuild sourcing request, storing its metadata.
+
+        :return: tuple of the metadata and the names of the inherited eclasses
+        """
+        with self.stats.timer('regen'):
+            try:
+                mydata = ebp.complete(request)
+            except processor.ProcessorError as e:
+                raise metadata_errors.MetadataException(
+                    pkg, 'data', 'failed sourcing ebuild', e)
+        inherited = mydata.get('INHERITED', '').split()
+        with self.stats.timer('parse'):
+            mydata = self._parse_metadata(pkg, pkg.eapi, mydata)
+        self._store_metadata(pkg, mydata)
+        return mydata, inherited
+
+    def _parse_metadata(self, pkg, parsed_eapi, mydata):
+        """Convert raw sourced metadata into its cache form."""
         # Rewrite defined_phases as needed, since we now know the EAPI.
         eapi = get_eapi(mydata.get('EAPI', '0'))
         if parsed_eapi != eapi:
@@ -476,19 +635,24 @@ class package_factory(metadata.factory):
 
         for x in wipes:
             del mydata[x]
+        return mydata
 
-        if self._cache is not None:
-            for cache in self._cache:
-                if not cache.readonly:
-                    try:
-                        cache[pkg.cpvstr] = mydata
-                    except cache_errors.CacheError as e:
-                        logger.warning("caught cache error: %s", e)
-                        del e
-                        continue
-                    break
+    def _store_metadata(self, pkg, mydata):
+        """Store generated metadata in the first writable cache."""
+        self._index_eclasses(pkg, mydata)
+        self.stats.count('regens')
 
-        return mydata
+        if self._cache is not None:
+            with self.stats.timer('store'):
+                for cache in self._cache:
+                    if not cache.readonly:
+                        try:
+                            cache[pkg.cpvstr] = mydata
+                        except cache_errors.CacheError as e:
+                            logger.warning("caught cache error: %s", e)
+                            del e
+                            continue
+                        break
 
     def new_package(self, *args):
         inst = self._cached_instances.get(args)
@@ -2,19 +2,24 @@
 in memory representation of on disk eclass stacking order
 """
 
-__all__ = ("base", "cache", "StackedCaches")
+__all__ = ("base", "cache", "StackedCaches", "ConsumerIndex")
 
+import json
 import os
+import threading
+from collections import defaultdict
 from sys import intern
 
 from snakeoil.chksum import LazilyHashedPath
 from snakeoil.data_source import local_source
+from snakeoil.fileutils import AtomicWriteFile
 from snakeoil.klass import jit_attr_ext_method
 from snakeoil.mappings import ImmutableDict, OrderedFrozenSet, StackedDict
 from snakeoil.osutils import listdir_files, normpath, pjoin
 from snakeoil.weakrefs import WeakValCache
 
 from ..config.hint import ConfigHint
+from ..log import logger
 
 
 class base:
@@ -24,6 +29,7 @@ class base:
 
     def __init__(self, location=None, eclassdir=None):
         self._eclass_data_inst_cache = WeakValCache()
+        self._rebuild_cache = (None, {})
         # generate this.
         # self.eclasses = {} # {"Name": ("location", "_mtime_")}
         self.location = location
@@ -59,28 +65,47 @@ class base:
         Given a dict as returned by get_eclass_data, walk it comparing
         it to internal eclass view.
 
-        :return: a boolean representing whether that eclass data is still
-            up to date, or not
+        Results are memoized per distinct set of eclass data so entries
+        inheriting the same eclasses are only checked once.
+
+        :return: the up to date eclass data mapping if still valid, otherwise None
         """
         ec = self.eclasses
-        d = {}
+        src, results = self._rebuild_cache
+        if src is not ec:
+            # eclasses were reloaded, drop stale results
+            results = {}
+            self._rebuild_cache = (ec, results)
+
+        key = tuple((eclass, tuple(chksums)) for eclass, chksums in entry_eclasses)
+        try:
+            return results[key]
+        except KeyError:
+            pass
 
-        for eclass, chksums in entry_eclasses:
+        d = {}
+        for eclass, chksums in key:
             data = ec.get(eclass)
             if any(val != getattr(data, chf, None) for chf, val in chksums):
-                return None
+                d = None
+                break
             d[eclass] = data
+        else:
+            d = ImmutableDict(d)
 
+        results[key] = d
         return d
 
     def __getstate__(self):
         d = self.__dict__.copy()
         del d['_eclass_data_inst_cache']
+        del d['_rebuild_cache']
         return d
 
     def __setstate__(self, state):
         self.__dict__ = state.copy()
         self.__dict__['_eclass_data_inst_cache'] = WeakValCache()
+        self.__dict__['_rebuild_cache'] = (None, {})
 
 
 class cache(base):
@@ -142,3 +167,137 @@ class StackedCaches(base):
 
     def _load_eclasses(self):
         return StackedDict(*[ec.eclasses for ec in self._caches])
+
+
+class ConsumerIndex:
+    """Persistent index mapping eclasses to the cpvs inheriting them.
+
+    The index is populated from the eclass data of metadata cache entries
+    and records the checksums of each eclass at the time, allowing the
+    consumers of eclasses changed since then to be determined without
+    walking the entire repo.
+
+    The VCS commit the repo was at when the index was last fully synced with
+    it can be recorded via the :attr:`commit` attribute.
+    """
+
+    version = 1
+
+    def __init__(self, path, chf_types=('eclassdir', 'mtime')):
+        """
+        :param path: file path the index is stored at
+        :param chf_types: eclass checksum types recorded for change detection
+        """
+        self.path = path
+        self.chf_types = tuple(chf_types)
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Drop all indexed data."""
+        self.commit = None
+        self._inherits = {}
+        self._consumers = defaultdict(set)
+        self._chfs = {}
+
+    def __len__(self):
+        return len(self._inherits)
+
+    def __contains__(self, cpv):
+        return cpv in self._inherits
+
+    def load(self):
+        """Load the index from disk.
+
+        :return: True if the index was loaded, False if it's missing, invalid,
+            or was generated using different checksum types
+        """
+        self.clear()
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (EnvironmentError, ValueError) as e:
+            logger.warning("failed loading eclass index %r: %s", self.path, e)
+            return False
+        if (data.get('version') != self.version or
+                tuple(data.get('chf_types', ())) != self.chf_types):
+            return False
+        self.commit = data.get('commit')
+        self._chfs = {k: tuple(v) for k, v in data['eclasses'].items()}
+        for cpv, eclasses in data['packages'].items():
+            self._add(cpv, eclasses)
+        return True
+
+    def write(self):
+        """Atomically write the index to disk."""
+        data = {
+            'version': self.version,
+            'chf_types': self.chf_types,
+            'commit': self.commit,
+            'eclasses': {k: v for k, v in self._chfs.items() if k in self._consumers},
+            'packages': {k: list(v) for k, v in self._inherits.items()},
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with AtomicWriteFile(self.path) as f:
+            json.dump(data, f, sort_keys=True)
+
+    def _add(self, cpv, eclasses):
+        eclasses = tuple(map(intern, eclasses))
+        self._inherits[cpv] = eclasses
+        for eclass in eclasses:
+            self._consumers[eclass].add(cpv)
+
+    def _discard(self, cpv):
+        for eclass in self._inherits.pop(cpv, ()):
+            consumers = self._consumers[eclass]
+            consumers.discard(cpv)
+            if not consumers:
+                del self._consumers[eclass]
+
+    def update(self, cpv, eclasses):
+        """Record the eclasses a cpv inherits.
+
+        :param cpv: cpv string
+        :param eclasses: mapping of eclass names to checksum objects for the
+            current eclass versions, as returned by
+            :obj:`base.get_eclass_data` or :obj:`base.rebuild_cache_entry`
+        """
+        chfs = {
+            eclass: tuple(getattr(data, chf, None) for chf in self.chf_types)
+            for eclass, data in eclasses.items()}
+        with self._lock:
+            self._discard(cpv)
+            self._add(cpv, chfs)
+            self._chfs.update(chfs)
+
+    def discard(self, cpv):
+        """Remove a cpv from the index."""
+        with self._lock:
+            self._discard(cpv)
+
+    def inherits(self, cpv):
+        """Return the eclasses recorded as inherited by a cpv, None if unknown."""
+        return self._inherits.get(cpv)
+
+    def consumers(self, eclasses):
+        """Return the set of cpvs inheriting any of the given eclasses."""
+        cpvs = set()
+        for eclass in eclasses:
+            cpvs.update(self._consumers.get(eclass, ()))
+        return cpvs
+
+    def changed_eclasses(self, eclass_db):
+        """Return the indexed eclasses that changed or were removed.
+
+        :param eclass_db: :obj:`base` instance to compare against
+        """
+        ec = eclass_db.eclasses
+        changed = set()
+        for eclass in self._consumers:
+            data = ec.get(eclass)
+            if data is None or self._chfs.get(eclass) != tuple(
+                    getattr(data, chf, None) for chf in self.chf_types):
+                changed.add(eclass)
+        return changed
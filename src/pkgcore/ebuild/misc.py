@@ -11,16 +11,18 @@ __all__ = (
 )
 
 from collections import defaultdict, namedtuple
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from functools import partial
 from itertools import chain
+from multiprocessing import get_context
 
 from snakeoil import mappings
 from snakeoil.klass import alias_method, generic_equality
 from snakeoil.sequences import iflatten_instance
 
 from ..restrictions import boolean, packages, restriction
-from . import atom
+from . import atom, processor
+from .errors import SanityCheckError
 
 restrict_payload = namedtuple("restrict_data", ["restrict", "data"])
 chunked_data = namedtuple("chunked_data", ("key", "neg", "pos"))
@@ -548,8 +550,38 @@ class PayloadDict(ChunkedDataDict):
     pull_data = render_pkg
 
 
-def run_sanity_checks(pkgs, domain, threads=None):
-    """Run all sanity checks for a sequence of packages."""
+class _RenderedSanityCheckError(SanityCheckError):
+    """Picklable sanity check failure rendered in a worker process."""
+
+    def __init__(self, error):
+        self._msgs = (error.msg(verbosity=0), error.msg(verbosity=1))
+
+    def msg(self, verbosity=0, prefix='  '):
+        return self._msgs[verbosity > 0]
+
+
+# package operations handled by sanity check worker processes
+_sanity_pkg_ops = None
+
+
+def _sanity_check_init(pkg_ops):
+    global _sanity_pkg_ops
+    _sanity_pkg_ops = pkg_ops
+    # drop ebuild processors inherited from the parent process
+    processor.forget_all_processors()
+
+
+def _sanity_check_process(i):
+    _pkg, failed = _sanity_pkg_ops[i].sanity_check()
+    return i, [_RenderedSanityCheckError(e) for e in failed]
+
+
+def run_sanity_checks(pkgs, domain, threads=None, processes=False):
+    """Run all sanity checks for a sequence of packages.
+
+    :param processes: run checks in worker processes instead of threads, note
+        that failures are returned in a rendered form in that case
+    """
     failures = defaultdict(list)
     sanity_check = lambda pkg_ops: pkg_ops.sanity_check()
 
@@ -560,6 +592,20 @@ def run_sanity_checks(pkgs, domain, threads=None):
             if pkg_ops.supports("sanity_check"):
                 yield pkg_ops
 
+    if processes:
+        pkg_ops = list(_filter_pkgs(pkgs))
+        if not pkg_ops:
+            return failures
+        # Domain bound package operations aren't picklable, so workers are
+        # forked in order to inherit them.
+        with ProcessPoolExecutor(
+                max_workers=threads, mp_context=get_context('fork'),
+                initializer=_sanity_check_init, initargs=(pkg_ops,)) as executor:
+            for i, failed in executor.map(_sanity_check_process, range(len(pkg_ops))):
+                if failed:
+                    failures[pkg_ops[i].pkg].extend(failed)
+        return failures
+
     with ThreadPoolExecutor(max_workers=threads) as executor:
         for pkg, failed in executor.map(sanity_check, _filter_pkgs(pkgs)):
             if failed:
@@ -16,14 +16,18 @@ design) reduces regen time by over 40% compared to portage-2.1
 
 __all__ = (
     "request_ebuild_processor", "release_ebuild_processor", "EbuildProcessor",
-    "UnhandledCommand", "expected_ebuild_env")
+    "EbdRequest", "ProcessorPool", "UnhandledCommand", "expected_ebuild_env",
+    "prewarm_ebuild_processors", "configure_ebuild_processors")
 
 import contextlib
 import errno
 import os
+import select
 import signal
 import threading
+import time
 import traceback
+from collections import deque
 from functools import partial, wraps
 from itertools import chain
 
@@ -37,8 +41,6 @@ from ..log import logger
 from . import const as e_const
 
 _global_ebp_lock = threading.Lock()
-inactive_ebp_list = []
-active_ebp_list = []
 
 
 def _single_thread_allowed(functor):
@@ -50,10 +52,257 @@ def _single_thread_allowed(functor):
     return _inner
 
 
+class ProcessorPool:
+    """Pool of ebuild processors reused across requests.
+
+    Released processors are kept idle for reuse, the most recently released
+    being handed out first. Active processors aren't limited since requests
+    never block, aside from waiting on compatible processors being spawned
+    in the background via :obj:`prewarm`.
+
+    :param min_size: number of idle processors exempt from idle reaping
+    :param max_size: maximum number of idle processors, released processors
+        exceeding it are shut down; None for no limit
+    :param idle_timeout: seconds after which idle processors beyond
+        ``min_size`` are shut down; None to keep them indefinitely
+    :param health_interval: seconds a processor can be idle before it's
+        pinged for responsiveness on reuse, otherwise only its process is
+        checked for being alive
+    :ivar active: processors currently in use
+    :ivar inactive: idle processors, least recently released first
+    """
+
+    def __init__(self, min_size=0, max_size=None, idle_timeout=None, health_interval=30):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self.active = []
+        self.inactive = []
+        # callers hold _global_ebp_lock, allowing waiting on prewarming
+        self._spawned = threading.Condition(_global_ebp_lock)
+        self._pending = {}
+        self.reset_stats()
+
+    def configure(self, min_size=0, max_size=None, idle_timeout=None):
+        """Update the pool limits, see the class parameters for their meaning.
+
+        Must be called while holding the global processor lock.
+        """
+        if min_size < 0:
+            raise ValueError(f'invalid minimum size: {min_size}')
+        if max_size is not None and max_size < min_size:
+            raise ValueError(
+                f'maximum size {max_size} is less than minimum size {min_size}')
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        # drop processors exceeding the new limits
+        if max_size is not None:
+            while len(self.inactive) > max_size:
+                self.inactive.pop(0).shutdown_processor()
+        self.reap()
+
+    def reset_stats(self):
+        """Reset the pool metrics."""
+        self.requests = 0
+        self.reused = 0
+        self.spawned = 0
+        self.spawn_time = 0.0
+        self.reaped = 0
+        self.unhealthy = 0
+
+    @property
+    def reuse_rate(self):
+        """Fraction of requests served by an idle processor."""
+        return self.reused / self.requests if self.requests else 0.0
+
+    @property
+    def spawn_latency(self):
+        """Average seconds it took to spawn a processor."""
+        return self.spawn_time / self.spawned if self.spawned else 0.0
+
+    def summary(self):
+        """Return the pool metrics as lines of text."""
+        return (
+            f'ebuild processors: {self.requests} requests, {self.reused} reused '
+            f'({self.reuse_rate:.1%}), {self.spawned} spawned '
+            f'({self.spawn_latency * 1000:.1f}ms average)',
+            f'ebuild processors: {self.reaped} reaped idle, {self.unhealthy} unhealthy',
+        )
+
+    def _spawn(self, userpriv, sandbox, fd_pipes=None):
+        """Spawn a processor, returning it and the seconds it took."""
+        start = time.monotonic()
+        ebp = EbuildProcessor(userpriv, sandbox, fd_pipes=fd_pipes)
+        return ebp, time.monotonic() - start
+
+    def _add_idle(self, ebp):
+        self.inactive.append(ebp)
+        ebp.idle_since = time.monotonic()
+
+    def _healthy(self, ebp):
+        """Check if an idle processor can be reused."""
+        if not ebp.is_alive:
+            return False
+        if time.monotonic() - ebp.idle_since < self.health_interval:
+            return True
+        return ebp.is_responsive
+
+    def _compatible(self, ebp, userpriv, sandbox):
+        return ebp.userprived() == userpriv and (ebp.sandboxed() or not sandbox)
+
+    def reap(self):
+        """Shut down processors idle for longer than the idle timeout."""
+        if self.idle_timeout is None:
+            return
+        now = time.monotonic()
+        for ebp in self.inactive[:max(len(self.inactive) - self.min_size, 0)]:
+            if now - ebp.idle_since >= self.idle_timeout:
+                self.inactive.remove(ebp)
+                self.reaped += 1
+                ebp.shutdown_processor()
+
+    def request(self, userpriv=False, sandbox=None, fd_pipes=None):
+        """Request a processor instance, creating a new one if needed.
+
+        Must be called while holding the global processor lock.
+        """
+        if sandbox is None:
+            sandbox = spawn.is_sandbox_capable()
+        self.requests += 1
+        self.reap()
+
+        while not fd_pipes:
+            for ebp in reversed(self.inactive):
+                if self._compatible(ebp, userpriv, sandbox):
+                    self.inactive.remove(ebp)
+                    if not self._healthy(ebp):
+                        self.unhealthy += 1
+                        ebp.shutdown_processor(force=True)
+                        continue
+                    self.reused += 1
+                    self.active.append(ebp)
+                    return ebp
+            # wait on compatible processors being prewarmed
+            if not any(self._pending.get((userpriv, x), 0)
+                       for x in ((True, False) if not sandbox else (True,))):
+                break
+            self._spawned.wait()
+
+        ebp, elapsed = self._spawn(userpriv, sandbox, fd_pipes=fd_pipes)
+        self.spawned += 1
+        self.spawn_time += elapsed
+        self.active.append(ebp)
+        return ebp
+
+    def release(self, ebp):
+        """Release a processor instance, see :obj:`release_ebuild_processor`.
+
+        Must be called while holding the global processor lock.
+        """
+        try:
+            self.active.remove(ebp)
+        except ValueError:
+            return False
+
+        assert ebp not in self.inactive
+        # We can't reuse processors that use custom fd mappings or are locked on
+        # release for one reason or another.
+        if ebp.is_locked or ebp._fd_pipes or ebp.pending_requests or \
+                (self.max_size is not None and len(self.inactive) >= self.max_size):
+            ebp.shutdown_processor()
+        else:
+            self._add_idle(ebp)
+        self.reap()
+        return True
+
+    def drop(self, ebp):
+        """Force a processor to be dropped from the pool."""
+        try:
+            self.active.remove(ebp)
+        except ValueError:
+            pass
+
+        try:
+            self.inactive.remove(ebp)
+        except ValueError:
+            pass
+
+    def forget(self):
+        """Forget all known processors without shutting them down."""
+        self.active[:] = []
+        self.inactive[:] = []
+        self._pending.clear()
+
+    def prewarm(self, count=None, userpriv=False, sandbox=None,
+                eclass_cache=None, eclasses=None, wait=False):
+        """Spawn idle processors in the background.
+
+        Requests for compatible processors wait on the ones being spawned
+        instead of spawning their own.
+
+        :param count: number of idle processors wanted, defaults to ``min_size``
+        :param eclass_cache: :obj:`pkgcore.ebuild.eclass_cache` instance to
+            preload eclasses from
+        :param eclasses: names of the eclasses to preload, all eclasses of
+            ``eclass_cache`` if None
+        :param wait: wait for the processors to be spawned
+        :return: list of the threads spawning processors
+        """
+        if count is None:
+            count = self.min_size
+        if sandbox is None:
+            sandbox = spawn.is_sandbox_capable()
+        key = (userpriv, sandbox)
+        with _global_ebp_lock:
+            idle = sum(1 for x in self.inactive if self._compatible(x, userpriv, sandbox))
+            count -= idle + self._pending.get(key, 0)
+            if self.max_size is not None:
+                count = min(count, self.max_size - len(self.inactive) -
+                            sum(self._pending.values()))
+            if count <= 0:
+                return []
+            self._pending[key] = self._pending.get(key, 0) + count
+
+        def _prewarm():
+            ebp = None
+            try:
+                ebp, elapsed = self._spawn(userpriv, sandbox)
+                if eclass_cache is not None:
+                    ebp.preload_eclasses(eclass_cache, limited_to=eclasses)
+            except Exception as e:
+                logger.warning(f'failed prewarming ebuild processor: {e}')
+                if ebp is not None:
+                    ebp.shutdown_processor(force=True)
+                ebp = None
+            finally:
+                with self._spawned:
+                    if self._pending.get(key):
+                        self._pending[key] -= 1
+                    if ebp is not None:
+                        self.spawned += 1
+                        self.spawn_time += elapsed
+                        self._add_idle(ebp)
+                    self._spawned.notify_all()
+
+        threads = [threading.Thread(target=_prewarm, daemon=True) for _ in range(count)]
+        for t in threads:
+            t.start()
+        if wait:
+            for t in threads:
+                t.join()
+        return threads
+
+
+processor_pool = ProcessorPool()
+inactive_ebp_list = processor_pool.inactive
+active_ebp_list = processor_pool.active
+
+
 @_single_thread_allowed
 def forget_all_processors():
-    active_ebp_list[:] = []
-    inactive_ebp_list[:] = []
+    processor_pool.forget()
 
 
 @_single_thread_allowed
@@ -91,23 +340,7 @@ def request_ebuild_processor(userpriv=False, sandbox=None, fd_pipes=None):
         :obj:`pkgcore.os_data.portage_gid` and :obj:`pkgcore.os_data.portage_uid`?
     :param sandbox: should the processor be sandboxed?
     """
-
-    if sandbox is None:
-        sandbox = spawn.is_sandbox_capable()
-
-    for ebp in inactive_ebp_list:
-        if ebp.userprived() == userpriv and (ebp.sandboxed() or not sandbox):
-            if not ebp.is_responsive:
-                inactive_ebp_list.remove(ebp)
-                continue
-            inactive_ebp_list.remove(ebp)
-            active_ebp_list.append(ebp)
-            break
-    else:
-        ebp = EbuildProcessor(userpriv, sandbox, fd_pipes=fd_pipes)
-        active_ebp_list.append(ebp)
-
-    return ebp
+    return processor_pool.request(userpriv=userpriv, sandbox=sandbox, fd_pipes=fd_pipes)
 
 
 @_single_thread_allowed
@@ -123,20 +356,7 @@ def release_ebuild_processor(ebp):
         If a processor isn't known as active, this means either calling
         error or an internal error.
     """
-
-    try:
-        active_ebp_list.remove(ebp)
-    except ValueError:
-        return False
-
-    assert ebp not in inactive_ebp_list
-    # We can't reuse processors that use custom fd mappings or are locked on
-    # release for one reason or another.
-    if ebp.is_locked or ebp._fd_pipes:
-        ebp.shutdown_processor()
-    else:
-        inactive_ebp_list.append(ebp)
-    return True
+    return processor_pool.release(ebp)
 
 
 @_single_thread_allowed
@@ -145,15 +365,18 @@ def drop_ebuild_processor(ebp):
 
     :param ebp: :obj:`EbuildProcessor` instance
     """
-    try:
-        active_ebp_list.remove(ebp)
-    except ValueError:
-        pass
+    processor_pool.drop(ebp)
+
+
+@_single_thread_allowed
+def configure_ebuild_processors(*args, **kwargs):
+    """Update the global pool limits, see :obj:`ProcessorPool.configure`."""
+    processor_pool.configure(*args, **kwargs)
 
-    try:
-        inactive_ebp_list.remove(ebp)
-    except ValueError:
-        pass
+
+def prewarm_ebuild_processors(*args, **kwargs):
+    """Spawn idle processors in the background, see :obj:`ProcessorPool.prewarm`."""
+    return processor_pool.prewarm(*args, **kwargs)
 
 
 @contextlib.contextmanager
@@ -311,6 +534,38 @@ def chuck_StoppingCommand(ebp, line):
         raise ProcessorError(args[1])
 
 
+class EbdRequest:
+    """Framed request sent to an ebuild daemon.
+
+    :ivar id: request ID tagging the reply
+    :ivar reader: callable consuming the reply, run with the processor
+    :ivar done: whether the reply was consumed
+    :ivar result: value returned by the reader
+    :ivar error: :obj:`ProcessorError` raised by the reader for failed requests
+    """
+
+    __slots__ = ('id', 'reader', 'done', 'result', 'error')
+
+    def __init__(self, id, reader=None):
+        self.id = id
+        self.reader = reader
+        self.done = False
+        self.result = None
+        self.error = None
+
+
+def _quote(value):
+    """Escape a value for use inside single quotes in bash."""
+    return value.replace("'", "'\\''")
+
+
+def _reply_reader(want):
+    """Return a reply reader checking for a single line reply."""
+    def reader(ebp):
+        return ebp.read().rstrip('\n') == want
+    return reader
+
+
 class EbuildProcessor:
     """Abstraction of a running ebd instance.
 
@@ -331,6 +586,12 @@ class EbuildProcessor:
         self._eclass_caching = False
         self._outstanding_expects = []
         self._metadata_paths = None
+        # when the processor was last released to its pool
+        self.idle_since = None
+        # framed requests awaiting their replies, in submission order
+        self._requests = deque()
+        self._request_id = 0
+        self._eclass_paths = {}
 
         if userpriv:
             self.__userpriv = True
@@ -487,6 +748,108 @@ class EbuildProcessor:
                 raise RuntimeError(ie)
             raise
 
+    def submit(self, command, data=None, reader=None):
+        """Send a framed request without waiting for its reply.
+
+        The daemon handles requests in order, tagging the replies with their
+        request IDs, so multiple requests can be queued while earlier ones are
+        processed. Replies are consumed via :obj:`complete`.
+
+        Note that requests can't be queued behind commands requiring further
+        interaction, e.g. sourcing ebuilds requesting inherits from the python
+        side; see :obj:`set_eclass_paths`.
+
+        :param command: daemon command
+        :param data: payload sent after the command, prefixed with its size
+        :param reader: callable run with the processor to consume the reply
+        :return: :obj:`EbdRequest` instance
+        """
+        if self._outstanding_expects and not self._consume_async_expects():
+            raise InternalError(command, "expects out of alignment")
+        self._request_id += 1
+        request = EbdRequest(self._request_id, reader)
+        if data is None:
+            self.write(f"request {request.id} {command}", flush=False)
+        else:
+            self.write(
+                f"request {request.id} {command} {len(data)}\n{data}",
+                flush=False, append_newline=False)
+        self._requests.append(request)
+        return request
+
+    @property
+    def pending_requests(self):
+        """Number of framed requests awaiting their replies."""
+        return len(self._requests)
+
+    def complete(self, request=None):
+        """Consume the replies of queued requests.
+
+        :param request: request to wait for, all queued requests if None
+        :return: result of the request's reader
+        :raise ProcessorError: if the daemon reported a failure for the request
+        """
+        if request is None or not request.done:
+            self.ebd_write.flush()
+            while self._requests:
+                current = self._requests.popleft()
+                self._read_reply(current)
+                if current is request:
+                    break
+        if request is not None:
+            if request.error is not None:
+                raise request.error
+            return request.result
+
+    def _read_reply(self, request):
+        line = self.read().rstrip('\n')
+        if line != f"reply {request.id}":
+            raise InternalError(line, f"expected reply for request {request.id}")
+        try:
+            if request.reader is not None:
+                request.result = request.reader(self)
+        except ProcessorError as e:
+            request.error = e
+            request.done = True
+            if not self.pid:
+                # processor died, queued requests are lost
+                for lost in self._requests:
+                    lost.done = True
+                    lost.error = ProcessorError(
+                        f"ebuild processor died handling request {request.id}")
+                self._requests.clear()
+                return
+        line = self.read().rstrip('\n')
+        if line != f"reply_end {request.id}":
+            raise InternalError(line, f"expected end of reply for request {request.id}")
+        request.done = True
+
+    def set_eclass_paths(self, eclass_cache=None):
+        """Let the daemon resolve inherits via the eclass paths of an eclass cache.
+
+        Inherits are otherwise requested from the python side while sourcing
+        ebuilds, which doesn't work with queued requests.
+
+        :param eclass_cache: :obj:`pkgcore.ebuild.eclass_cache` instance, None
+            to revert to requesting inherits
+        :return: True on success, False if some eclasses lack paths
+        """
+        if self._requests:
+            self.complete()
+        paths = {}
+        if eclass_cache is not None:
+            for name, eclass in eclass_cache.eclasses.items():
+                if eclass.path is None:
+                    return False
+                paths[name] = eclass.path
+        if paths != self._eclass_paths:
+            data = ''.join(f'{name} {path}\n' for name, path in sorted(paths.items()))
+            self.write(f"set_eclass_paths {len(data)}\n{data}", append_newline=False)
+            if not self.expect("eclass_paths_received", flush=True):
+                raise InternalError(None, "failed setting eclass paths")
+            self._eclass_paths = paths
+        return True
+
     def _consume_async_expects(self):
         if any(x[0] for x in self._outstanding_expects):
             self.ebd_write.flush()
@@ -495,33 +858,31 @@ class EbuildProcessor:
         self._outstanding_expects = []
         return ret
 
-    def _timeout_ebp(self, signum, frame):
-        raise TimeoutError("ebp for pid '%i' appears dead, timing out" % self.pid)
-
     def expect(self, want, async_req=False, flush=False, timeout=0):
         """Read from the daemon, check if the returned string is expected.
 
         :param want: string we're expecting
+        :param timeout: if nonzero, max number of seconds to wait for the
+            daemon to start replying, returning False if it doesn't
         :return: boolean, was what was read == want?
         """
-        if timeout:
-            signal.signal(signal.SIGALRM, self._timeout_ebp)
-            signal.setitimer(signal.ITIMER_REAL, timeout)
-
         if async_req:
             self._outstanding_expects.append((flush, want))
             return True
-        if flush:
+        if flush or any(x[0] for x in self._outstanding_expects):
             self.ebd_write.flush()
-        if not self._outstanding_expects:
-            try:
-                return want == self.read().rstrip('\n')
-            except TimeoutError:
+        if timeout:
+            # wait on the pipe instead of via SIGALRM which is limited to the
+            # main thread; replies are only read once they're requested so no
+            # data is left buffered in the file object
+            readable, _, _ = select.select([self.ebd_read], [], [], timeout)
+            if not readable:
+                logger.debug(
+                    "ebp for pid '%i' appears dead, timed out after %ss",
+                    self.pid, timeout)
                 return False
-            finally:
-                if timeout:
-                    signal.setitimer(signal.ITIMER_REAL, 0)
-                    signal.signal(signal.SIGALRM, signal.SIG_DFL)
+        if not self._outstanding_expects:
+            return want == self.read().rstrip('\n')
 
         self._outstanding_expects.append((flush, want))
         return self._consume_async_expects()
@@ -591,12 +952,17 @@ class EbuildProcessor:
     def clear_preloaded_eclasses(self):
         if self.is_responsive:
             self.write("clear_preloaded_eclasses")
-            if not self.expect("clear_preload_eclasses succeeded", flush=True):
+            if not self.expect("clear_preloaded_eclasses succeeded", flush=True):
                 self.shutdown_processor()
                 return False
         self._preloaded_eclasses.clear()
         return True
 
+    @property
+    def preloaded_eclasses(self):
+        """Names of the eclasses currently preloaded into bash functions."""
+        return self._preloaded_eclasses.keys()
+
     def preload_eclasses(self, cache, async_req=False, limited_to=None):
         """Preload an eclass stack's eclasses into bash functions.
 
@@ -640,6 +1006,12 @@ class EbuildProcessor:
         if not os.path.exists(ec_file):
             logger.error(f"failed: {ec_file}")
             return False
+        if self._requests:
+            # queue behind in-flight requests
+            self.submit(
+                f"preload_eclass {ec_file}",
+                reader=_reply_reader("preload_eclass succeeded"))
+            return True
         self.write(f"preload_eclass {ec_file}")
         if self.expect("preload_eclass succeeded", async_req=async_req, flush=True):
             return True
@@ -729,13 +1101,11 @@ class EbuildProcessor:
 
             if isinstance(val, (list, tuple)):
                 data.append("%s=(%s)" % (key, ' '.join(
-                    f'[{i}]="{value}"' for i, value in enumerate(val))))
+                    f"[{i}]='{_quote(value)}'" for i, value in enumerate(val))))
             elif val.isalnum():
                 data.append(f"{key}={val}")
-            elif "'" not in val:
-                data.append(f"{key}='{val}'")
             else:
-                data.append("%s=$'%s'" % (key, val.replace("'", "\\'")))
+                data.append(f"{key}='{_quote(val)}'")
 
         # TODO: Move to using unprefixed lines to avoid leaking internal
         # variables to spawned commands once we use builtins for all commands
@@ -789,6 +1159,13 @@ class EbuildProcessor:
         # filter here, so that a screwy default doesn't result in resetting it
         # every time.
         data = os.pathsep.join(filter(None, paths))
+        if self._requests:
+            # queue behind in-flight requests
+            self.submit(
+                "set_metadata_path", data,
+                reader=_reply_reader("metadata_path_received"))
+            self._metadata_paths = paths
+            return
         self.write(f"set_metadata_path {len(data)}\n{data}", append_newline=False)
         if self.expect("metadata_path_received", flush=True):
             self._metadata_paths = paths
@@ -845,15 +1222,9 @@ class EbuildProcessor:
         # Dump any leading/trailing spaces.
         return environ[0].strip()
 
-    def get_keys(self, package_inst, eclass_cache):
-        """Request the metadata be regenerated from an ebuild.
-
-        :param package_inst: :obj:`pkgcore.ebuild.ebuild_src.package` instance
-            to regenerate
-        :param eclass_cache: :obj:`pkgcore.ebuild.eclass_cache` instance to use
-            for eclass access
-        :return: dict when successful, None when failed
-        """
+    @staticmethod
+    def _metadata_handlers():
+        """Return the mapping metadata keys are received into and its handlers."""
         metadata_keys = {}
 
         def receive_key(self, line):
@@ -862,18 +1233,53 @@ class EbuildProcessor:
                 raise FinishedProcessing(True)
             metadata_keys[line[0]] = line[1]
 
+        return metadata_keys, {'key': receive_key}
+
+    @staticmethod
+    def _metadata_env(package_inst):
         # pass down phase and metadata key lists to avoid hardcoding them on the bash side
-        env = {
+        return {
             'PKGCORE_EBUILD_PHASES': tuple(package_inst.eapi.phases.values()),
             'PKGCORE_METADATA_KEYS': tuple(package_inst.eapi.metadata_keys),
         }
 
-        self._run_depend_like_phase(
-            'gen_metadata', package_inst, eclass_cache, env=env,
-            extra_commands={'key': receive_key})
+    def get_keys(self, package_inst, eclass_cache):
+        """Request the metadata be regenerated from an ebuild.
 
+        :param package_inst: :obj:`pkgcore.ebuild.ebuild_src.package` instance
+            to regenerate
+        :param eclass_cache: :obj:`pkgcore.ebuild.eclass_cache` instance to use
+            for eclass access
+        :return: dict when successful, None when failed
+        """
+        metadata_keys, commands = self._metadata_handlers()
+        self._run_depend_like_phase(
+            'gen_metadata', package_inst, eclass_cache,
+            env=self._metadata_env(package_inst), extra_commands=commands)
         return metadata_keys
 
+    def submit_get_keys(self, package_inst):
+        """Queue a metadata regeneration request for an ebuild.
+
+        Requires inherits to be resolved by the daemon, see
+        :obj:`set_eclass_paths`. The metadata is returned by :obj:`complete`
+        for the returned request.
+
+        :param package_inst: :obj:`pkgcore.ebuild.ebuild_src.package` instance
+            to regenerate
+        :return: :obj:`EbdRequest` instance
+        """
+        self._ensure_metadata_paths(("/dev/null",))
+        metadata_keys, commands = self._metadata_handlers()
+        env = expected_ebuild_env(
+            package_inst, self._metadata_env(package_inst), depends=True)
+
+        def reader(self):
+            self.generic_handler(additional_commands=commands)
+            return metadata_keys
+
+        return self.submit('gen_metadata', self._generate_env_str(env), reader=reader)
+
     # this basically handles all hijacks from the daemon, whether
     # confcache or portageq.
     def generic_handler(self, additional_commands=None):
@@ -7,6 +7,8 @@ __all__ = ("UnconfiguredTree", "ConfiguredTree", "ProvidesRepo", "tree")
 import locale
 import os
 import stat
+import subprocess
+from collections import deque
 from functools import partial, wraps
 from itertools import chain, filterfalse
 from operator import attrgetter
@@ -15,6 +17,7 @@ from sys import intern
 
 from snakeoil import chksum, klass
 from snakeoil.bash import iter_read_bash, read_dict
+from snakeoil.compatibility import IGNORED_EXCEPTIONS
 from snakeoil.containers import InvertedContains
 from snakeoil.data_source import local_source
 from snakeoil.fileutils import readlines
@@ -25,7 +28,9 @@ from snakeoil.sequences import iflatten_instance, stable_unique
 from snakeoil.strings import pluralism as _pl
 from snakeoil.weakrefs import WeakValCache
 
-from .. import fetch
+from .. import const, fetch
+from .. import operations as operations_mod
+from ..cache import CacheStats
 from ..config.hint import ConfigHint, configurable
 from ..fs.livefs import sorted_scan
 from ..log import logger
@@ -44,6 +49,140 @@ from .eapi import get_eapi
 
 class repo_operations(_repo_ops.operations):
 
+    def _get_eclass_index(self):
+        """Return the eclass consumer index for the repo, if it has one.
+
+        The index is stored alongside the first writable, file based cache
+        unless that cache lives inside the repo itself (e.g. md5-cache), in
+        which case it's stored in the user cache dir keyed by repo location
+        in order to keep the repo tree clean.
+        """
+        repo_location = self.repo.location.rstrip(os.sep) + os.sep
+        for cache in self._get_caches():
+            if not cache.readonly and hasattr(cache, 'location'):
+                if os.path.join(cache.location, '').startswith(repo_location):
+                    path = pjoin(
+                        const.USER_CACHE_PATH, 'eclass-index',
+                        repo_location.strip(os.sep), 'index.json')
+                else:
+                    path = pjoin(cache.location, '.eclass_index')
+                return eclass_cache_mod.ConsumerIndex(
+                    path, chf_types=cache.eclass_chf_types)
+        return None
+
+    def _git_head(self):
+        """Return the current commit of a git-based repo, None otherwise."""
+        try:
+            p = subprocess.run(
+                ['git', 'rev-parse', '--verify', '-q', 'HEAD'], cwd=self.repo.location,
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, encoding='utf8')
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        if p.returncode:
+            return None
+        return p.stdout.strip()
+
+    def _git_changed_cpvs(self, commit, head):
+        """Return the cpvs of ebuilds changed between two commits.
+
+        Returns None if the changes couldn't be determined, e.g. if the older
+        commit doesn't exist anymore due to history rewrites.
+        """
+        try:
+            p = subprocess.run(
+                ['git', 'diff', '--name-only', '--no-renames', '--relative', '-z',
+                 commit, head, '--'], cwd=self.repo.location,
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, encoding='utf8')
+        except FileNotFoundError:
+            return None
+        if p.returncode:
+            return None
+        cpvs = set()
+        for path in p.stdout.split('\0'):
+            parts = path.split('/')
+            if len(parts) == 3 and parts[2].endswith('.ebuild'):
+                cpvs.add(f'{parts[0]}/{parts[2][:-7]}')
+        return cpvs
+
+    @operations_mod.is_standalone
+    def _cmd_api_regen_cache(self, observer=None, threads=1, pkgs=None,
+                             changed_eclasses=False, incremental=False, **kwargs):
+        """Regenerate the repo's metadata cache.
+
+        :param changed_eclasses: only regenerate entries for packages
+            inheriting eclasses that changed since the last regen, falls back
+            to regenerating the entire repo if no eclass index exists
+        :param incremental: in addition to the consumers of changed eclasses,
+            only regenerate entries for ebuilds changed in the repo's git
+            history since the last regen, falls back to regenerating the
+            entire repo if the changes can't be determined
+        """
+        index = self._get_eclass_index()
+        if index is None:
+            return super()._cmd_api_regen_cache(
+                observer=observer, threads=threads, pkgs=pkgs, **kwargs)
+
+        # commit to record as synced with the index after the regen
+        head = None
+        cpvs = None
+        previous = index
+        if pkgs is None and index.load():
+            if incremental and index.commit is not None:
+                head = self._git_head()
+                if head is not None:
+                    cpvs = self._git_changed_cpvs(index.commit, head)
+                if cpvs is None:
+                    head = None
+            if cpvs is None and changed_eclasses:
+                cpvs = set()
+            if cpvs is not None:
+                cpvs.update(index.consumers(
+                    index.changed_eclasses(self.repo.eclass_cache)))
+
+        if cpvs is not None:
+            restricts = []
+            for cpvstr in sorted(cpvs):
+                try:
+                    restricts.append(atom.atom(f'={cpvstr}'))
+                except ebuild_errors.MalformedAtom:
+                    continue
+            pkgs = []
+            if restricts:
+                pkgs = list(self.repo.itermatch(
+                    packages.OrRestriction(*restricts), pkg_filter=None))
+            # drop data for removed ebuilds
+            caches = [x for x in self._get_caches() if not x.readonly]
+            for cpvstr in cpvs.difference(x.cpvstr for x in pkgs):
+                index.discard(cpvstr)
+                for cache in caches:
+                    try:
+                        del cache[cpvstr]
+                    except KeyError:
+                        pass
+        elif pkgs is None:
+            # full regen, rebuild the index from scratch
+            previous, index = index, eclass_cache_mod.ConsumerIndex(
+                index.path, chf_types=index.chf_types)
+            head = self._git_head()
+
+        # schedule pkgs to processors based on their previously known inherits
+        affinity = lambda pkg: previous.inherits(pkg.cpvstr)
+        package_class = self.repo.package_class
+        package_class.eclass_index = index
+        try:
+            ret = super()._cmd_api_regen_cache(
+                observer=observer, threads=threads, pkgs=pkgs,
+                affinity=affinity, **kwargs)
+        finally:
+            package_class.eclass_index = None
+        if head is not None:
+            index.commit = head
+        try:
+            index.write()
+        except EnvironmentError as e:
+            logger.warning(f'failed writing eclass index: {e}')
+        return ret
+
     def _cmd_implementation_digests(self, domain, matches, observer,
                                     mirrors=False, force=False):
         manifest_config = self.repo.config.manifests
@@ -615,10 +754,69 @@ class UnconfiguredTree(prototype.tree):
         """Base deprecated packages restriction from profiles/package.deprecated."""
         return packages.OrRestriction(*self.config.pkg_deprecated)
 
+    def validate_cache(self, pkgs=None, threads=None, prime=False):
+        """Validate metadata cache entries in bulk.
+
+        See :obj:`pkgcore.ebuild.ebuild_src.package_factory.validate_metadata`.
+
+        :param pkgs: packages to validate, defaults to all packages in the repo
+            in sorted order
+        :return: mapping of package cpv strings to their valid cache entries
+        """
+        if pkgs is None:
+            pkgs = list(self.itermatch(
+                packages.AlwaysTrue, sorter=sorted, pkg_filter=None))
+        return self.package_class.validate_metadata(pkgs, threads=threads, prime=prime)
+
+    def prefetch_metadata(self, restrict, executor, limit=None):
+        """Load the metadata of matching packages in the background.
+
+        See :obj:`pkgcore.ebuild.ebuild_src.package_factory.prefetch_metadata`.
+
+        :param restrict: restriction matched against package CPVs only,
+            restrictions requiring metadata shouldn't be used
+        :param limit: max number of packages to prefetch, highest versions first
+        :return: list of futures for the submitted packages
+        """
+        # bypass the metadata checks of the default package filter
+        pkgs = sorted(self.itermatch(restrict, pkg_filter=None), reverse=True)
+        return self.package_class.prefetch_metadata(pkgs[:limit], executor)
+
+    def clear_primed_metadata(self):
+        """Drop validated or prefetched metadata that hasn't been used.
+
+        See :obj:`pkgcore.ebuild.ebuild_src.package_factory.clear_primed`.
+        """
+        self.package_class.clear_primed()
+
+    def enable_cache_stats(self, stats=None):
+        """Collect metadata cache stats for the repo.
+
+        :param stats: :obj:`pkgcore.cache.CacheStats` instance to use, allowing
+            stats to be shared between repos, a new one is created by default
+        :return: the :obj:`pkgcore.cache.CacheStats` instance in use
+        """
+        if stats is None:
+            stats = CacheStats()
+        self.package_class.stats = stats
+        for cache in self.cache:
+            if cache is not None:
+                cache.stats = stats
+        return stats
+
     def _regen_operation_helper(self, **kwds):
         return _RegenOpHelper(
             self, force=bool(kwds.get('force', False)),
-            eclass_caching=bool(kwds.get('eclass_caching', True)))
+            eclass_caching=bool(kwds.get('eclass_caching', True)),
+            window=kwds.get('pipeline_window'))
+
+    def _regen_prewarm(self, count, **kwds):
+        """Spawn ebuild processors for regen workers in the background."""
+        processor.prewarm_ebuild_processors(count)
+
+    def _regen_process_helper(self, **kwds):
+        return _RegenProcessHelper(
+            self, eclass_caching=bool(kwds.get('eclass_caching', True)))
 
     def __getstate__(self):
         d = self.__dict__.copy()
@@ -632,9 +830,15 @@ class UnconfiguredTree(prototype.tree):
 
 class _RegenOpHelper:
 
-    def __init__(self, repo, force=False, eclass_caching=True):
+    # default maximum number of metadata requests queued by :obj:`pipelined`,
+    # bounded so replies fit in the pipe buffer while the next request is written
+    window = 4
+
+    def __init__(self, repo, force=False, eclass_caching=True, window=None):
         self.force = force
         self.eclass_caching = eclass_caching
+        if window is not None:
+            self.window = window
         self.ebp = self.request_ebp()
 
     def request_ebp(self):
@@ -643,6 +847,10 @@ class _RegenOpHelper:
             ebp.allow_eclass_caching()
         return ebp
 
+    @property
+    def preloaded_eclasses(self):
+        return self.ebp.preloaded_eclasses
+
     def __call__(self, pkg):
         try:
             return pkg._fetch_metadata(ebp=self.ebp, force_regen=self.force)
@@ -651,12 +859,144 @@ class _RegenOpHelper:
             self.ebp = self.request_ebp()
             raise
 
+    @property
+    def pipelined(self):
+        """Pipelined regen function, None if disabled via a window below 2."""
+        if self.window < 2:
+            return None
+        return self._pipelined
+
+    def _pipelined(self, pkgs):
+        """Regenerate metadata for packages, queueing requests on the processor.
+
+        Ebuilds are still sourced one at a time by the daemon, but up to
+        :obj:`window` requests are sent ahead so it doesn't idle while
+        generated metadata is parsed and stored. Falls back to regenerating
+        packages one at a time if inherits can't be resolved by the daemon.
+
+        :return: iterable of (package, exception) tuples for failures
+        """
+        pkgs = iter(pkgs)
+        pending = deque()
+
+        def submit(pkg):
+            pending.append((pkg, pkg._parent._submit_metadata(pkg, self.ebp)))
+
+        def complete():
+            pkg, request = pending.popleft()
+            try:
+                _data, inherited = pkg._parent._complete_metadata(pkg, self.ebp, request)
+            except Exception as e:
+                if not self.ebp.pid:
+                    # ebuild processor is dead, requeue lost requests on a replacement
+                    self.ebp = self.request_ebp()
+                    self.ebp.set_eclass_paths(pkg._parent._ecache)
+                    for x, _request in [pending.popleft() for _ in range(len(pending))]:
+                        submit(x)
+                return pkg, e
+            if self.eclass_caching and inherited:
+                self.ebp.preload_eclasses(
+                    pkg._parent._ecache, limited_to=inherited, async_req=True)
+            return None
+
+        ecache = None
+        try:
+            for pkg in pkgs:
+                factory = pkg._parent
+                if ecache is None:
+                    ecache = factory._ecache
+                    if not self.ebp.set_eclass_paths(ecache):
+                        # eclasses lacking paths are transferred on inherit
+                        yield from self._sequential(chain((pkg,), pkgs))
+                        return
+                if not self.force and factory._get_cached_metadata(pkg) is not None:
+                    continue
+                if not pkg.eapi.is_supported:
+                    continue
+                submit(pkg)
+                if len(pending) >= self.window:
+                    if failure := complete():
+                        yield failure
+            while pending:
+                if failure := complete():
+                    yield failure
+        finally:
+            if ecache is not None and self.ebp.pid:
+                self.ebp.complete()
+                self.ebp.set_eclass_paths(None)
+
+    def _sequential(self, pkgs):
+        for pkg in pkgs:
+            try:
+                self(pkg)
+            except IGNORED_EXCEPTIONS:
+                raise
+            except Exception as e:
+                yield pkg, e
+
     def __del__(self):
         if self.eclass_caching:
             self.ebp.disable_eclass_caching()
         processor.release_ebuild_processor(self.ebp)
 
 
+class _RegenProcessHelper:
+    """Regen helper sourcing ebuilds in worker processes.
+
+    Generated metadata is returned to the parent process for storage.
+    """
+
+    def __init__(self, repo, eclass_caching=True):
+        self.repo = repo
+        self.eclass_caching = eclass_caching
+        self._ebp = None
+
+    @staticmethod
+    def key(pkg):
+        return (pkg.category, pkg.package, pkg.fullver)
+
+    def _request_ebp(self):
+        ebp = processor.request_ebuild_processor()
+        if self.eclass_caching:
+            ebp.allow_eclass_caching()
+        return ebp
+
+    def generate(self, keys):
+        """Generate metadata for packages in a worker process.
+
+        Note that worker processors aren't explicitly released, they exit
+        when the worker process goes away and closes their pipes.
+        """
+        if self._ebp is None:
+            # drop processors inherited from the parent process
+            processor.forget_all_processors()
+            self._ebp = self._request_ebp()
+        package_class = self.repo.package_class
+        for key in keys:
+            pkg = self.repo[key]
+            if not pkg.eapi.is_supported:
+                yield None, None
+                continue
+            try:
+                yield package_class._generate_metadata(pkg, ebp=self._ebp), None
+            except pkg_errors.MetadataException:
+                # Handled by the scan for metadata masked pkgs after regen;
+                # the ebuild processor is dead, so force a replacement request.
+                self._ebp = self._request_ebp()
+                yield None, None
+            except Exception as e:
+                yield None, e
+
+    def store(self, pkg, data):
+        """Store metadata generated by a worker process."""
+        self.repo.package_class._store_metadata(pkg, data)
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        d['_ebp'] = None
+        return d
+
+
 class ConfiguredTree(configured.tree):
     """Wrapper around a :obj:`UnconfiguredTree` binding build/configuration data (USE)."""
 
@@ -0,0 +1,109 @@
+"""
+background fetching of upcoming packages
+
+Distfiles of a package are fetched and verified right before it's built,
+leaving the network idle while building and the build waiting on downloads.
+:obj:`FetchAhead` fetches the distfiles of the next packages in the plan in a
+bounded thread pool while the current package builds.
+"""
+
+__all__ = ("FetchAhead",)
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class FetchAhead:
+    """Fetch upcoming items of a sequence in the background.
+
+    Items are fetched in order, at most ``depth`` items ahead of the one
+    currently requested via :obj:`get`. Failures are reported as soon as
+    they're noticed instead of when the item is reached, as is the consumer
+    having to wait on fetches (back-pressure).
+
+    :param items: items to fetch, e.g. resolved ops
+    :param fetch: callable run in a worker thread for each item, returning
+        the fetch result or False on failure; any exceptions raised are
+        propagated by :obj:`get`
+    :param depth: number of items to fetch ahead of the current one
+    :param jobs: maximum number of concurrent fetches
+    :param report: optional callable called in the consumer's thread with an
+        event ('failed' or 'waiting') and the item it's for
+    :ivar failed: indexes of the items that failed fetching
+    :ivar stalls: number of times the consumer waited on a fetch
+    :ivar stall_time: seconds the consumer spent waiting on fetches
+    """
+
+    def __init__(self, items, fetch, depth=1, jobs=1, report=None):
+        self.items = tuple(items)
+        self._fetch = fetch
+        self.depth = max(depth, 0)
+        self.jobs = max(jobs, 1)
+        self._report = report
+        self.failed = []
+        self.stalls = 0
+        self.stall_time = 0.0
+        self._futures = {}
+        self._submitted = 0
+        self._executor = None
+
+    def _submit(self, end):
+        end = min(end, len(self.items))
+        if self._submitted >= end:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.jobs)
+        for i in range(self._submitted, end):
+            self._futures[i] = self._executor.submit(self._fetch, self.items[i])
+        self._submitted = end
+
+    def poll(self):
+        """Report items that failed fetching since the last check.
+
+        :return: list of the indexes of the newly failed items
+        """
+        failed = []
+        for i, future in sorted(self._futures.items()):
+            if i in self.failed or not future.done() or future.cancelled():
+                continue
+            if future.exception() is None and future.result() is False:
+                self.failed.append(i)
+                failed.append(i)
+                if self._report is not None:
+                    self._report('failed', self.items[i])
+        return failed
+
+    def get(self, i):
+        """Return the fetch result of an item, waiting for it if required.
+
+        Fetching of the items following it is started as well.
+
+        :param i: item index
+        """
+        self._submit(i + self.depth + 1)
+        future = self._futures.pop(i, None)
+        if future is None:
+            # item was requested again
+            future = self._executor.submit(self._fetch, self.items[i])
+        self.poll()
+        if not future.done():
+            self.stalls += 1
+            if self._report is not None:
+                self._report('waiting', self.items[i])
+            start = time.perf_counter()
+            result = future.result()
+            self.stall_time += time.perf_counter() - start
+        else:
+            result = future.result()
+        if result is False and i not in self.failed:
+            self.failed.append(i)
+        return result
+
+    def shutdown(self):
+        """Cancel queued fetches and wait for running ones to finish."""
+        for future in self._futures.values():
+            future.cancel()
+        self._futures = {}
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -8,6 +8,8 @@ __all__ = (
 )
 
 import os
+import threading
+from collections import defaultdict
 
 from snakeoil import klass
 from snakeoil.dependant_methods import ForcedDepends
@@ -22,6 +24,10 @@ from ..fetch import errors as fetch_errors
 
 class fetch_base:
 
+    # serializes fetching the same distfile from multiple threads,
+    # e.g. for packages sharing distfiles that are fetched ahead
+    _fetch_locks = defaultdict(threading.Lock)
+
     def __init__(self, domain, pkg, fetchables, fetcher):
         self.verified_files = {}
         self._basenames = set()
@@ -47,7 +53,8 @@ class fetch_base:
         # fetching files without uri won't fly
         # XXX hack atm, could use better logic but works for now
         try:
-            fp = self.fetcher(fetchable)
+            with self._fetch_locks[fetchable.filename]:
+                fp = self.fetcher(fetchable)
         except fetch_errors.ChksumFailure as e:
             # checksum failed, rename file and try refetching
             path = pjoin(self.fetcher.distdir, fetchable.filename)
@@ -1,10 +1,29 @@
+import os
+import pickle
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from multiprocessing import cpu_count
+
 from snakeoil.compatibility import IGNORED_EXCEPTIONS
 
 from ..package.errors import MetadataException
-from ..util.thread_pool import map_async
+from ..util.thread_pool import reclaim_threads
 
 
 def regen_iter(iterable, regen_func, observer):
+    pipelined = getattr(regen_func, 'pipelined', None)
+    if pipelined is not None:
+        try:
+            for pkg, e in pipelined(iterable):
+                if not isinstance(e, MetadataException):
+                    yield pkg, e
+        except KeyboardInterrupt:
+            pass
+        return
+
     for pkg in iterable:
         try:
             regen_func(pkg)
@@ -20,7 +39,205 @@ def regen_iter(iterable, regen_func, observer):
             yield pkg, e
 
 
-def regen_repository(repo, pkgs, observer, threads=1, pkg_attr='keywords', **kwargs):
+class WorkerStats:
+    """Packages processed by a regen worker and the time it took."""
+
+    __slots__ = ('id', 'queue', 'count', 'elapsed', 'steals')
+
+    def __init__(self, id):
+        self.id = id
+        self.queue = deque()
+        self.count = 0
+        self.elapsed = 0.0
+        self.steals = 0
+
+    @property
+    def rate(self):
+        """Packages processed per second."""
+        return self.count / self.elapsed if self.elapsed else 0.0
+
+
+class AffinityScheduler:
+    """Distribute packages between regen workers based on their eclasses.
+
+    Packages are grouped by the set of eclasses they're expected to inherit
+    and whole groups are handed out to the worker whose ebuild processor
+    already has the most of a group's eclasses preloaded. Once all groups are
+    claimed, idle workers steal half of the remaining packages queued for the
+    busiest worker.
+    """
+
+    # number of unclaimed groups searched for the best match per claim
+    window = 128
+
+    def __init__(self, pkgs, affinity=None):
+        """
+        :param pkgs: iterable of packages to schedule
+        :param affinity: callable returning the names of the eclasses a
+            package is expected to inherit, None if unknown
+        """
+        groups = defaultdict(deque)
+        for pkg in pkgs:
+            eclasses = affinity(pkg) if affinity is not None else None
+            groups[frozenset(eclasses or ())].append(pkg)
+        # order groups so ones with similar eclass sets are close together
+        self._groups = deque(sorted(groups.items(), key=lambda x: sorted(x[0])))
+        self._count = sum(len(x) for x in groups.values())
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self.workers = []
+
+    def __len__(self):
+        return self._count
+
+    def add_worker(self):
+        """Register a new worker, returning its :obj:`WorkerStats`."""
+        worker = WorkerStats(len(self.workers))
+        self.workers.append(worker)
+        return worker
+
+    def cancel(self):
+        """Stop handing out packages."""
+        self._cancelled = True
+
+    def _claim(self, worker, preloaded):
+        best = None
+        for i, (eclasses, _pkgs) in enumerate(islice(self._groups, self.window)):
+            missing = len(eclasses.difference(preloaded))
+            if best is None or missing < best[0]:
+                best = (missing, i)
+                if not missing:
+                    break
+        if best is None:
+            return False
+        _eclasses, worker.queue = self._groups[best[1]]
+        del self._groups[best[1]]
+        return True
+
+    def _steal(self, worker):
+        victim = max(self.workers, key=lambda x: len(x.queue))
+        count = len(victim.queue) // 2
+        if not count:
+            return False
+        stolen = deque(victim.queue.pop() for _ in range(count))
+        stolen.reverse()
+        worker.queue = stolen
+        worker.steals += 1
+        return True
+
+    def next(self, worker, preloaded=()):
+        """Return the next package for a worker, None if there's no work left.
+
+        :param worker: :obj:`WorkerStats` instance of the requesting worker
+        :param preloaded: names of the eclasses preloaded by the worker
+        """
+        with self._lock:
+            if self._cancelled:
+                return None
+            if not worker.queue:
+                if not (self._claim(worker, preloaded) or self._steal(worker)):
+                    return None
+            return worker.queue.popleft()
+
+    def chunks(self, size):
+        """Split all unclaimed packages into lists of related packages.
+
+        Groups are kept together where possible, larger ones are split into
+        multiple chunks of the given size.
+        """
+        with self._lock:
+            groups, self._groups = self._groups, deque()
+        chunk = []
+        for _eclasses, pkgs in groups:
+            for pkg in pkgs:
+                chunk.append(pkg)
+                if len(chunk) == size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+    def iter_worker(self, worker, preloaded=lambda: ()):
+        """Iterate over the packages scheduled for a worker.
+
+        :param preloaded: callable returning the names of the eclasses
+            currently preloaded by the worker
+        """
+        start = time.time()
+        try:
+            while (pkg := self.next(worker, preloaded())) is not None:
+                yield pkg
+                worker.count += 1
+        finally:
+            worker.elapsed = time.time() - start
+
+
+# regen helper of the current worker process
+_process_helper = None
+
+
+def _process_init(helper):
+    global _process_helper
+    _process_helper = helper
+
+
+def _process_regen(keys):
+    start = time.time()
+    results = []
+    for data, e in _process_helper.generate(keys):
+        if e is not None:
+            try:
+                pickle.dumps(e)
+            except Exception:
+                # send unpicklable errors back in stringified form
+                e = Exception(f'{e.__class__.__name__}: {e}')
+        results.append((data, e))
+    return os.getpid(), time.time() - start, results
+
+
+def _regen_processes(repo, scheduler, processes, kwargs):
+    """Regenerate metadata in a pool of worker processes.
+
+    Packages are sourced by the workers while generated metadata is stored by
+    the calling process, keeping all cache writes in a single process.
+    """
+    helper = repo._regen_process_helper(**kwargs)
+    chunks = list(scheduler.chunks(16))
+    errors = []
+    stats = {}
+    with ProcessPoolExecutor(
+            max_workers=processes, initializer=_process_init, initargs=(helper,)) as executor:
+        results = executor.map(
+            _process_regen, ([helper.key(pkg) for pkg in chunk] for chunk in chunks))
+        try:
+            for chunk, (pid, elapsed, chunk_results) in zip(chunks, results):
+                worker = stats.get(pid)
+                if worker is None:
+                    worker = stats[pid] = scheduler.add_worker()
+                worker.count += len(chunk)
+                worker.elapsed += elapsed
+                for pkg, (data, e) in zip(chunk, chunk_results):
+                    if e is not None:
+                        errors.append((pkg, e))
+                    elif data is not None:
+                        helper.store(pkg, data)
+        except BaseException:
+            executor.shutdown(wait=False)
+            raise
+    return errors
+
+
+def regen_repository(repo, pkgs, observer, threads=1, pkg_attr='keywords',
+                     affinity=None, processes=False, **kwargs):
+    """Regenerate metadata for the given packages in parallel.
+
+    :param affinity: callable returning the names of the eclasses a package is
+        expected to inherit, used to schedule packages to workers that
+        already have them preloaded
+    :param processes: use worker processes instead of threads if the repo
+        supports it, avoiding contention on the GIL
+    :return: iterable of (package, exception) tuples for failures
+    """
     helpers = []
 
     def _get_repo_helper():
@@ -31,10 +248,52 @@ def regen_repository(repo, pkgs, observer, threads=1, pkg_attr='keywords', **kwa
         helpers.append(helper)
         return helper
 
-    def get_args():
-        return (_get_repo_helper(), observer)
+    scheduler = AffinityScheduler(pkgs, affinity)
+    if threads is None:
+        threads = cpu_count()
+    # don't spawn pointless threads when there are less items than parallelism
+    threads = max(min(len(scheduler), threads), 0)
+    if processes and hasattr(repo, '_regen_process_helper'):
+        if threads:
+            yield from _regen_processes(repo, scheduler, threads, kwargs)
+            _report_stats(scheduler, observer)
+        return
+
+    errors = deque()
 
-    errors = map_async(pkgs, regen_iter, threads=threads, per_thread_args=get_args)
+    prewarm = getattr(repo, '_regen_prewarm', None)
+    if prewarm is not None and threads:
+        # spawn whatever the workers' helpers require in parallel up front
+        prewarm(threads, **kwargs)
+
+    def worker(helper, stats):
+        preloaded = lambda: getattr(helper, 'preloaded_eclasses', ())
+        errors.extend(regen_iter(
+            scheduler.iter_worker(stats, preloaded), helper, observer))
+
+    workers = [
+        threading.Thread(target=worker, args=(_get_repo_helper(), scheduler.add_worker()))
+        for _ in range(threads)]
+    try:
+        for x in workers:
+            x.start()
+        for x in workers:
+            x.join()
+    except BaseException:
+        scheduler.cancel()
+        raise
+    finally:
+        reclaim_threads(workers)
+
+    _report_stats(scheduler, observer)
 
     # yield any errors that occurred during metadata generation
     yield from errors
+
+
+def _report_stats(scheduler, observer):
+    if getattr(observer, 'verbosity', 0) > 0:
+        for stats in scheduler.workers:
+            observer.info(
+                f'regen worker {stats.id}: {stats.count} pkgs in {stats.elapsed:.2f}s '
+                f'({stats.rate:.1f}/s, {stats.steals} steals)')
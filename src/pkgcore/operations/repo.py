@@ -226,11 +226,17 @@ class operations(sync_operations):
                 del cache[p]
 
     @operations_mod.is_standalone
-    def _cmd_api_regen_cache(self, observer=None, threads=1, **kwargs):
+    def _cmd_api_regen_cache(self, observer=None, threads=1, pkgs=None, **kwargs):
+        """Regenerate the repo's metadata cache.
+
+        :param pkgs: if specified, only regenerate entries for the given
+            packages, skipping the repo-wide scan and cache cleanup
+        """
         cache = getattr(self.repo, 'cache', None)
         if not cache and not kwargs.get('force', False):
             return
         sync_rate = getattr(cache, 'sync_rate', None)
+        targeted = pkgs is not None
         try:
             if sync_rate is not None:
                 cache.set_sync_rate(1000000)
@@ -239,7 +245,18 @@ class operations(sync_operations):
             # Force usage of unfiltered repo to include pkgs with metadata issues.
             # Matches are collapsed directly to a list to avoid threading issues such
             # as EBADF since the repo iterator isn't thread-safe.
-            pkgs = list(self.repo.itermatch(packages.AlwaysTrue, pkg_filter=None))
+            if targeted:
+                pkgs = list(pkgs)
+                restrict = packages.OrRestriction(*(x.versioned_atom for x in pkgs))
+            else:
+                pkgs = list(self.repo.itermatch(packages.AlwaysTrue, pkg_filter=None))
+                restrict = packages.AlwaysTrue
+
+            # skip pkgs with valid cache entries using a bulk validation pass
+            validate_cache = getattr(self.repo, 'validate_cache', None)
+            if validate_cache is not None and not kwargs.get('force', False):
+                valid = validate_cache(pkgs, threads=threads)
+                pkgs = [pkg for pkg in pkgs if pkg.cpvstr not in valid]
 
             observer = self._get_observer(observer)
             for pkg, e in regen.regen_repository(
@@ -249,13 +266,15 @@ class operations(sync_operations):
 
             # report pkgs with bad metadata -- relies on iterating over the
             # unfiltered repo to populate the masked repo
-            pkgs = frozenset(pkg.cpvstr for pkg in self.repo)
+            if pkgs or not targeted:
+                pkgs = frozenset(pkg.cpvstr for pkg in self.repo.itermatch(restrict))
             for pkg in sorted(self.repo._bad_masked):
                 observer.error(f'{pkg.cpvstr}: {pkg.data.msg(verbosity=observer.verbosity)}')
                 ret = 1
 
             # remove old/invalid cache entries
-            self._cmd_implementation_clean_cache(pkgs)
+            if not targeted:
+                self._cmd_implementation_clean_cache(pkgs)
 
             return ret
         finally:
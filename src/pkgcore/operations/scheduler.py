@@ -0,0 +1,155 @@
+"""
+parallel execution of resolved plans
+
+Builds of independent ops run concurrently in a thread pool while merging to
+the livefs stays serialized in the calling thread.
+"""
+
+__all__ = ("BuildScheduler",)
+
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class BuildScheduler:
+    """Run the builds of resolved ops in parallel, serializing their merges.
+
+    An op is built once all its build deps are merged and merged once it's
+    built and all its build and runtime deps are merged, preferring plan
+    order. Ops depending on failed ops are skipped. Remove ops aren't built
+    and are merged once all ops preceding them are.
+
+    :param graph: :obj:`pkgcore.resolver.graph.merge_graph` instance
+    :param build: callable run in a worker thread for each op to build,
+        returning the result passed to ``merge`` or False on failure; any
+        exceptions raised are propagated once running builds finish
+    :param merge: callable run in the calling thread for each op to merge with
+        the build result (None for ops that aren't built), returning False on
+        failure
+    :param jobs: maximum number of concurrent builds
+    :param load_average: don't start new builds while other builds are running
+        and the load average is at least this value
+    :param keep_going: continue building unrelated ops after a failure,
+        otherwise no new builds are started
+    :ivar merged: indexes of the merged ops in merge order
+    :ivar failed: indexes of the failed ops
+    :ivar skipped: indexes of the ops skipped due to failed deps
+    """
+
+    # seconds to wait for running builds before rechecking the load average
+    poll_interval = 1.0
+
+    def __init__(self, graph, build, merge, jobs=1, load_average=None,
+                 keep_going=False, getloadavg=os.getloadavg):
+        self.graph = graph
+        self._build = build
+        self._merge = merge
+        self.jobs = max(jobs, 1)
+        self.load_average = load_average
+        self.keep_going = keep_going
+        self._getloadavg = getloadavg
+        self.merged = []
+        self.failed = []
+        self.skipped = []
+
+        self._build_deps = []
+        self._merge_deps = []
+        for i, op in enumerate(graph.ops):
+            if op.desc == 'remove':
+                self._build_deps.append(())
+                self._merge_deps.append(tuple(range(i)))
+            else:
+                self._build_deps.append(
+                    tuple(j for j in graph.deps(i, ('build',)) if j < i))
+                self._merge_deps.append(tuple(graph.ordering_deps(i)))
+
+    def _load_exceeded(self):
+        if self.load_average is None:
+            return False
+        try:
+            return self._getloadavg()[0] >= self.load_average
+        except OSError:
+            return False
+
+    def run(self):
+        """Build and merge all ops.
+
+        :return: True if all ops were merged, False otherwise
+        """
+        ops = self.graph.ops
+        pending = list(range(len(ops)))
+        done = set()
+        dead = set()
+        built = {}
+        running = {}
+        stopped = False
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while True:
+                # drop ops depending on failures
+                for i in pending[:]:
+                    if dead.intersection(self._merge_deps[i]) or \
+                            dead.intersection(self._build_deps[i]):
+                        pending.remove(i)
+                        dead.add(i)
+                        self.skipped.append(i)
+
+                # merge everything that's ready, in plan order
+                merged = True
+                while merged:
+                    merged = False
+                    for i in sorted(built):
+                        if done.issuperset(self._merge_deps[i]):
+                            result = built.pop(i)
+                            if self._merge(ops[i], result) is False:
+                                dead.add(i)
+                                self.failed.append(i)
+                                stopped = not self.keep_going
+                            else:
+                                done.add(i)
+                                self.merged.append(i)
+                            merged = True
+                            break
+                        elif dead.intersection(self._merge_deps[i]):
+                            del built[i]
+                            dead.add(i)
+                            self.skipped.append(i)
+                            merged = True
+                            break
+
+                # start builds whose build deps are merged
+                for i in pending[:]:
+                    if stopped or len(running) >= self.jobs:
+                        break
+                    if not done.issuperset(self._build_deps[i]):
+                        continue
+                    if ops[i].desc == 'remove':
+                        pending.remove(i)
+                        built[i] = None
+                        continue
+                    if running and self._load_exceeded():
+                        break
+                    pending.remove(i)
+                    running[executor.submit(self._build, ops[i])] = i
+
+                if not running:
+                    if built and any(
+                            done.issuperset(self._merge_deps[i]) for i in built):
+                        continue
+                    break
+
+                timeout = None
+                if self.load_average is not None and pending:
+                    timeout = self.poll_interval
+                finished, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i = running.pop(future)
+                    result = future.result()
+                    if result is False:
+                        dead.add(i)
+                        self.failed.append(i)
+                        stopped = not self.keep_going
+                    else:
+                        built[i] = result
+
+        return not (self.failed or self.skipped) and len(self.merged) == len(ops)
@@ -97,10 +97,15 @@ class caching_repo:
         self.__db__ = db
         self.__strategy__ = strategy
         self.__cache__ = {}
+        self.__hits__ = 0
+        self.__misses__ = 0
 
     def match(self, restrict):
         v = self.__cache__.get(restrict)
-        if v is None:
+        if v is not None:
+            self.__hits__ += 1
+        else:
+            self.__misses__ += 1
             v = self.__cache__[restrict] = \
                 caching_iter(
                     self.__db__.itermatch(restrict, sorter=self.__strategy__))
@@ -0,0 +1,263 @@
+"""
+conflict driven clause learning SAT solver
+
+Small solver used by :obj:`pkgcore.resolver.sat`; literals are nonzero ints
+where negative values denote negated variables.
+
+Rather than a generic activity based heuristic, decisions are driven by
+requirements registered by the caller: a requirement is a clause whose
+literals are ordered by preference and which only needs to be satisfied once
+its guarding variable is true. The solver satisfies active requirements in
+the order they were activated using their most preferred unassigned literal,
+and finally assigns all untouched variables to false. This keeps solutions
+minimal and in line with the caller's preferences while conflict analysis,
+clause learning, and non-chronological backjumping keep it complete.
+"""
+
+__all__ = ("cdcl_solver",)
+
+from collections import defaultdict
+
+
+class cdcl_solver:
+
+    def __init__(self):
+        self.nvars = 0
+        self.conflicts = 0
+        self.decisions = 0
+        self._clauses = []
+        self._watches = defaultdict(list)
+        self._values = [None]
+        self._levels = [None]
+        self._reasons = [None]
+        self._trail = []
+        self._trail_lim = []
+        self._qhead = 0
+        self._units = []
+        self._unsat = False
+        # requirements that are always active
+        self._roots = []
+        # requirements activated by the positive literal of their guard
+        self._requires = defaultdict(list)
+        # requirements only looked at once all others are satisfied
+        self._last = []
+        self._pos = (0, 0, 0, 0, 1)
+
+    def new_var(self):
+        """Allocate a new variable."""
+        self.nvars += 1
+        self._values.append(None)
+        self._levels.append(None)
+        self._reasons.append(None)
+        return self.nvars
+
+    def add_clause(self, lits):
+        """Add a hard constraint."""
+        lits = list(dict.fromkeys(lits))
+        if any(-x in lits for x in lits):
+            # tautology
+            return
+        if not lits:
+            self._unsat = True
+        elif len(lits) == 1:
+            self._units.append(lits[0])
+        else:
+            self._attach(lits)
+
+    def require(self, lits, var=None, last=False):
+        """Add a requirement, satisfied via the first possible literal.
+
+        :param var: guarding variable, if set the requirement is only active
+            while it's true
+        :param last: only consider the requirement after all others are satisfied
+        """
+        lits = list(lits)
+        if var is None:
+            self.add_clause(lits)
+            (self._last if last else self._roots).append(lits)
+        else:
+            self.add_clause([-var] + lits)
+            self._requires[var].append(lits)
+
+    def value(self, lit):
+        """Return the value of a literal, None if it's unassigned."""
+        v = self._values[abs(lit)]
+        if v is None or lit > 0:
+            return v
+        return not v
+
+    def _attach(self, lits):
+        idx = len(self._clauses)
+        self._clauses.append(lits)
+        self._watches[lits[0]].append(idx)
+        self._watches[lits[1]].append(idx)
+        return idx
+
+    @property
+    def _level(self):
+        return len(self._trail_lim)
+
+    def _enqueue(self, lit, reason=None):
+        var = abs(lit)
+        self._values[var] = lit > 0
+        self._levels[var] = self._level
+        self._reasons[var] = reason
+        self._trail.append(lit)
+
+    def _propagate(self):
+        """Run unit propagation, returning the index of a conflicting clause."""
+        values = self._values
+        clauses = self._clauses
+        while self._qhead < len(self._trail):
+            false_lit = -self._trail[self._qhead]
+            self._qhead += 1
+            watchers = self._watches[false_lit]
+            i = j = 0
+            while i < len(watchers):
+                idx = watchers[i]
+                i += 1
+                c = clauses[idx]
+                if c[0] == false_lit:
+                    c[0], c[1] = c[1], c[0]
+                first = c[0]
+                v = values[abs(first)]
+                if v is not None and v == (first > 0):
+                    watchers[j] = idx
+                    j += 1
+                    continue
+                for k in range(2, len(c)):
+                    lit = c[k]
+                    v = values[abs(lit)]
+                    if v is None or v == (lit > 0):
+                        c[1], c[k] = lit, c[1]
+                        self._watches[lit].append(idx)
+                        break
+                else:
+                    watchers[j] = idx
+                    j += 1
+                    if self.value(first) is False:
+                        # conflict, keep the remaining watchers
+                        watchers[j:] = watchers[i:]
+                        return idx
+                    self._enqueue(first, idx)
+            del watchers[j:]
+        return None
+
+    def _analyze(self, idx):
+        """Derive the first UIP clause for a conflict and its backjump level."""
+        seen = set()
+        learnt = [None]
+        counter = 0
+        lit = None
+        pos = len(self._trail) - 1
+        level = self._level
+        while True:
+            for q in self._clauses[idx]:
+                var = abs(q)
+                if var in seen or (lit is not None and var == abs(lit)):
+                    continue
+                if self._levels[var] > 0:
+                    seen.add(var)
+                    if self._levels[var] == level:
+                        counter += 1
+                    else:
+                        learnt.append(q)
+            while abs(self._trail[pos]) not in seen:
+                pos -= 1
+            lit = self._trail[pos]
+            pos -= 1
+            counter -= 1
+            if not counter:
+                break
+            idx = self._reasons[abs(lit)]
+        learnt[0] = -lit
+        if len(learnt) == 1:
+            return learnt, 0
+        # watch the literal assigned last after the asserting one
+        i = max(range(1, len(learnt)), key=lambda x: self._levels[abs(learnt[x])])
+        learnt[1], learnt[i] = learnt[i], learnt[1]
+        return learnt, self._levels[abs(learnt[1])]
+
+    def _backjump(self, level):
+        start, self._pos = self._trail_lim[level]
+        for lit in self._trail[start:]:
+            var = abs(lit)
+            self._values[var] = self._levels[var] = self._reasons[var] = None
+        del self._trail[start:]
+        del self._trail_lim[level:]
+        self._qhead = len(self._trail)
+
+    def _first_open(self, lits):
+        """Return the preferred literal to satisfy a requirement with, if needed."""
+        candidate = None
+        for lit in lits:
+            v = self.value(lit)
+            if v:
+                return None
+            elif v is None and candidate is None:
+                candidate = lit
+        return candidate
+
+    def _decision(self):
+        roots, trail, req, last, var = self._pos
+        try:
+            while roots < len(self._roots):
+                lit = self._first_open(self._roots[roots])
+                if lit is not None:
+                    return lit
+                roots += 1
+            while trail < len(self._trail):
+                reqs = self._requires.get(self._trail[trail], ())
+                while req < len(reqs):
+                    lit = self._first_open(reqs[req])
+                    if lit is not None:
+                        return lit
+                    req += 1
+                trail += 1
+                req = 0
+            while last < len(self._last):
+                lit = self._first_open(self._last[last])
+                if lit is not None:
+                    return lit
+                last += 1
+            while var <= self.nvars:
+                if self._values[var] is None:
+                    return -var
+                var += 1
+            return None
+        finally:
+            self._pos = (roots, trail, req, last, var)
+
+    def solve(self):
+        """Search for a satisfying assignment.
+
+        :return: True if one was found, False if the problem is unsatisfiable
+        """
+        if self._unsat:
+            return False
+        for lit in self._units:
+            v = self.value(lit)
+            if v is False:
+                return False
+            elif v is None:
+                self._enqueue(lit)
+
+        while True:
+            idx = self._propagate()
+            if idx is not None:
+                self.conflicts += 1
+                if not self._level:
+                    return False
+                learnt, level = self._analyze(idx)
+                self._backjump(level)
+                if len(learnt) == 1:
+                    self._enqueue(learnt[0])
+                else:
+                    self._enqueue(learnt[0], self._attach(learnt))
+                continue
+            lit = self._decision()
+            if lit is None:
+                return True
+            self.decisions += 1
+            self._trail_lim.append((len(self._trail), self._pos))
+            self._enqueue(lit)
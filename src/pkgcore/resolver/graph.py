@@ -0,0 +1,181 @@
+"""
+dependency graph of a resolved plan
+
+The resolver only yields a flat ordered list of ops; this rebuilds the
+dependencies between them, labeled by the dependency class pulling them in,
+so the plan can be exported or scheduled in parallel.
+"""
+
+__all__ = ("merge_graph",)
+
+import json
+
+from snakeoil.klass import jit_attr
+
+# dep attrs mapped to the dependency class they're labeled with
+dep_classes = (
+    ('bdepend', 'build'),
+    ('depend', 'build'),
+    ('rdepend', 'runtime'),
+    ('pdepend', 'post'),
+)
+
+
+class merge_graph:
+    """Dependency graph of the ops of a resolved plan.
+
+    Edges point from an op to the op providing one of its deps. Deps that are
+    satisfied by installed pkgs are left out. Build and runtime deps are
+    ordering constraints as long as the plan orders the dep first, while
+    post deps and the back edges of dep cycles the resolver broke aren't.
+
+    :param ops: resolved ops in plan order, e.g. from
+        :obj:`pkgcore.resolver.state.plan_state.ops`
+    :ivar ops: tuple of ops
+    :ivar edges: list of (op index, dep op index, dep class, dep atom) tuples
+    """
+
+    def __init__(self, ops):
+        self.ops = tuple(ops)
+        self.edges = []
+        self._deps = [[] for _ in self.ops]
+
+        providers = {}
+        for i, op in enumerate(self.ops):
+            if op.desc != 'remove':
+                providers.setdefault(op.pkg.key, []).append(i)
+
+        for i, op in enumerate(self.ops):
+            if op.desc == 'remove' or not op.choices:
+                continue
+            seen = set()
+            for attr, dep_class in dep_classes:
+                for solutions in getattr(op.choices, attr):
+                    provider = self._provider(providers, solutions, i)
+                    if provider is None:
+                        continue
+                    j, dep = provider
+                    if (j, dep_class) in seen:
+                        continue
+                    seen.add((j, dep_class))
+                    self.edges.append((i, j, dep_class, dep))
+                    self._deps[i].append((j, dep_class))
+
+    def _provider(self, providers, solutions, i):
+        """Find the op satisfying a dep, trying its alternatives in order."""
+        for dep in solutions:
+            if getattr(dep, 'blocks', False):
+                continue
+            for j in providers.get(dep.key, ()):
+                if j != i and dep.match(self.ops[j].pkg):
+                    return j, dep
+        return None
+
+    def __len__(self):
+        return len(self.ops)
+
+    def deps(self, i, dep_classes=None):
+        """Return the indexes of the ops an op depends on.
+
+        :param i: op index
+        :param dep_classes: optional container of dep classes to limit to
+        """
+        return [j for j, dep_class in self._deps[i]
+                if dep_classes is None or dep_class in dep_classes]
+
+    def ordering_deps(self, i):
+        """Return the indexes of the ops that have to be merged before an op."""
+        return [j for j, dep_class in self._deps[i]
+                if dep_class != 'post' and j < i]
+
+    @jit_attr
+    def levels(self):
+        """Topological level of each op.
+
+        Ops on the same level don't depend on each other and can be built in
+        parallel once all lower levels are merged.
+        """
+        levels = []
+        for i in range(len(self.ops)):
+            levels.append(max((levels[j] + 1 for j in self.ordering_deps(i)), default=0))
+        return tuple(levels)
+
+    def critical_path(self, weight=None):
+        """Return the longest chain of ordering dependencies.
+
+        :param weight: optional callable returning the cost of an op such as
+            its estimated build time, defaults to 1 for every op
+        :return: tuple of the path cost and list of op indexes on it, from the
+            first op to merge to the last
+        """
+        if not self.ops:
+            return 0, []
+        costs = []
+        preds = []
+        for i, op in enumerate(self.ops):
+            cost = 1 if weight is None else weight(op)
+            pred = max(self.ordering_deps(i), key=costs.__getitem__, default=None)
+            if pred is not None:
+                cost += costs[pred]
+            costs.append(cost)
+            preds.append(pred)
+        i = max(range(len(costs)), key=costs.__getitem__)
+        total = costs[i]
+        path = []
+        while i is not None:
+            path.append(i)
+            i = preds[i]
+        path.reverse()
+        return total, path
+
+    def _node(self, i):
+        op = self.ops[i]
+        node = {
+            'id': i,
+            'op': op.desc,
+            'pkg': op.pkg.cpvstr,
+            'repo': op.pkg.repo.repo_id,
+            'level': self.levels[i],
+        }
+        if op.desc == 'replace':
+            node['old_pkg'] = op.old_pkg.cpvstr
+        return node
+
+    def to_dict(self):
+        """Return the graph as a JSON serializable dict."""
+        length, path = self.critical_path()
+        return {
+            'nodes': [self._node(i) for i in range(len(self.ops))],
+            'edges': [
+                {'op': i, 'dep': j, 'class': dep_class, 'atom': str(dep)}
+                for i, j, dep_class, dep in self.edges],
+            'levels': max(self.levels, default=-1) + 1,
+            'critical_path': {'length': length, 'ops': path},
+        }
+
+    def to_json(self):
+        """Return the graph in JSON format."""
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_dot(self):
+        """Return the graph in graphviz DOT format.
+
+        Edges point from deps to the ops depending on them, post deps are
+        dashed and the critical path is drawn in bold.
+        """
+        _length, path = self.critical_path()
+        critical = set(zip(path, path[1:]))
+        lines = ['digraph merge_plan {', '  rankdir=LR;']
+        for i in range(len(self.ops)):
+            node = self._node(i)
+            label = f"{node['op']}: {node['pkg']}\\nlevel {node['level']}"
+            lines.append(f'  {i} [label="{label}"];')
+        for i, j, dep_class, dep in self.edges:
+            attrs = [f'label="{dep_class}"']
+            if dep_class == 'post':
+                attrs.append('style=dashed')
+            elif (j, i) in critical:
+                attrs.append('style=bold')
+            lines.append(f"  {j} -> {i} [{', '.join(attrs)}];")
+        lines.append('}')
+        return '\n'.join(lines)
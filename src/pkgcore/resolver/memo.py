@@ -0,0 +1,161 @@
+"""
+persistent memo of resolved atoms
+
+Records top level atoms whose dependency graph resolved solely to installed
+packages, along with the package keys visited during their resolution and the
+packages and blockers it inserted into the resolver state. Subsequent runs
+insert the recorded packages and blockers instead of resolving these atoms as
+long as the packages available for each visited key are unchanged and the
+same resolver configuration is in use.
+"""
+
+__all__ = ("resolver_memo", "path_stamps")
+
+import hashlib
+import json
+import os
+
+from snakeoil.fileutils import AtomicWriteFile
+from snakeoil.osutils import ensure_dirs
+
+from ..ebuild.atom import atom as _atom
+from ..log import logger
+
+
+def _stat_stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def path_stamps(paths):
+    """Generate stamps for the files under the given paths.
+
+    Directories are walked recursively, nonexistent paths are included with
+    an empty stamp so their creation is noticed.
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path, _stat_stamp(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for f in sorted(files):
+                p = os.path.join(root, f)
+                yield p, _stat_stamp(p)
+
+
+def _pkg_stamp(pkg):
+    """Stamp identifying the current on-disk state of a package."""
+    try:
+        path = pkg.path
+    except (AttributeError, EnvironmentError):
+        path = None
+    return (
+        getattr(pkg.repo, 'repo_id', None), pkg.cpvstr,
+        _stat_stamp(path) if path is not None else None)
+
+
+class resolver_memo:
+    """Persistent record of atoms settled by installed packages.
+
+    :param path: file the memo is stored in
+    :param fingerprint: string identifying the configuration (domain
+        settings, profile, resolver options, etc) entries are valid for, any
+        changes to it invalidate all existing entries
+    """
+
+    version = 2
+
+    def __init__(self, path, fingerprint=''):
+        self.path = path
+        self.fingerprint = fingerprint
+        self._entries = {}
+        self._key_stamps = {}
+        self.hits = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, restrict):
+        return str(restrict) in self._entries
+
+    def load(self):
+        """Load existing entries, returning True if the memo was usable."""
+        self._entries = {}
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (EnvironmentError, ValueError) as e:
+            logger.warning(f'ignoring invalid resolver memo {self.path!r}: {e}')
+            return False
+        if not isinstance(data, dict) or data.get('version') != self.version or \
+                data.get('fingerprint') != self.fingerprint:
+            return False
+        self._entries = data.get('atoms', {})
+        return True
+
+    def write(self):
+        """Write the memo to disk."""
+        ensure_dirs(os.path.dirname(self.path), mode=0o755, minimal=True)
+        with AtomicWriteFile(self.path) as f:
+            json.dump({
+                'version': self.version,
+                'fingerprint': self.fingerprint,
+                'atoms': self._entries,
+            }, f, sort_keys=True)
+
+    def _stamp(self, dbs, keys):
+        chf = hashlib.sha1()
+        for key in sorted(keys):
+            stamp = self._key_stamps.get(key)
+            if stamp is None:
+                restrict = _atom(key)
+                stamp = self._key_stamps[key] = sorted(
+                    _pkg_stamp(pkg) for db in dbs for pkg in db.itermatch(restrict))
+            chf.update(repr((key, stamp)).encode())
+        return chf.hexdigest()
+
+    def settled(self, restrict, dbs):
+        """Determine if a previous resolution of an atom is still valid.
+
+        :param dbs: repos the packages of the resolution are pulled from
+        :return: tuple of the cpv strings of the packages the resolution
+            inserted and pairs of the cpv string of a package and a blocker
+            it inserted, None if there's no valid resolution
+        """
+        entry = self._entries.get(str(restrict))
+        if entry is None:
+            return None
+        if entry['stamp'] != self._stamp(dbs, entry['keys']):
+            del self._entries[str(restrict)]
+            return None
+        self.hits += 1
+        return entry['pkgs'], [tuple(x) for x in entry['blockers']]
+
+    def record(self, restrict, dbs, keys, pkgs=(), blockers=()):
+        """Record an atom as settled by the installed packages for the given keys.
+
+        :param pkgs: cpv strings of the installed packages inserted
+        :param blockers: pairs of the cpv string of an installed package and
+            a blocker string it inserted
+        """
+        keys = sorted(set(keys))
+        self._entries[str(restrict)] = {
+            'keys': keys,
+            'stamp': self._stamp(dbs, keys),
+            'pkgs': list(pkgs),
+            'blockers': [list(x) for x in blockers],
+        }
+
+    def discard(self, restrict):
+        """Drop the entry for an atom if it exists."""
+        self._entries.pop(str(restrict), None)
+
+    def invalidate(self):
+        """Forget cached package stamps, e.g. after the vdb was modified."""
+        self._key_stamps.clear()
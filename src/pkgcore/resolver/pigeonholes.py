@@ -1,19 +1,44 @@
 __all__ = ("PigeonHoledSlots",)
 
+from ..ebuild.atom import atom as _atom
 from ..restrictions import restriction
 
 # lil too getter/setter like for my tastes...
 
 
+def _atom_kind(atom, key):
+    """Classify an atom by the restrictions it applies on top of its key.
+
+    :return: tuple of the slot the atom is limited to (None if unslotted) and
+        whether matching objs of that key and slot requires calling match()
+    """
+    if not isinstance(atom, _atom) or atom.key != key:
+        return None, True
+    exact = atom.fullver is None and atom.use is None and \
+        atom.repo_id is None and atom.subslot is None
+    return atom.slot, not exact
+
+
 class PigeonHoledSlots:
     """class for tracking slotting to a specific atom/obj key
     no atoms present, just prevents conflicts of obj.key; atom present, assumes
     it's a blocker and ensures no obj matches the atom for that key
+
+    Objs are additionally indexed by (key, slot) while limiters are
+    partitioned by the slot they're restricted to, so slot conflicts and
+    plain or slotted atoms are resolved without scanning every obj or
+    limiter of a key.
     """
 
     def __init__(self):
         self.slot_dict = {}
         self.limiters = {}
+        # (key, slot) -> objs
+        self._slots = {}
+        # (key, slot) -> limiters, slot is None for limiters matching any
+        # slot; exact limiters match all objs in their bucket
+        self._exact_limiters = {}
+        self._match_limiters = {}
 
     def fill_slotting(self, obj, force=False):
         """Try to insert obj in.
@@ -23,24 +48,30 @@ class PigeonHoledSlots:
 
         l = self.check_limiters(obj)
 
-        key = obj.key
-        dslot = obj.slot
-        l.extend(x for x in self.slot_dict.get(key, ()) if x.slot == dslot)
+        slot_key = (obj.key, obj.slot)
+        l.extend(self._slots.get(slot_key, ()))
 
         if not l or force:
-            self.slot_dict.setdefault(key, []).append(obj)
+            self.slot_dict.setdefault(obj.key, []).append(obj)
+            self._slots.setdefault(slot_key, []).append(obj)
         return l
 
     def get_conflicting_slot(self, pkg):
-        for x in self.slot_dict.get(pkg.key, ()):
-            if pkg.slot == x.slot:
-                return x
+        for x in self._slots.get((pkg.key, pkg.slot), ()):
+            return x
         return None
 
     def find_atom_matches(self, atom, key=None):
         if key is None:
             key = atom.key
-        return list(filter(atom.match, self.slot_dict.get(key, ())))
+        slot, needs_match = _atom_kind(atom, key)
+        if slot is None:
+            candidates = self.slot_dict.get(key, ())
+        else:
+            candidates = self._slots.get((key, slot), ())
+        if needs_match:
+            return list(filter(atom.match, candidates))
+        return list(candidates)
 
     def add_limiter(self, atom, key=None):
         """add a limiter, returning any conflicting objs"""
@@ -52,12 +83,34 @@ class PigeonHoledSlots:
         if key is None:
             key = atom.key
         self.limiters.setdefault(key, []).append(atom)
+        d, bucket = self._limiter_bucket(atom, key)
+        d.setdefault(bucket, []).append(atom)
         return self.find_atom_matches(atom, key=key)
 
     def check_limiters(self, obj):
         """return any limiters conflicting w/ the passed in obj"""
         key = obj.key
-        return [x for x in self.limiters.get(key, ()) if x.match(obj)]
+        l = []
+        buckets = ((key, None), (key, obj.slot)) if obj.slot is not None else ((key, None),)
+        for bucket in buckets:
+            l.extend(self._exact_limiters.get(bucket, ()))
+            l.extend(x for x in self._match_limiters.get(bucket, ()) if x.match(obj))
+        return l
+
+    def _limiter_bucket(self, atom, key):
+        """Return the limiter index and its key an atom is stored under."""
+        slot, needs_match = _atom_kind(atom, key)
+        d = self._match_limiters if needs_match else self._exact_limiters
+        return d, (key, slot)
+
+    @staticmethod
+    def _remove(d, key, obj):
+        """Remove an obj from a list in a dict, dropping the list if it's empty."""
+        l = [x for x in d[key] if x is not obj]
+        if l:
+            d[key] = l
+        else:
+            del d[key]
 
     def remove_slotting(self, obj):
         key = obj.key
@@ -70,6 +123,7 @@ class PigeonHoledSlots:
             self.slot_dict[key] = l
         else:
             del self.slot_dict[key]
+        self._remove(self._slots, (key, obj.slot), obj)
 
     def remove_limiter(self, atom, key=None):
         if key is None:
@@ -81,6 +135,7 @@ class PigeonHoledSlots:
             del self.limiters[key]
         else:
             self.limiters[key] = l
+        self._remove(*self._limiter_bucket(atom, key), atom)
 
     def __contains__(self, obj):
         if isinstance(obj, restriction.base):
@@ -118,7 +118,7 @@ class resolver_frame:
 
     __slots__ = ("parent", "atom", "choices", "mode", "start_point", "dbs",
         "depth", "drop_cycles", "__weakref__", "ignored", "vdb_limited",
-        "events", "succeeded")
+        "events", "succeeded", "conflict_points")
 
     def __init__(self, parent, mode, atom, choices, dbs, start_point, depth,
                  drop_cycles, ignored=False, vdb_limited=False):
@@ -135,6 +135,25 @@ class resolver_frame:
         self.vdb_limited = vdb_limited
         self.events = []
         self.succeeded = None
+        # plan positions of the ops responsible for failures in this frame
+        self.conflict_points = set()
+
+    @property
+    def conflict_point(self):
+        """Most recent plan position responsible for failures, if any."""
+        if not self.conflict_points:
+            return None
+        return max(self.conflict_points)
+
+    def add_conflict(self, points):
+        """Record the plan positions of the culprits of a failure.
+
+        :param points: iterable of plan positions, None if the failure
+            couldn't be attributed in which case the frame itself is the culprit
+        """
+        if points is None:
+            points = (self.start_point,)
+        self.conflict_points.update(points)
 
     def reduce_solutions(self, nodes):
         if isinstance(nodes, (list, tuple)):
@@ -214,6 +233,9 @@ class resolver_stack(deque):
         frame = self.pop()
         frame.succeeded = bool(result)
         frame.parent.events.append(frame)
+        if not result and frame.conflict_points and self:
+            # failures of a child are failures of the parent's current choice
+            self[-1].add_conflict(frame.conflict_points)
 
     def slot_cycles(self, trg_frame, **kwds):
         pkg = trg_frame.current_pkg
@@ -251,7 +273,8 @@ class merge_plan:
 
     def __init__(self, dbs, per_repo_strategy, global_strategy=None,
                  depset_reorder_strategy=None, process_built_depends=False,
-                 drop_cycles=False, debug=False, debug_handle=None):
+                 drop_cycles=False, debug=False, debug_handle=None, memo=None,
+                 stats=None, prefetch=None):
         if debug:
             if debug_handle is None:
                 debug_handle = sys.stdout
@@ -281,17 +304,28 @@ class merge_plan:
                 for x in self.all_raw_dbs if x.livefs])
 
         self.insoluble = set()
+        # atoms known to fail while the plan up to a given op is unchanged
+        self.nogoods = {}
+        self.backjumps = 0
         self.vdb_preloaded = False
         self._ensure_livefs_is_loaded = \
             self._ensure_livefs_is_loaded_nonpreloaded
         self.drop_cycles = drop_cycles
         self.process_built_depends = process_built_depends
+        # optional :obj:`pkgcore.resolver.memo.resolver_memo` instance
+        self.memo = memo
         self._debugging = debug
         if debug:
             self._rec_add_atom = partial(self._stack_debugging_rec_add_atom,
                 self._rec_add_atom)
             self._debugging_depth = 0
             self._debugging_drop_cycles = False
+        # optional :obj:`pkgcore.resolver.prefetch.metadata_prefetcher` instance
+        self.prefetch = prefetch
+        # optional :obj:`pkgcore.resolver.stats.resolver_stats` instance
+        self.stats = stats
+        if stats is not None:
+            self._rec_add_atom = partial(stats.rec_add_atom, self._rec_add_atom)
 
     @property
     def forced_restrictions(self):
@@ -345,29 +379,92 @@ class merge_plan:
             (t_viable.ljust(13), "  "*stack.depth, atom, s, t_msg))
         stack.add_event(("viable", viable, pre_solved, atom, msg))
 
-    def load_vdb_state(self):
-        for pkg in self.livefs_dbs:
-            self._dprint("inserting %s", (pkg,), "vdb")
-            ret = self.add_atom(pkg.versioned_atom)
-            self._dprint("insertion of %s: %s", (pkg, ret), "vdb")
-            if ret:
-                raise Exception(
-                    "couldn't load vdb state, %s %s" %
-                    (pkg.versioned_atom, ret))
+    def load_vdb_state(self, bulk=False):
+        """Insert all installed pkgs into the resolver state.
+
+        :param bulk: instead of resolving every installed pkg in turn, insert
+            them and their blockers as is in a single pass, assuming their
+            deps are already satisfied. Blockers are read from the reverse
+            dependency index of the vdb when available, avoiding parsing the
+            deps of every installed pkg. Blockers conflicting with other
+            installed pkgs are skipped.
+        """
+        # memo entries only record the pkgs and blockers an atom inserted
+        # into the state, with the full graph loaded there wouldn't be any
+        self.memo = None
+        if bulk:
+            self._bulk_load_vdb_state()
+        else:
+            for pkg in self.livefs_dbs:
+                self._dprint("inserting %s", (pkg,), "vdb")
+                ret = self.add_atom(pkg.versioned_atom)
+                self._dprint("insertion of %s: %s", (pkg, ret), "vdb")
+                if ret:
+                    raise Exception(
+                        "couldn't load vdb state, %s %s" %
+                        (pkg.versioned_atom, ret))
         self.vdb_preloaded = True
         self._ensure_livefs_is_loaded = \
             self._ensure_livefs_is_loaded_preloaded
 
+    def _vdb_blockers(self, pkg):
+        """Return the blockers of an installed pkg the resolver would insert."""
+        attrs = ['rdepend', 'pdepend']
+        if self.process_built_depends:
+            attrs.extend(('depend', 'bdepend'))
+        # the index includes blockers nested in any-of groups, so it's only
+        # used to skip pkgs without blockers which is the common case
+        index = getattr(pkg.repo, 'revdep_index', None)
+        if (index is not None and pkg.cpvstr in index and
+                not index.blockers(pkg.cpvstr, attrs)):
+            return []
+        return [
+            solutions[0] for attr in attrs
+            for solutions in getattr(pkg, attr).cnf_solutions()
+            if len(solutions) == 1 and solutions[0].blocks]
+
+    def _bulk_load_vdb_state(self):
+        snapshot = [
+            (choice_point(pkg.versioned_atom, [pkg]), pkg, self._vdb_blockers(pkg))
+            for pkg in self.livefs_dbs]
+        # all pkgs are slotted before any blockers exist so no limiters have
+        # to be checked while filling slots
+        for choices, pkg, _blockers in snapshot:
+            state.add_op(choices, pkg, force=True).apply(self.state)
+        for choices, pkg, blockers in snapshot:
+            for blocker in blockers:
+                mangled = self.generate_mangled_blocker(choices, blocker)
+                l = self.state.state.find_atom_matches(mangled, key=blocker.key)
+                if l:
+                    self._dprint(
+                        "skipping blocker %s of %s, conflicts w/ %s",
+                        (blocker, pkg, l), "vdb")
+                    continue
+                self.state.add_blocker(choices, mangled, key=blocker.key)
+
     def add_atoms(self, restricts, finalize=False):
         if restricts:
             stack = resolver_stack()
             for restrict in restricts:
                 state.add_hardref_op(restrict).apply(self.state)
+            if self.prefetch is not None:
+                self.prefetch(restricts)
             dbs = self.default_dbs
+            memo = self.memo
             for restrict in restricts:
+                if memo is not None:
+                    settled = memo.settled(restrict, self.all_raw_dbs)
+                    if settled is not None and self._replay_memoized(*settled):
+                        self._dprint("memoized     %s", (restrict,))
+                        continue
+                start_point, start_event = self.state.current_state, len(stack.events)
                 ret = self._add_atom(restrict, stack, dbs)
                 if ret:
+                    if memo is not None:
+                        memo.discard(restrict)
                     return ret
+                if memo is not None:
+                    self._memoize(restrict, stack.events[start_event:], start_point)
         if finalize:
             # note via this being outside the recursion, backtracking
             # is excluded... inline it somehow.
@@ -377,6 +474,88 @@ class merge_plan:
     def process_finalize(self):
         pass
 
+    def _memoize(self, restrict, events, start_point):
+        """Record an atom in the memo if it was satisfied by installed pkgs.
+
+        :param events: events generated while resolving the atom
+        :param start_point: plan state prior to resolving the atom
+        """
+        ops = self.state.plan[start_point:]
+        if any(not op.internal and (op.desc != 'add' or not op.pkg.repo.livefs)
+               for op in ops):
+            self.memo.discard(restrict)
+            return
+        keys = {op.key for op in ops if isinstance(op, state.blocker_base_op)}
+        added = {op.pkg for op in ops if op.desc == 'add'}
+        blockers = []
+        for op in ops:
+            if isinstance(op, state.incref_forward_block_op):
+                blocker = op.blocker
+                if not isinstance(blocker, _atom.atom):
+                    # unwrap blockers mangled to not block their owner
+                    blocker = blocker.restrictions[0]
+                blockers.append((op.choices.current_pkg.cpvstr, str(blocker)))
+        frames = [x for x in events if isinstance(x, resolver_frame)]
+        while frames:
+            frame = frames.pop()
+            pkg = frame.current_pkg
+            if pkg is not None and (not pkg.repo.livefs or (
+                    pkg not in added and any(
+                        x[0] == 'viable' and x[2] for x in frame.events
+                        if isinstance(x, tuple)))):
+                # pre-solved by a pkg pulled in while resolving another atom,
+                # its deps weren't visited as part of this atom
+                self.memo.discard(restrict)
+                return
+            key = getattr(frame.atom, 'key', None)
+            if key is not None:
+                keys.add(key)
+            frames.extend(x for x in frame.events if isinstance(x, resolver_frame))
+        self.memo.record(
+            restrict, self.all_raw_dbs, keys,
+            pkgs=[op.pkg.cpvstr for op in ops if op.desc == 'add'],
+            blockers=blockers)
+
+    def _replay_memoized(self, pkgs, blockers):
+        """Insert the recorded resolution of a memoized atom into the state.
+
+        :param pkgs: cpv strings of the installed pkgs to insert
+        :param blockers: pairs of the cpv string of an installed pkg and a
+            blocker string to insert for it
+        :return: True if everything was inserted, False if any pkg is missing
+            or conflicts with the state, which is then left untouched
+        """
+        start_point = self.state.current_state
+        inserted = {}
+        for cpvstr in pkgs + [x[0] for x in blockers]:
+            if cpvstr in inserted:
+                continue
+            restrict = _atom.atom(f'={cpvstr}')
+            matches = [x for x in self.state.match_atom(restrict) if x.repo.livefs]
+            if not matches:
+                matches = self.livefs_dbs.match(restrict)
+                if not matches:
+                    self.state.backtrack(start_point)
+                    return False
+                choices = choice_point(restrict, matches[:1])
+                if state.add_op(choices, choices.current_pkg).apply(self.state):
+                    self._dprint(
+                        "memoized %s conflicts, resolving", (cpvstr,), "memo")
+                    self.state.backtrack(start_point)
+                    return False
+            inserted[cpvstr] = matches[0]
+        for cpvstr, blocker in blockers:
+            blocker = _atom.atom(blocker)
+            choices = self.state.pkg_choices[inserted[cpvstr]]
+            mangled = self.generate_mangled_blocker(choices, blocker)
+            if self.state.add_blocker(choices, mangled, key=blocker.key):
+                self._dprint(
+                    "memoized blocker %s of %s hit, resolving",
+                    (blocker, cpvstr), "memo")
+                self.state.backtrack(start_point)
+                return False
+        return True
+
     def add_atom(self, atom):
         """add an atom, recalculating as necessary.
 
@@ -469,7 +648,11 @@ class merge_plan:
 
             self.notify_trying_choice(stack, atom, choices)
 
-            if not choices.current_pkg.built or self.process_built_depends:
+            build_deps = not choices.current_pkg.built or self.process_built_depends
+            if self.prefetch is not None:
+                self._prefetch_deps(choices, build_deps)
+
+            if build_deps:
                 new_additions, failures = self.process_dependencies_and_blocks(
                     stack, choices, 'depend', atom, depth)
                 if failures:
@@ -502,6 +685,7 @@ class merge_plan:
                 self.notify_choice_failed(
                     stack, atom, choices,
                     "failed inserting: %s", l)
+                stack.current_frame.add_conflict(self.state.culprit_points(l))
                 self.state.backtrack(stack.current_frame.start_point)
                 choices.force_next_pkg()
                 continue
@@ -534,9 +718,46 @@ class merge_plan:
             if not l:
                 stack.pop_frame(True)
                 return None
+        self._record_nogood(stack.current_frame)
         stack.pop_frame(False)
         return [atom] + failures
 
+    def _prefetch_deps(self, choices, build_deps):
+        """Start loading the metadata of the deps of the current choice."""
+        depsets = [choices.rdepend, choices.pdepend]
+        if build_deps:
+            depsets[0:0] = [choices.depend, choices.bdepend]
+        self.prefetch(chain.from_iterable(chain.from_iterable(depsets)))
+
+    def _record_nogood(self, frame):
+        """Remember a failed atom if it only conflicted with earlier choices.
+
+        Retrying the atom is pointless while all of its culprits are in
+        effect, so any frames in between fail immediately instead of
+        exhaustively retrying their choices.
+        """
+        points = frame.conflict_points
+        if points and max(points) < frame.start_point:
+            plan = self.state.plan
+            self.nogoods[(frame.atom, frame.vdb_limited)] = tuple(
+                (point, plan[point]) for point in sorted(points))
+
+    def _nogood(self, atom, limit_to_vdb):
+        """Return the culprit positions if an atom is known to fail.
+
+        Nogoods are dropped once any of their culprits is backtracked over,
+        replaced, or removed.
+        """
+        key = (atom, limit_to_vdb)
+        nogood = self.nogoods.get(key)
+        if nogood is None:
+            return None
+        in_effect = self.state.in_effect
+        if all(in_effect(point, op) for point, op in nogood):
+            return tuple(point for point, _op in nogood)
+        del self.nogoods[key]
+        return None
+
     def _viable(self, stack, mode, atom, dbs, drop_cycles, limit_to_vdb):
         """
         internal function to discern if an atom is viable, returning
@@ -554,7 +775,7 @@ class merge_plan:
         :return: 3 possible; None (not viable), True (presolved),
           :obj:`caching_iter` (not solved, but viable), :obj:`choice_point`
         """
-        choices = ret = None
+        choices = ret = nogood = None
         if atom in self.insoluble:
             ret = ((False, "globally insoluble"),{})
             matches = ()
@@ -562,6 +783,9 @@ class merge_plan:
             matches = self.state.match_atom(atom)
             if matches:
                 ret = ((True,), {"pre_solved":True})
+            elif (nogood := self._nogood(atom, limit_to_vdb)) is not None:
+                self.backjumps += 1
+                ret = ((False, "conflicts with earlier choices"), {})
             else:
                 # not in the plan thus far.
                 matches = caching_iter(dbs.itermatch(atom))
@@ -580,11 +804,16 @@ class merge_plan:
         if choices is None:
             choices = choice_point(atom, matches)
 
-        stack.add_frame(mode, atom, choices, dbs,
+        frame = stack.add_frame(mode, atom, choices, dbs,
             self.state.current_state, drop_cycles, vdb_limited=limit_to_vdb)
 
-        if not limit_to_vdb and not matches:
+        if nogood is not None:
+            frame.add_conflict(nogood)
+        elif not limit_to_vdb and not matches:
             self.insoluble.add(atom)
+        elif limit_to_vdb and ret is not None and not ret[0][0]:
+            # vdb matches depend on what the plan replaced so far
+            frame.add_conflict(None)
         if ret is not None:
             self.notify_viable(stack, atom, *ret[0], **ret[1])
             if ret[0][0] == True:
@@ -704,6 +933,7 @@ class merge_plan:
         ret = self.insert_blockers(stack, choices, [blocker])
         if ret is None:
             return []
+        stack.current_frame.add_conflict(self.state.culprit_points(ret[1]))
         self.notify_choice_failed(
             stack, atom, choices,
             "%s blocker: %s conflicts w/ %s", (mode, ret[0], ret[1]))
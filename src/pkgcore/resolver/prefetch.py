@@ -0,0 +1,75 @@
+"""
+resolver metadata prefetching
+
+Dependency metadata of packages is loaded lazily and serially as the resolver
+walks the graph, each uncached package possibly requiring a cache lookup or
+ebuild regeneration. :obj:`metadata_prefetcher` loads the metadata for the
+highest versions of the deps of the choice the resolver is currently trying
+in a thread pool, overlapping it with the resolver's own work.
+"""
+
+__all__ = ("metadata_prefetcher",)
+
+from concurrent.futures import ThreadPoolExecutor
+
+from ..ebuild.atom import atom
+from ..repository.util import get_raw_repos
+
+
+class metadata_prefetcher:
+    """Load package metadata ahead of the resolver in the background.
+
+    :param dbs: repos the resolver pulls packages from, only raw repos
+        supporting metadata prefetching are used
+    :param depth: number of versions to prefetch per package, highest first
+    :param threads: number of worker threads, defaults to the executor's default
+    """
+
+    def __init__(self, dbs, depth=1, threads=None):
+        self.depth = depth
+        self.threads = threads
+        self.repos = []
+        for repo in get_raw_repos(dbs):
+            if getattr(repo, 'prefetch_metadata', None) is not None and \
+                    not any(x is repo for x in self.repos):
+                self.repos.append(repo)
+        self.submitted = 0
+        self._keys = set()
+        self._futures = []
+        self._executor = None
+
+    def __bool__(self):
+        return bool(self.repos) and self.depth > 0
+
+    def __call__(self, atoms):
+        """Prefetch the metadata of packages matching the given atoms.
+
+        Blockers and restrictions not matching a specific package are
+        skipped, as are packages whose metadata was already prefetched.
+        """
+        for restrict in atoms:
+            if not isinstance(restrict, atom) or restrict.blocks or \
+                    restrict.key in self._keys:
+                continue
+            self._keys.add(restrict.key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.threads)
+            for repo in self.repos:
+                futures = repo.prefetch_metadata(
+                    restrict.unversioned_atom, self._executor, limit=self.depth)
+                self.submitted += len(futures)
+                self._futures.extend(futures)
+
+    def shutdown(self):
+        """Cancel queued prefetches and wait for running ones to finish.
+
+        Prefetched metadata that the resolver didn't use is dropped.
+        """
+        for future in self._futures:
+            future.cancel()
+        self._futures = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            for repo in self.repos:
+                repo.clear_primed_metadata()
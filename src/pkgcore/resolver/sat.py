@@ -0,0 +1,347 @@
+"""
+SAT based resolver backend
+
+Encodes package choices, slot occupancy, blockers, and dependencies as a
+boolean problem solved via :obj:`pkgcore.resolver.cdcl.cdcl_solver`, then
+replays the solution through the regular plan state ops so consumers of
+:obj:`pkgcore.resolver.plan.merge_plan` keep working unaltered.
+"""
+
+__all__ = ("sat_merge_plan", "generate_sat_resolver_kls")
+
+import time
+from collections import defaultdict, deque
+from itertools import chain
+
+from . import plan, state
+from .cdcl import cdcl_solver
+from .choice_point import choice_point
+
+
+class _formula:
+    """Boolean encoding of all packages reachable from a set of restrictions."""
+
+    def __init__(self, resolver):
+        self.resolver = resolver
+        self.pkgs = [None]
+        self._vars = {}
+        self._matches = {}
+        self._queue = deque()
+        self._pending_blockers = []
+        # var -> [(mode, lits), ...]
+        self.deps = {}
+        # owner var -> [(guard var, blocker), ...]
+        self.blockers = defaultdict(list)
+        self.slots = defaultdict(list)
+        self.keys = defaultdict(list)
+        self.installed = []
+        self.requirements = []
+
+    def __len__(self):
+        return len(self.pkgs) - 1
+
+    def _new_var(self, pkg=None):
+        self.pkgs.append(pkg)
+        return len(self.pkgs) - 1
+
+    def _var(self, pkg):
+        key = (id(pkg.repo), pkg.cpvstr)
+        var = self._vars.get(key)
+        if var is None:
+            var = self._vars[key] = self._new_var(pkg)
+            self._queue.append(var)
+        return var
+
+    def match(self, restrict, dbs=None):
+        """Return the variables of the pkgs matching a restriction in preference order."""
+        if dbs is None:
+            dbs = self.resolver.default_dbs
+        key = (restrict, id(dbs))
+        matches = self._matches.get(key)
+        if matches is None:
+            matches = self._matches[key] = list(dict.fromkeys(
+                self._var(pkg) for pkg in dbs.itermatch(restrict)))
+        return matches
+
+    def expand(self):
+        """Pull in everything reachable from pkgs added since the last call."""
+        while self._queue or self._pending_blockers:
+            while self._queue:
+                self._expand_pkg(self._queue.popleft())
+            blockers, self._pending_blockers = self._pending_blockers, []
+            for var, owner, blocker in blockers:
+                self._add_blocker(var, owner, blocker)
+
+    def _reorder(self, or_block):
+        # prefer choices already satisfied by installed pkgs
+        if len(or_block) == 1:
+            return or_block
+        livefs = self.resolver.livefs_dbs
+        vdb = [x for x in or_block if not x.blocks and x in livefs]
+        if not vdb:
+            return or_block
+        return vdb + [x for x in or_block if x not in vdb]
+
+    def _expand_pkg(self, var):
+        pkg = self.pkgs[var]
+        self.slots[(pkg.key, pkg.slot)].append(var)
+        self.keys[pkg.key].append(var)
+        if pkg.repo.livefs:
+            self.installed.append(var)
+        else:
+            # installed pkgs occupying the slot get replaced
+            self.match(pkg.slotted_atom, self.resolver.livefs_dbs)
+
+        modes = ['rdepend', 'pdepend']
+        if not pkg.built or self.resolver.process_built_depends:
+            modes[0:0] = ['bdepend', 'depend']
+        deps = self.deps[var] = []
+        prefetch = self.resolver.prefetch
+        for mode in modes:
+            cnf = getattr(pkg, mode).cnf_solutions()
+            if prefetch is not None:
+                prefetch(chain.from_iterable(cnf))
+            for or_block in cnf:
+                lits = []
+                for atom in self._reorder(or_block):
+                    if not atom.blocks:
+                        lits.extend(self.match(atom))
+                    elif len(or_block) == 1:
+                        self._pending_blockers.append((var, var, atom))
+                    else:
+                        aux = self._new_var()
+                        self._pending_blockers.append((aux, var, atom))
+                        lits.append(aux)
+                if lits or len(or_block) != 1 or not or_block[0].blocks:
+                    lits = list(dict.fromkeys(lits))
+                    deps.append((mode, lits))
+                    self.requirements.append((var, lits))
+
+    def _add_blocker(self, var, owner, blocker):
+        livefs = self.resolver.livefs_dbs
+        for installed in self.match(blocker, livefs):
+            # allow replacing installed pkgs that get blocked
+            self.match(self.pkgs[installed].slotted_atom)
+        self.blockers[owner].append((var, blocker))
+
+    def blocked(self, owner, blocker):
+        """Return the variables of known pkgs matched by a blocker."""
+        return [
+            x for x in self.keys.get(blocker.key, ())
+            if x != owner and blocker.match(self.pkgs[x])]
+
+    def solver(self, roots):
+        """Create a solver for the given root restrictions."""
+        solver = cdcl_solver()
+        for _ in range(len(self)):
+            solver.new_var()
+        for root in roots:
+            solver.require(self.match(root))
+        for var, lits in self.requirements:
+            solver.require(lits, var)
+        for slotted in self.slots.values():
+            for i, x in enumerate(slotted):
+                for y in slotted[i + 1:]:
+                    solver.add_clause([-x, -y])
+        for owner, blockers in self.blockers.items():
+            for var, blocker in blockers:
+                for x in self.blocked(owner, blocker):
+                    solver.add_clause([-var, -x])
+        for var in self.installed:
+            pkg = self.pkgs[var]
+            others = [x for x in self.slots[(pkg.key, pkg.slot)] if x != var]
+            # installed pkgs stay unless they get replaced
+            solver.require([var] + others, last=True)
+        return solver
+
+
+class sat_merge_plan(plan.merge_plan):
+    """Resolver solving the dependency graph as a whole via SAT.
+
+    In contrast to the default depth first search with chronological
+    backtracking, all candidates for the requested restrictions and their
+    dependencies are encoded up front, letting conflicts between distant
+    parts of the graph be learned once instead of being rediscovered by
+    exhaustive retries.
+    """
+
+    def __init__(self, *args, **kwds):
+        super().__init__(*args, **kwds)
+        # atoms are always resolved as a whole
+        self.memo = None
+        self._restricts = []
+        self._formula = None
+
+    def reset(self, point=0):
+        super().reset(point)
+        if not point:
+            self._restricts = []
+
+    def load_vdb_state(self, bulk=False):
+        # installed pkgs are always added to the formula as a whole
+        restricts = [pkg.versioned_atom for pkg in self.livefs_dbs]
+        ret = self.add_atoms(restricts)
+        if ret:
+            raise Exception(f"couldn't load vdb state, {ret[0][0]}")
+        self.vdb_preloaded = True
+        self._ensure_livefs_is_loaded = \
+            self._ensure_livefs_is_loaded_preloaded
+
+    def add_atoms(self, restricts, finalize=False):
+        if restricts:
+            start = time.perf_counter()
+            restricts = self._restricts + list(restricts)
+            if self._formula is None:
+                self._formula = _formula(self)
+            formula = self._formula
+            for restrict in restricts:
+                formula.match(restrict)
+            formula.expand()
+
+            solver = formula.solver(restricts)
+            solved = solver.solve()
+            self._dprint(
+                "sat: %i vars, %i decisions, %i conflicts",
+                (solver.nvars, solver.decisions, solver.conflicts))
+            if self.stats is not None:
+                self._record_stats(solver, time.perf_counter() - start)
+            if not solved:
+                return self._failure(restricts)
+            self._restricts = restricts
+            conflict = self._apply(solver, restricts)
+            if conflict is not None:
+                return self._conflict(*conflict)
+        if finalize:
+            self.process_finalize()
+        return ()
+
+    def _record_stats(self, solver, elapsed):
+        stats = self.stats
+        stats.time += elapsed
+        counts = stats.solver
+        counts['solves'] = counts.get('solves', 0) + 1
+        counts['vars'] = solver.nvars
+        for attr in ('decisions', 'conflicts'):
+            counts[attr] = counts.get(attr, 0) + getattr(solver, attr)
+
+    def _failure(self, restricts):
+        """Find the first restriction that makes the problem unsatisfiable."""
+        formula = self._formula
+        for i, restrict in enumerate(restricts):
+            if not formula.solver(restricts[:i + 1]).solve():
+                break
+        stack = plan.resolver_stack()
+        matches = [formula.pkgs[x] for x in formula.match(restrict)]
+        frame = stack.add_frame(
+            'none', restrict, choice_point(restrict, matches), self.default_dbs,
+            self.state.current_state, False)
+        if not matches:
+            self.notify_viable(stack, restrict, False, "no matches")
+        for pkg in matches:
+            frame.events.append(('inspecting', pkg))
+            frame.events.append((
+                'viable', False, False, restrict,
+                'no solution satisfies its dependencies, slots, and blockers'))
+        stack.pop_frame(False)
+        return [restrict], frame
+
+    def _conflict(self, pkg, event):
+        """Report a solution the plan state rejected while replaying it.
+
+        :param pkg: pkg whose insertion or blocker conflicted
+        :param event: failure event describing the conflict
+        """
+        restrict = pkg.versioned_atom
+        stack = plan.resolver_stack()
+        frame = stack.add_frame(
+            'none', restrict, choice_point(restrict, [pkg]), self.default_dbs,
+            self.state.current_state, False)
+        frame.events.append(('inspecting', pkg))
+        frame.events.append(event)
+        stack.pop_frame(False)
+        return [restrict], frame
+
+    def _apply(self, solver, restricts):
+        """Replay a solution into the plan state.
+
+        :return: None on success, otherwise a tuple of the pkg whose insertion
+            or blocker conflicted with the state and the failure event
+        """
+        formula = self._formula
+        pkgs = formula.pkgs
+        selected = {x for x in range(1, len(pkgs)) if pkgs[x] is not None and solver.value(x)}
+        choices = {}
+
+        def first(lits):
+            for x in lits:
+                if x in selected:
+                    return x
+            return None
+
+        # order pkgs so deps come first, post deps after their parents
+        order = []
+        visited = set()
+
+        def visit(var):
+            visited.add(var)
+            post = []
+            for mode, lits in formula.deps[var]:
+                dep = first(lits)
+                if dep is None or dep in visited:
+                    continue
+                if mode == 'pdepend':
+                    post.append(dep)
+                else:
+                    visit(dep)
+            order.append(var)
+            for dep in post:
+                if dep not in visited:
+                    visit(dep)
+
+        for restrict in restricts:
+            var = first(formula.match(restrict))
+            if var not in visited:
+                visit(var)
+        for var in sorted(selected.difference(visited)):
+            visit(var)
+
+        self.state.backtrack(0)
+        for restrict in restricts:
+            state.add_hardref_op(restrict).apply(self.state)
+        for var in order:
+            pkg = pkgs[var]
+            c = choices[var] = choice_point(pkg.versioned_atom, [pkg])
+            if pkg.repo.livefs:
+                state.add_op(c, pkg, force=True).apply(self.state)
+                continue
+            old = [x for x in formula.slots[(pkg.key, pkg.slot)]
+                   if x != var and pkgs[x].repo.livefs]
+            if old:
+                old_pkg = pkgs[old[0]]
+                old_choices = choice_point(old_pkg.slotted_atom, [old_pkg])
+                state.add_op(old_choices, old_pkg, force=True).apply(self.state)
+                conflicts = state.replace_op(c, pkg).apply(self.state)
+            else:
+                conflicts = state.add_op(c, pkg).apply(self.state)
+            if conflicts:
+                return pkg, (
+                    'viable', False, False, pkg.versioned_atom,
+                    'conflicts with %s' % ', '.join(str(x) for x in conflicts))
+        for var in order:
+            for lit, blocker in formula.blockers.get(var, ()):
+                if not solver.value(lit):
+                    # alternative to a blocker in an any-of group was used
+                    continue
+                conflicts = self.state.add_blocker(
+                    choices[var], self.generate_mangled_blocker(choices[var], blocker),
+                    key=blocker.key)
+                if conflicts:
+                    return pkgs[var], ('blocker', blocker, conflicts)
+        return None
+
+
+def generate_sat_resolver_kls(resolver_kls):
+    """Return a SAT backed variant of a :obj:`pkgcore.resolver.plan.merge_plan` class."""
+    if issubclass(resolver_kls, sat_merge_plan):
+        return resolver_kls
+    return type(f'sat_{resolver_kls.__name__}', (sat_merge_plan, resolver_kls), {})
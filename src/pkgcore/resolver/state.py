@@ -6,6 +6,7 @@ __all__ = (
 
 from snakeoil.containers import RefCountingSet
 
+from .graph import merge_graph
 from .pigeonholes import PigeonHoledSlots
 
 
@@ -20,6 +21,10 @@ class plan_state:
         self.match_atom = self.state.find_atom_matches
         self.vdb_filter = set()
         self.forced_restrictions = RefCountingSet()
+        # number of backtracks and the ops reverted by them
+        self.backtracks = 0
+        self.reverted_ops = 0
+        self.max_reverted_ops = 0
 
     def add_blocker(self, choices, blocker, key=None):
         """Adds blocker, returning any packages blocked.
@@ -59,6 +64,61 @@ class plan_state:
         finally:
             if reversion_count:
                 self.plan = self.plan[:-reversion_count]
+                self.backtracks += 1
+                self.reverted_ops += reversion_count
+                if reversion_count > self.max_reverted_ops:
+                    self.max_reverted_ops = reversion_count
+
+    def culprit_points(self, conflicts):
+        """Return the positions of the ops adding each of the conflicts.
+
+        :param conflicts: conflicting pkgs or blockers as returned by the
+            various op apply methods
+        :return: sorted tuple of plan positions or None if any of the
+            conflicts couldn't be attributed to an op
+        """
+        remaining = {id(x) for x in conflicts}
+        points = []
+        for pos in range(len(self.plan) - 1, -1, -1):
+            op = self.plan[pos]
+            if isinstance(op, incref_forward_block_op):
+                obj = op.blocker
+            elif op.desc in ('add', 'replace'):
+                obj = op.pkg
+            else:
+                continue
+            if id(obj) in remaining:
+                remaining.discard(id(obj))
+                points.append(pos)
+                if not remaining:
+                    return tuple(reversed(points))
+        return None
+
+    def culprit_point(self, conflicts):
+        """Return the position of the most recent op adding any of the conflicts.
+
+        :param conflicts: conflicting pkgs or blockers as returned by the
+            various op apply methods
+        :return: plan position or None if any of the conflicts couldn't be
+            attributed to an op
+        """
+        points = self.culprit_points(conflicts)
+        if points is None:
+            return None
+        return points[-1]
+
+    def in_effect(self, point, op):
+        """Determine if an op added by :obj:`culprit_points` is still in effect.
+
+        Besides being reverted by backtracking, the pkgs of add ops can be
+        replaced or removed by later ops and blockers dropped along with
+        their owner while the ops themselves stay in the plan.
+        """
+        if point >= len(self.plan) or self.plan[point] is not op:
+            return False
+        if isinstance(op, incref_forward_block_op):
+            return (op.blocker, op.key) in self.rev_blockers.get(op.choices, ())
+        return self.pkg_choices.get(op.pkg) is op.choices
 
     def iter_ops(self, return_livefs=False):
         iterable = (x for x in self.plan if not x.internal)
@@ -73,6 +133,13 @@ class plan_state:
             i = (x for x in i if x.pkg.package_is_real)
         return ops_sequence(i)
 
+    def graph(self, livefs=False, only_real=False):
+        """Return the dependency graph of the ops.
+
+        :return: :obj:`pkgcore.resolver.graph.merge_graph` instance
+        """
+        return merge_graph(self.ops(livefs, only_real))
+
     def __getitem__(self, slice):
         return self.plan[slice]
 
@@ -0,0 +1,134 @@
+"""
+resolver instrumentation
+
+Collects per-atom resolution timings, choice and backtracking counts, and
+repo query cache usage of a :obj:`pkgcore.resolver.plan.merge_plan` run
+without the overhead of its textual debug output.
+"""
+
+__all__ = ("resolver_stats",)
+
+import time
+from collections import Counter
+
+
+class _atom_stats:
+
+    __slots__ = ("calls", "failures", "time", "self_time", "choices")
+
+    def __init__(self):
+        self.calls = self.failures = self.choices = 0
+        self.time = self.self_time = 0.0
+
+    def as_dict(self):
+        return {x: getattr(self, x) for x in self.__slots__}
+
+
+class resolver_stats:
+    """Resolution statistics of a :obj:`pkgcore.resolver.plan.merge_plan` run.
+
+    Atom timings are wall-clock seconds; ``time`` includes the resolution of
+    an atom's deps while ``self_time`` excludes it. Resolutions of the same
+    atom are aggregated, e.g. an atom required by multiple pkgs is counted
+    once per parent since it's checked against the plan each time.
+    """
+
+    def __init__(self):
+        self.atoms = {}
+        # choices tried per choice point -> number of choice points
+        self.choices = Counter()
+        self.max_depth = 0
+        self.time = 0.0
+        # solver counters of backends not walking atoms one at a time
+        self.solver = {}
+        self._children = [0.0]
+
+    def rec_add_atom(self, func, atom, stack, dbs, **kwds):
+        """Wrapper for :obj:`merge_plan._rec_add_atom` recording its resolution."""
+        depth = len(stack) + 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+        children = self._children
+        children.append(0.0)
+        start = time.perf_counter()
+        try:
+            ret = func(atom, stack, dbs, **kwds)
+        finally:
+            elapsed = time.perf_counter() - start
+            child_time = children.pop()
+            children[-1] += elapsed
+        if not stack:
+            self.time += elapsed
+
+        key = str(atom)
+        entry = self.atoms.get(key)
+        if entry is None:
+            entry = self.atoms[key] = _atom_stats()
+        entry.calls += 1
+        entry.time += elapsed
+        entry.self_time += elapsed - child_time
+        if ret:
+            entry.failures += 1
+
+        # the frame for the atom was just popped onto its parent's events
+        frame = (stack[-1] if stack else stack).events[-1]
+        tried = sum(
+            1 for x in frame.events if isinstance(x, tuple) and x[0] == 'inspecting')
+        if tried:
+            entry.choices += tried
+            self.choices[tried] += 1
+        return ret
+
+    def hottest(self, limit=20):
+        """Return the atoms with the most time spent resolving them, excluding deps."""
+        return sorted(self.atoms.items(), key=lambda x: x[1].self_time, reverse=True)[:limit]
+
+    def report(self, resolver, limit=20):
+        """Return a JSON serializable report for a resolver.
+
+        :param resolver: :obj:`pkgcore.resolver.plan.merge_plan` instance the
+            stats were collected for
+        :param limit: number of hottest atoms to include
+        """
+        state = resolver.state
+        repos = {}
+        for repo in resolver.all_raw_dbs:
+            repo_id = str(getattr(repo, 'repo_id', repo))
+            counts = repos.setdefault(repo_id, {'hits': 0, 'misses': 0})
+            counts['hits'] += repo.__hits__
+            counts['misses'] += repo.__misses__
+        atoms = self.atoms.values()
+        data = {
+            'time': self.time,
+            'atoms': {
+                'resolved': sum(x.calls for x in atoms),
+                'unique': len(self.atoms),
+                'failures': sum(x.failures for x in atoms),
+                'max_depth': self.max_depth,
+            },
+            'choices': {
+                'tried': sum(k * v for k, v in self.choices.items()),
+                'choice_points': sum(self.choices.values()),
+                'max_per_choice_point': max(self.choices, default=0),
+                'histogram': {str(k): v for k, v in sorted(self.choices.items())},
+            },
+            'backtracks': {
+                'count': state.backtracks,
+                'reverted_ops': state.reverted_ops,
+                'max_depth': state.max_reverted_ops,
+                'backjumps': resolver.backjumps,
+            },
+            'repo_cache': repos,
+            'plan_ops': len(state.plan),
+            'hottest': [
+                dict(atom=atom, **entry.as_dict())
+                for atom, entry in self.hottest(limit)],
+            'per_atom': {atom: entry.as_dict() for atom, entry in sorted(self.atoms.items())},
+        }
+        if self.solver:
+            data['solver'] = dict(self.solver)
+        if resolver.memo is not None:
+            data['memo_hits'] = resolver.memo.hits
+        if resolver.prefetch is not None:
+            data['prefetched'] = resolver.prefetch.submitted
+        return data
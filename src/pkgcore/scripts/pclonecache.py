@@ -24,8 +24,13 @@ def main(options, out, err):
             (options.target,))
 
     source, target = options.source, options.target
+    if (source.chf_type != target.chf_type or
+            not set(target.eclass_chf_types).issubset(source.eclass_chf_types)):
+        argparser.error(
+            f"can't update cache label '{target}' from '{source}', "
+            "incompatible checksum types")
     if not target.autocommits:
-        target.sync_rate = 1000
+        target.sync_rate = max(target.sync_rate, 1000)
     if options.verbosity > 0:
         out.write("grabbing target's existing keys")
     valid = set()
@@ -45,6 +50,7 @@ def main(options, out, err):
             if options.verbosity > 0:
                 out.write(f"deleting {x}")
             del target[x]
+    target.commit()
 
     if options.verbosity > 0:
         out.write("took %i seconds" % int(time.time() - start))
@@ -20,6 +20,7 @@ from snakeoil.osutils import listdir_dirs, pjoin
 from snakeoil.sequences import iter_stable_unique
 
 from ..cache.flat_hash import md5_cache
+from ..ebuild import processor
 from ..ebuild import repository as ebuild_repo
 from ..ebuild import triggers
 from ..ebuild.cpv import CPV
@@ -276,9 +277,61 @@ regen_opts.add_argument(
         Number of threads to use for regeneration, defaults to using all
         available processors.
     """)
+regen_opts.add_argument(
+    "--jobs-mode", choices=('thread', 'process'), default='thread',
+    help="parallelism used for regeneration",
+    docs="""
+        Source ebuilds using threads within the main process (the default) or
+        in a pool of worker processes, one per thread otherwise requested.
+        Using processes avoids serializing metadata parsing on the main
+        process while generated metadata is still written to the cache by the
+        main process.
+    """)
+regen_opts.add_argument(
+    "--pipeline-window", type=arghparse.positive_int, default=4, metavar='N',
+    help="number of metadata requests queued per ebuild processor",
+    docs="""
+        Maximum number of metadata requests queued on each ebuild processor,
+        allowing the next ebuilds to be sourced while the metadata of earlier
+        ones is parsed and stored. Set to 1 to disable pipelining and wait
+        for each ebuild to be sourced before requesting the next one.
+    """)
 regen_opts.add_argument(
     "--force", action='store_true', default=False,
     help="force regeneration to occur regardless of staleness checks or repo settings")
+regen_opts.add_argument(
+    "--changed-eclasses", action='store_true', default=False,
+    help="only regenerate packages inheriting eclasses changed since the last regen",
+    docs="""
+        Use the eclass consumer index stored alongside the repo's cache to
+        only regenerate metadata for packages inheriting eclasses that were
+        modified or removed since the last regen run, skipping the scan of
+        the entire repo.
+
+        Changes to ebuilds themselves aren't detected in this mode. If no
+        index exists yet a full regen is run which creates it.
+    """)
+regen_opts.add_argument(
+    "--incremental", action='store_true', default=False,
+    help="only regenerate packages changed in git since the last regen",
+    docs="""
+        For git-based repos, record the commit used for each regen run and
+        on subsequent runs only regenerate metadata for ebuilds changed in
+        the commits since then in addition to the consumers of changed
+        eclasses as done via --changed-eclasses.
+
+        Uncommitted changes aren't detected in this mode. If the previous
+        commit is unknown or missing from the repo's history a full regen is
+        run.
+    """)
+regen_opts.add_argument(
+    "--cache-stats", action='store_true', default=False,
+    help="output metadata cache stats for each regenerated repo",
+    docs="""
+        Output metadata cache stats after regenerating each repo, including
+        cache hits, misses, stale entries, regenerations, and the time spent
+        in each phase. Timings are summed across all threads.
+    """)
 regen_opts.add_argument(
     "--dir", dest='cache_dir', type=arghparse.create_dir,
     help="use separate directory to store repository caches")
@@ -291,9 +344,12 @@ regen_opts.add_argument(
 regen_opts.add_argument(
     "--pkg-desc-index", action='store_true', default=False,
     help="update package description cache (metadata/pkg_desc_index)")
+commandline.add_ebd_pool_options(regen)
+
 @regen.bind_main_func
 def regen_main(options, out, err):
     """Regenerate a repository cache."""
+    commandline.configure_ebd_pool(regen, options)
     ret = []
 
     observer = observer_mod.formatter_output(out)
@@ -310,9 +366,18 @@ def regen_main(options, out, err):
             out.write(f"skipping repo {repo}: cache disabled")
             continue
 
+        stats = None
+        if options.cache_stats and hasattr(repo, 'enable_cache_stats'):
+            stats = repo.enable_cache_stats()
+
+        processor.processor_pool.reset_stats()
         start_time = time.time()
         ret.append(repo.operations.regen_cache(
             threads=options.threads, observer=observer, force=options.force,
+            changed_eclasses=options.changed_eclasses,
+            incremental=options.incremental,
+            processes=(options.jobs_mode == 'process'),
+            pipeline_window=options.pipeline_window,
             eclass_caching=(not options.disable_eclass_caching)))
         end_time = time.time()
 
@@ -320,6 +385,12 @@ def regen_main(options, out, err):
             out.write(
                 "finished %d nodes in %.2f seconds" %
                 (len(repo), end_time - start_time))
+            if processor.processor_pool.requests:
+                for line in processor.processor_pool.summary():
+                    out.write(line)
+        if stats is not None:
+            for line in stats.summary():
+                out.write(line)
 
         if options.rsync:
             timestamp = pjoin(repo.location, "metadata", "timestamp.chk")
@@ -8,22 +8,34 @@ source or binary packages.
 # more should be doc'd...
 __all__ = ("AmbiguousQuery", "NoMatches")
 
+import hashlib
+import json
+import os
 import sys
 from functools import partial
 from textwrap import dedent
 from time import time
 
+from snakeoil.cli import arghparse
 from snakeoil.cli.exceptions import ExitException
+from snakeoil.osutils import listdir_files, pjoin
 from snakeoil.sequences import iflatten_instance, stable_unique
 from snakeoil.strings import pluralism
 
+from .. import const
 from ..ebuild import resolver, restricts
 from ..ebuild.atom import atom
 from ..ebuild.misc import run_sanity_checks
 from ..merge import errors as merge_errors
 from ..operations import format, observer
+from ..operations.fetch_ahead import FetchAhead
+from ..operations.scheduler import BuildScheduler
 from ..repository.util import get_raw_repos
 from ..repository.virtual import RestrictionRepo
+from ..resolver import sat
+from ..resolver.memo import path_stamps, resolver_memo
+from ..resolver.prefetch import metadata_prefetcher
+from ..resolver.stats import resolver_stats
 from ..resolver.util import reduce_to_failures
 from ..restrictions import packages
 from ..restrictions.boolean import OrRestriction
@@ -106,6 +118,40 @@ resolution_options.add_argument(
         Only perform fetching of all targets from SRC_URI based on the current
         USE configuration.
     """)
+resolution_options.add_argument(
+    '-j', '--jobs', type=arghparse.positive_int, default=1, metavar='N',
+    help='build up to N packages in parallel',
+    docs="""
+        Build up to N packages concurrently. Packages are built as soon as all
+        their build dependencies are merged, while merging itself still
+        happens one package at a time in the order of the resolved plan.
+        Packages depending on failed packages are skipped.
+    """)
+resolution_options.add_argument(
+    '-l', '--load-average', type=float, metavar='LOAD',
+    help="don't start new builds while the load average is at least LOAD",
+    docs="""
+        Don't start new parallel builds while other builds are running and the
+        system load average is at least LOAD. Only used with --jobs.
+    """)
+resolution_options.add_argument(
+    '--fetch-ahead', type=int, default=0, metavar='N',
+    help='fetch distfiles of the next N packages in the background',
+    docs="""
+        Fetch and verify the distfiles of the next N packages in the resolved
+        plan in the background while the current package is built. Fetch
+        failures are reported as soon as they occur, as is the build having
+        to wait on a background fetch. Fetching ahead is disabled by default
+        or if 0 is passed, and isn't used for parallel builds via --jobs which
+        fetch as part of each build.
+    """)
+resolution_options.add_argument(
+    '--fetch-jobs', type=arghparse.positive_int, default=1, metavar='N',
+    help='number of concurrent background fetches',
+    docs="""
+        Maximum number of packages fetched concurrently when fetching ahead
+        via --fetch-ahead.
+    """)
 resolution_options.add_argument(
     '-1', '--oneshot', action='store_true',
     help="do not record changes in the world file",
@@ -235,8 +281,83 @@ resolution_options.add_argument(
         installed packages. If disabled, it's possible for the requested action
         to conflict with already installed dependencies that aren't involved in
         the graph of the requested operation.
+
+        Installed packages and their blockers are inserted in bulk, assuming
+        the dependencies of installed packages are satisfied.
+    """)
+resolution_options.add_argument(
+    '--jobs-mode', choices=('thread', 'process'), default='thread',
+    help='parallelism used for sanity checks',
+    docs="""
+        Run package sanity checks (e.g. pkg_pretend and REQUIRED_USE) serially
+        in a thread or in parallel using a pool of forked worker processes,
+        one per available CPU.
+    """)
+resolution_options.add_argument(
+    '--resolver', choices=('backtrack', 'sat'), default='backtrack',
+    help='dependency resolution engine',
+    docs="""
+        Select the engine used for dependency resolution. The default
+        backtrack resolver walks package choices depth first, undoing them
+        one at a time on failures. The sat resolver encodes package choices,
+        slots, blockers, and dependencies as a boolean satisfiability problem
+        solved with conflict driven clause learning, avoiding exponential
+        retries on large slot or blocker conflicts.
+    """)
+resolution_options.add_argument(
+    '--resolver-memo', action='store_true',
+    help='reuse results of previous dep resolutions',
+    docs="""
+        Record targets whose dependency graph resolved entirely to installed
+        packages and insert the recorded packages and blockers instead of
+        resolving them in subsequent runs as long as the packages involved,
+        the domain configuration, and the resolver options remain unchanged.
+
+        The memo is ignored when the installed package database is preloaded
+        via --preload-vdb-state or when using the sat resolver.
+    """)
+resolution_options.add_argument(
+    '--prefetch-depth', type=int, default=0, metavar='N',
+    help='prefetch metadata for the N highest versions of deps',
+    docs="""
+        Load the metadata of the N highest versions of each dependency of the
+        package currently considered by the resolver in a background thread
+        pool, overlapping metadata cache lookups and ebuild regeneration with
+        dependency resolution. Prefetching is disabled by default or if 0 is
+        passed.
+    """)
+resolution_options.add_argument(
+    '--graph', metavar='FILE',
+    help='write the dependency graph of the resolved plan to a file',
+    docs="""
+        Write the resolved ops as a dependency graph to the given file, or
+        stdout if '-' is passed, e.g. in combination with --pretend.
+
+        Edges are labeled by the class of dependency pulling in the op
+        (build, runtime, or post) and each op is assigned its topological
+        level, ops on the same level being independent of each other. The
+        length of the critical path, the longest chain of ops that have to be
+        merged one after another, is included as well.
+    """)
+resolution_options.add_argument(
+    '--graph-format', choices=('json', 'dot'), default='json',
+    help='output format used by --graph')
+resolution_options.add_argument(
+    '--resolver-stats', metavar='FILE',
+    help='write dep resolution stats to a file in JSON format',
+    docs="""
+        Collect dep resolution stats and write them as JSON to the given
+        file, or stdout if '-' is passed, after resolution finishes.
+
+        The report includes per-atom resolution counts and timings, the
+        number of choices tried per choice point, backtracking counts and
+        depths, repo query cache hits and misses, and the atoms the resolver
+        spent the most time on. In contrast to --debug, it's suitable for
+        profiling large resolutions such as world updates.
     """)
 
+commandline.add_ebd_pool_options(argparser)
+
 output_options = argparser.add_argument_group("output options")
 output_options.add_argument(
     '--quiet-repo-display', action='store_true',
@@ -334,6 +455,17 @@ def unmerge(out, err, installed_repos, targets, options, formatter, world_set=No
             out.write(pkg.cpvstr)
         out.prefix = []
 
+        dependants = unmerge_dependants(matches)
+        if dependants:
+            out.write()
+            out.write(
+                out.fg('yellow'), out.bold, 'warning: ', out.reset,
+                'the following installed packages depend on packages being unmerged:')
+            out.prefix = [out.bold, ' * ', out.reset]
+            for cpv, deps in sorted(dependants.items()):
+                out.write(cpv, ' (', ', '.join(map(str, deps)), ')')
+            out.prefix = []
+
         repo_obs = observer.repo_observer(
             observer.formatter_output(out), debug=options.debug)
 
@@ -345,6 +477,34 @@ def unmerge(out, err, installed_repos, targets, options, formatter, world_set=No
         return do_unmerge(options, out, err, vdb, matches, world_set, repo_obs)
 
 
+def unmerge_dependants(pkgs):
+    """Find installed pkgs depending on any of the given pkgs.
+
+    Uses the reverse dependency index of the pkgs' repos, pkgs from repos
+    lacking one are skipped.
+
+    :return: mapping of the cpvs of dependant pkgs not in the given pkgs to
+        the dep atoms matching them
+    """
+    cpvs = {pkg.cpvstr for pkg in pkgs}
+    dependants = {}
+    for pkg in pkgs:
+        index = getattr(pkg.repo, 'revdep_index', None)
+        if index is None:
+            continue
+        target = pkg.versioned_atom
+        for cpv in index.dependants(target):
+            if cpv in cpvs:
+                continue
+            for _attr, dep, _flags in index.revdeps(cpv, target):
+                if dep.blocks:
+                    continue
+                deps = dependants.setdefault(cpv, [])
+                if dep not in deps:
+                    deps.append(dep)
+    return dependants
+
+
 def do_unmerge(options, out, err, vdb, matches, world_set, repo_obs):
     if vdb.frozen:
         if options.force:
@@ -571,6 +731,185 @@ def display_pkgsets(out, options):
             out.write(name)
 
 
+def _resolver_memo(options, domain):
+    """Load the resolver memo matching the current configuration."""
+    paths = [domain.config_dir]
+    profile_dirs = [node.path for node in domain.profile.stack]
+    for repo in domain.ebuild_repos_raw:
+        paths.append(pjoin(repo.location, 'eclass'))
+        profile_dirs.append(pjoin(repo.location, 'profiles'))
+    # only top level files, profile dirs contain their child profiles
+    for path in profile_dirs:
+        if os.path.isdir(path):
+            paths.extend(pjoin(path, x) for x in sorted(listdir_files(path)))
+
+    chf = hashlib.sha1()
+    chf.update(repr((
+        options.resolver_kls.__name__, domain.root,
+        options.deep, options.newuse, options.empty, options.nodeps,
+        options.with_bdeps, options.replace, options.ignore_cycles,
+        options.usepkg, options.usepkgonly, options.source_only,
+        sorted(token for token, _restrict in options.excludes),
+        options.onlydeps)).encode())
+    for stamp in path_stamps(paths):
+        chf.update(repr(stamp).encode())
+
+    memo = resolver_memo(
+        pjoin(const.USER_CACHE_PATH, 'resolver-memo.json'), chf.hexdigest())
+    memo.load()
+    return memo
+
+
+def _write_resolver_stats(options, out, err, resolver_inst):
+    """Output the JSON report of the collected resolver stats."""
+    report = json.dumps(resolver_inst.stats.report(resolver_inst), indent=2)
+    if options.resolver_stats == '-':
+        out.write(report)
+        return
+    try:
+        with open(options.resolver_stats, 'w') as f:
+            f.write(report + '\n')
+    except EnvironmentError as e:
+        err.write(f"{options.prog}: failed writing resolver stats: {e}")
+
+
+def _update_world(options, out, world_set, source_repos, atoms, op):
+    """Update the world file after an op was merged."""
+    if op.desc == "remove":
+        out.write(f'>>> Removing {op.pkg.cpvstr} from world file')
+        removal_pkg = slotatom_if_slotted(
+            source_repos.combined, op.pkg.versioned_atom)
+        update_worldset(world_set, removal_pkg, remove=True)
+    elif not options.oneshot and any(x.match(op.pkg) for x in atoms):
+        if not (options.upgrade or options.downgrade):
+            out.write(f'>>> Adding {op.pkg.cpvstr} to world file')
+            add_pkg = slotatom_if_slotted(
+                source_repos.combined, op.pkg.versioned_atom)
+            update_worldset(world_set, add_pkg)
+
+
+def _fetch_op(domain, observer, op):
+    """Fetch the distfiles of an op's pkg.
+
+    :return: pkg operations of the pkg, False on failure, or None for remove
+        ops that don't require fetching
+    """
+    if op.desc == "remove":
+        return None
+    pkg_ops = domain.pkg_operations(op.pkg, observer=observer)
+    if not pkg_ops.run_if_supported("fetch", or_return=True):
+        return False
+    return pkg_ops
+
+
+def _fetch_ahead_report(out, event, op):
+    """Report background fetch events."""
+    if event == 'failed':
+        out.error(f"fetching ahead failed for {op.pkg.cpvstr}")
+    else:
+        out.write(f"waiting on fetching {op.pkg.cpvstr}")
+
+
+def _build_op(out, domain, build_obs, op):
+    """Fetch and build the pkg of an op for parallel merging.
+
+    :return: tuple of the pkg to merge and the cleanup functions to run after
+        merging it, or False on failure
+    """
+    cleanup = [op.pkg.release_cached_data]
+    pkg_ops = _fetch_op(domain, build_obs, op)
+    if not pkg_ops:
+        out.error(f"fetching failed for {op.pkg.cpvstr}")
+        return False
+
+    buildop = pkg_ops.run_if_supported("build", or_return=None)
+    pkg = op.pkg
+    if buildop is not None:
+        out.write(f"building {op.pkg.cpvstr}")
+        try:
+            pkg = buildop.finalize()
+        except format.BuildError as e:
+            out.error(f"caught exception building {op.pkg.cpvstr}: {e}")
+            return False
+        if pkg is False:
+            out.error(f"failed building {op.pkg.cpvstr}")
+            return False
+        cleanup.append(pkg.release_cached_data)
+        pkg_ops = domain.pkg_operations(pkg, observer=build_obs)
+        cleanup.append(buildop.cleanup)
+
+    cleanup.append(partial(pkg_ops.run_if_supported, "cleanup"))
+    pkg = pkg_ops.run_if_supported("localize", or_return=pkg)
+    return pkg, cleanup
+
+
+def _merge_op(options, out, domain, repo_obs, world_set, source_repos, atoms, op, result):
+    """Merge a built pkg or remove an installed pkg for parallel merging."""
+    if op.desc == "remove":
+        out.write(f">>> Removing {op.pkg.cpvstr}")
+        i = domain.uninstall_pkg(op.pkg, repo_obs)
+        cleanup = []
+    else:
+        pkg, cleanup = result
+        if op.desc == "replace":
+            if op.old_pkg == pkg:
+                out.write(f">>> Reinstalling {pkg.cpvstr}")
+            else:
+                out.write(f">>> Replacing {op.old_pkg.cpvstr} with {pkg.cpvstr}")
+            i = domain.replace_pkg(op.old_pkg, pkg, repo_obs)
+            cleanup.append(op.old_pkg.release_cached_data)
+        else:
+            out.write(f">>> Installing {pkg.cpvstr}")
+            i = domain.install_pkg(pkg, repo_obs)
+    try:
+        i.finish()
+    except merge_errors.BlockModification as e:
+        out.error(f"Failed to merge {op.pkg}: {e}")
+        return False
+    finally:
+        for func in cleanup:
+            func()
+
+    if world_set is not None:
+        _update_world(options, out, world_set, source_repos, atoms, op)
+    return True
+
+
+def _parallel_merge(options, out, domain, build_obs, repo_obs, world_set,
+                    source_repos, atoms, graph):
+    """Build the resolved ops in parallel while merging them serially."""
+    scheduler = BuildScheduler(
+        graph,
+        partial(_build_op, out, domain, build_obs),
+        partial(_merge_op, options, out, domain, repo_obs, world_set, source_repos, atoms),
+        jobs=options.jobs, load_average=options.load_average,
+        keep_going=options.ignore_failures)
+    out.write(f"\nBuilding {len(graph)} package{pluralism(graph.ops)} "
+              f"using up to {options.jobs} jobs")
+    if scheduler.run():
+        return 0
+    for desc, indexes in (('failed', scheduler.failed), ('skipped', scheduler.skipped)):
+        for i in indexes:
+            out.error(f"{desc}: {graph.ops[i].pkg.cpvstr}")
+    return 1
+
+
+def _write_graph(options, out, err, graph):
+    """Output the dependency graph of the resolved plan."""
+    if options.graph_format == 'dot':
+        data = graph.to_dot()
+    else:
+        data = graph.to_json()
+    if options.graph == '-':
+        out.write(data)
+        return
+    try:
+        with open(options.graph, 'w') as f:
+            f.write(data + '\n')
+    except EnvironmentError as e:
+        err.write(f"{options.prog}: failed writing dependency graph: {e}")
+
+
 @argparser.bind_main_func
 def main(options, out, err):
     if options.list_sets:
@@ -580,6 +919,7 @@ def main(options, out, err):
     config = options.config
     if options.debug:
         resolver.plan.limiters.add(None)
+    commandline.configure_ebd_pool(argparser, options)
 
     domain = options.domain
     world_set = world_list = options.world
@@ -672,6 +1012,17 @@ def main(options, out, err):
         extra_kwargs['resolver_cls'] = resolver.empty_tree_merge_plan
     if options.debug:
         extra_kwargs['debug'] = True
+    if options.resolver == 'sat':
+        extra_kwargs['resolver_cls'] = sat.generate_sat_resolver_kls(
+            extra_kwargs.get('resolver_cls', resolver.plan.merge_plan))
+    elif options.resolver_memo and not options.preload_vdb_state:
+        extra_kwargs['memo'] = _resolver_memo(options, domain)
+    if options.resolver_stats is not None:
+        extra_kwargs['stats'] = resolver_stats()
+    if options.prefetch_depth > 0:
+        prefetch = metadata_prefetcher(source_repos, depth=options.prefetch_depth)
+        if prefetch:
+            extra_kwargs['prefetch'] = prefetch
 
     # XXX: This should recurse on deep
     if options.newuse:
@@ -712,7 +1063,7 @@ def main(options, out, err):
     if options.preload_vdb_state:
         out.write(out.bold, ' * ', out.reset, 'Preloading vdb... ')
         vdb_time = time()
-        resolver_inst.load_vdb_state()
+        resolver_inst.load_vdb_state(bulk=True)
         vdb_time = time() - vdb_time
     else:
         vdb_time = 0.0
@@ -727,21 +1078,29 @@ def main(options, out, err):
         out.title('Resolving...')
         out.write(out.bold, ' * ', out.reset, 'Resolving...')
         out.flush()
-    ret = resolver_inst.add_atoms(atoms, finalize=True)
-    while ret:
-        out.error('resolution failed')
-        restrict = ret[0][0]
-        just_failures = reduce_to_failures(ret[1])
-        display_failures(out, just_failures, debug=options.debug)
-        failures.append(restrict)
-        if not options.ignore_failures:
-            break
-        out.write("restarting resolution")
-        atoms = [x for x in atoms if x != restrict]
-        resolver_inst.reset()
+    try:
         ret = resolver_inst.add_atoms(atoms, finalize=True)
+        while ret:
+            out.error('resolution failed')
+            restrict = ret[0][0]
+            just_failures = reduce_to_failures(ret[1])
+            display_failures(out, just_failures, debug=options.debug)
+            failures.append(restrict)
+            if not options.ignore_failures:
+                break
+            out.write("restarting resolution")
+            atoms = [x for x in atoms if x != restrict]
+            resolver_inst.reset()
+            ret = resolver_inst.add_atoms(atoms, finalize=True)
+    finally:
+        # don't leave prefetch threads sourcing ebuilds on errors or ^C
+        if resolver_inst.prefetch is not None:
+            resolver_inst.prefetch.shutdown()
     resolve_time = time() - resolve_time
 
+    if options.resolver_stats is not None:
+        _write_resolver_stats(options, out, err, resolver_inst)
+
     if failures:
         out.write()
         out.write('Failures encountered:')
@@ -762,6 +1121,15 @@ def main(options, out, err):
 
     resolver_inst.free_caches()
 
+    memo = resolver_inst.memo
+    if memo is not None and not failures:
+        if options.verbosity > 0:
+            out.write(f"reused {memo.hits} memoized target{pluralism(memo.hits)}")
+        try:
+            memo.write()
+        except EnvironmentError as e:
+            err.write(f"{options.prog}: failed writing resolver memo: {e}")
+
     if options.clean:
         out.write(out.bold, ' * ', out.reset, 'Packages to be removed:')
         vset = set(installed_repos.real.combined)
@@ -799,6 +1167,8 @@ def main(options, out, err):
         out.write()
 
     changes = resolver_inst.state.ops(only_real=True)
+    if options.graph is not None:
+        _write_graph(options, out, err, resolver_inst.state.graph(only_real=True))
 
     build_obs = observer.phase_observer(
         observer.formatter_output(out), debug=options.debug)
@@ -824,7 +1194,12 @@ def main(options, out, err):
                 start_time = time()
             # flush output so bash spawned errors are shown in the correct order of events
             out.flush()
-            sanity_failures = run_sanity_checks((x.pkg for x in changes), domain, threads=1)
+            if options.jobs_mode == 'process':
+                sanity_failures = run_sanity_checks(
+                    (x.pkg for x in changes), domain, processes=True)
+            else:
+                sanity_failures = run_sanity_checks(
+                    (x.pkg for x in changes), domain, threads=1)
             if sanity_failures:
                 for pkg, errors in sanity_failures.items():
                     out.write('\n'.join(e.msg(verbosity=options.verbosity) for e in errors))
@@ -875,8 +1250,20 @@ def main(options, out, err):
     if (options.ask and not formatter.ask(f"Would you like to {action} these packages?")):
         return
 
+    if options.jobs > 1 and not options.fetchonly:
+        return _parallel_merge(
+            options, out, domain, build_obs, repo_obs, world_set, source_repos,
+            atoms, resolver_inst.state.graph(only_real=True))
+
     change_count = len(changes)
 
+    fetch_ahead = None
+    if options.fetch_ahead > 0:
+        fetch_ahead = FetchAhead(
+            changes, partial(_fetch_op, domain, build_obs),
+            depth=options.fetch_ahead, jobs=options.fetch_jobs,
+            report=partial(_fetch_ahead_report, out))
+
     # left in place for ease of debugging.
     cleanup = []
     try:
@@ -895,9 +1282,12 @@ def main(options, out, err):
                 if not options.fetchonly and options.debug:
                     out.write("Forcing a clean of workdir")
 
-                pkg_ops = domain.pkg_operations(op.pkg, observer=build_obs)
                 out.write(f"\n{len(op.pkg.distfiles)} file{pluralism(op.pkg.distfiles)} required-")
-                if not pkg_ops.run_if_supported("fetch", or_return=True):
+                if fetch_ahead is not None:
+                    pkg_ops = fetch_ahead.get(count)
+                else:
+                    pkg_ops = _fetch_op(domain, build_obs, op)
+                if not pkg_ops:
                     out.error(f"fetching failed for {op.pkg.cpvstr}")
                     if not options.ignore_failures:
                         return 1
@@ -967,17 +1357,7 @@ def main(options, out, err):
             # basically, be protective
 
             if world_set is not None:
-                if op.desc == "remove":
-                    out.write(f'>>> Removing {op.pkg.cpvstr} from world file')
-                    removal_pkg = slotatom_if_slotted(
-                        source_repos.combined, op.pkg.versioned_atom)
-                    update_worldset(world_set, removal_pkg, remove=True)
-                elif not options.oneshot and any(x.match(op.pkg) for x in atoms):
-                    if not (options.upgrade or options.downgrade):
-                        out.write(f'>>> Adding {op.pkg.cpvstr} to world file')
-                        add_pkg = slotatom_if_slotted(
-                            source_repos.combined, op.pkg.versioned_atom)
-                        update_worldset(world_set, add_pkg)
+                _update_world(options, out, world_set, source_repos, atoms, op)
 
 
 #    again... left in place for ease of debugging.
@@ -986,7 +1366,13 @@ def main(options, out, err):
 #    else:
 #        import pdb;pdb.set_trace()
     finally:
-        pass
+        if fetch_ahead is not None:
+            fetch_ahead.shutdown()
+            if fetch_ahead.stalls:
+                out.write(
+                    out.bold, ' * ', out.reset,
+                    f"waited {fetch_ahead.stall_time:.2f} seconds on "
+                    f"{fetch_ahead.stalls} background fetch{pluralism(fetch_ahead.stalls, plural='es')}")
 
     # the final run from the loop above doesn't invoke cleanups;
     # we could ignore it, but better to run it to ensure nothing is
@@ -23,6 +23,7 @@ from snakeoil.osutils import pjoin, sizeof_fmt
 from snakeoil.sequences import iter_stable_unique
 
 from .. import const
+from ..cache import CacheStats
 from ..ebuild import atom, conditionals
 from ..fs import fs as fs_module
 from ..repository import multiplex
@@ -31,6 +32,7 @@ from ..restrictions import boolean, packages, values
 from ..util import commandline
 from ..util import packages as pkgutils
 from ..util import parserestrict
+from ..vdb.revdep import RevdepRestriction
 
 
 class DataSourceRestriction(values.base):
@@ -287,6 +289,49 @@ def format_attr(config, out, pkg, attr):
         out.write(stringify_attr(config, pkg, attr))
 
 
+def iter_revdeps(pkg, revdep):
+    """Yield the deps of a package intersecting a given atom.
+
+    The evaluated deps of installed packages are looked up in the reverse
+    dependency index of their repo instead of parsing them. Their raw deps are
+    only parsed if the index has any deps intersecting the atom.
+
+    :return: iterable of (attr, dep atom, USE restrictions) tuples, the
+        restrictions are empty for unconditional deps and None if the dep attr
+        doesn't support conditionals
+    """
+    index = getattr(pkg.repo, 'revdep_index', None)
+    if index is None or pkg.cpvstr not in index:
+        yield from _iter_revdeps(pkg, revdep, dep_attrs)
+        return
+
+    revdeps = {}
+    for attr, key, _flags in index.revdeps(pkg.cpvstr, revdep):
+        revdeps.setdefault(attr, []).append(key)
+    raw = index.revdeps(pkg.cpvstr, revdep, inactive=True)
+    for name in dep_attrs:
+        if not name.startswith('raw_'):
+            for key in revdeps.get(name, ()):
+                yield name, key, []
+        elif raw:
+            # USE conditionals are rendered from the pkg's own deps
+            yield from _iter_revdeps(pkg, revdep, (name,))
+
+
+def _iter_revdeps(pkg, revdep, attrs):
+    for name in attrs:
+        depset = get_pkg_attr(pkg, name)
+        if getattr(depset, 'find_cond_nodes', None) is None:
+            yield name, None, None
+            continue
+        for key, restricts in depset.find_cond_nodes(depset.restrictions, True):
+            if not restricts and key.intersects(revdep):
+                yield name, key, restricts
+        for key, restricts in depset.node_conds.items():
+            if key.intersects(revdep):
+                yield name, key, restricts
+
+
 def print_package(options, out, err, pkg):
     """Print a package."""
     if options.verbosity > 0:
@@ -298,42 +343,37 @@ def print_package(options, out, err, pkg):
             out.write(green, f'     {attr}: ', out.fg(), autoline=False)
             format_attr(options, out, pkg, attr)
         for revdep in options.print_revdep:
-            for name in dep_attrs:
-                depset = get_pkg_attr(pkg, name)
-                find_cond = getattr(depset, 'find_cond_nodes', None)
-                if find_cond is None:
+            for name, key, restricts in iter_revdeps(pkg, revdep):
+                if restricts is None:
                     out.write(
                         green, '     revdep: ', out.fg(), name, ' on ',
                         str(revdep))
-                    continue
-                for key, restricts in depset.find_cond_nodes(depset.restrictions, True):
-                    if not restricts and key.intersects(revdep):
+                elif not restricts:
+                    out.write(
+                        green, '     revdep: ', out.fg(), name, ' on ',
+                        autoline=False)
+                    if key == revdep:
+                        # this is never reached...
+                        out.write(out.bold, str(revdep))
+                    else:
                         out.write(
-                            green, '     revdep: ', out.fg(), name, ' on ',
-                            autoline=False)
-                        if key == revdep:
-                            # this is never reached...
-                            out.write(out.bold, str(revdep))
-                        else:
-                            out.write(
-                                str(revdep), ' through dep ', out.bold,
-                                str(key))
-                for key, restricts in depset.node_conds.items():
-                    if key.intersects(revdep):
+                            str(revdep), ' through dep ', out.bold,
+                            str(key))
+                else:
+                    out.write(
+                        green, '     revdep: ', out.fg(), name, ' on ',
+                        autoline=False)
+                    if key == revdep:
                         out.write(
-                            green, '     revdep: ', out.fg(), name, ' on ',
+                            out.bold, str(revdep), out.reset,
                             autoline=False)
-                        if key == revdep:
-                            out.write(
-                                out.bold, str(revdep), out.reset,
-                                autoline=False)
-                        else:
-                            out.write(
-                                str(revdep), ' through dep ', out.bold,
-                                str(key), out.reset, autoline=False)
-                        out.write(' if USE matches one of:')
-                        for r in restricts:
-                            out.write('                  ', str(r))
+                    else:
+                        out.write(
+                            str(revdep), ' through dep ', out.bold,
+                            str(key), out.reset, autoline=False)
+                    out.write(' if USE matches one of:')
+                    for r in restricts:
+                        out.write('                  ', str(r))
         out.write()
         out.later_prefix = []
         out.wrap = False
@@ -367,20 +407,16 @@ def print_package(options, out, err, pkg):
             attr_str = stringify_attr(options, pkg, attr)
             out.write(f'{attr}="{attr_str}"')
         for revdep in options.print_revdep:
-            for name in dep_attrs:
-                depset = get_pkg_attr(pkg, name)
-                if getattr(depset, 'find_cond_nodes', None) is None:
+            for name, key, restricts in iter_revdeps(pkg, revdep):
+                if restricts is None:
                     # TODO maybe be smarter here? (this code is
                     # triggered by virtuals currently).
                     out.write(f' {name} on {revdep}')
-                    continue
-                for key, restricts in depset.find_cond_nodes(depset.restrictions, True):
-                    if not restricts and key.intersects(revdep):
-                        out.write(f' {name} on {revdep} through {key}')
-                for key, restricts in depset.node_conds.items():
-                    if key.intersects(revdep):
-                        restricts = ' or '.join(map(str, restricts))
-                        out.write(f' {name} on {revdep} through {key} if USE {restricts},')
+                elif not restricts:
+                    out.write(f' {name} on {revdep} through {key}')
+                else:
+                    restricts = ' or '.join(map(str, restricts))
+                    out.write(f' {name} on {revdep} through {key} if USE {restricts},')
         # If we printed anything at all print the newline now
         out.autoline = True
         if printed_something:
@@ -502,6 +538,25 @@ repo_group.add_argument(
         By default, virtuals are included during matching.
     """)
 
+repo_group.add_argument(
+    '--prefetch-metadata', action='store_true', default=False,
+    help='bulk validate metadata caches before querying',
+    docs="""
+        Validate the metadata cache entries of all searched ebuild repos in
+        bulk before running the query. Ebuild checksums are computed in
+        parallel and each distinct set of inherited eclasses is only checked
+        once, speeding up queries that touch most packages in a repo.
+    """)
+repo_group.add_argument(
+    '--cache-stats', action='store_true', default=False,
+    help='output metadata cache stats after querying',
+    docs="""
+        Collect metadata cache stats for all searched ebuild repos and output
+        them to stderr after the query completes, including cache hits,
+        misses, stale entries, regenerations, and the time spent in each
+        phase of metadata retrieval.
+    """)
+
 
 class RawAwareStoreRepoObject(commandline.StoreRepoObject):
     """Custom implementation that is aware of the --raw and --unfiltered options."""
@@ -700,9 +755,9 @@ def parse_revdep(value):
     val_restrict = values.FlatteningRestriction(
         atom.atom,
         values.AnyMatch(values.FunctionRestriction(targetatom.intersects)))
-    return packages.OrRestriction(*list(
+    return RevdepRestriction(targetatom, packages.OrRestriction(*list(
         packages.PackageRestriction(dep, val_restrict)
-        for dep in ('bdepend', 'depend', 'rdepend', 'pdepend')))
+        for dep in ('bdepend', 'depend', 'rdepend', 'pdepend'))))
 
 def _revdep_pkgs_match(pkgs, value):
     return any(value.match(pkg) for pkg in pkgs)
@@ -999,6 +1054,23 @@ def main(options, out, err):
 
     if options.query is None:
         return 0
+
+    stats = None
+    if options.cache_stats:
+        stats = CacheStats()
+        for repo in get_raw_repos(options.repos):
+            enable_cache_stats = getattr(repo, 'enable_cache_stats', None)
+            if enable_cache_stats is not None:
+                enable_cache_stats(stats)
+
+    primed = []
+    if options.prefetch_metadata:
+        for repo in get_raw_repos(options.repos):
+            validate_cache = getattr(repo, 'validate_cache', None)
+            if validate_cache is not None:
+                validate_cache(prime=True)
+                primed.append(repo)
+
     for repo in options.repos:
         try:
             for pkgs in pkgutils.groupby_pkg(repo.itermatch(options.query, sorter=sorted)):
@@ -1027,3 +1099,11 @@ def main(options, out, err):
             # force a newline for error msg or traceback output
             err.write()
             raise
+
+    # drop primed entries the query didn't use
+    for repo in primed:
+        repo.clear_primed_metadata()
+
+    if stats is not None:
+        for line in stats.summary():
+            err.write(line)
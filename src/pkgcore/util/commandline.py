@@ -27,6 +27,7 @@ from snakeoil.sequences import iflatten_instance, unstable_unique
 from snakeoil.strings import pluralism
 
 from ..config import basics, load_config
+from ..ebuild import processor
 from ..plugin import get_plugins
 from ..repository import errors as repo_errors
 from ..restrictions import packages, restriction
@@ -532,6 +533,46 @@ def _mk_domain(parser):
         help="custom pkgcore domain to use for this operation")
 
 
+def add_ebd_pool_options(parser):
+    """Add options tuning the pool of reused ebuild processors."""
+    group = parser.add_argument_group('ebuild processor options')
+    non_negative_int = partial(arghparse.bounded_int, lambda n: n >= 0, '>= 0')
+    group.add_argument(
+        '--ebd-min-idle', type=non_negative_int, default=0, metavar='N',
+        help='number of idle ebuild processors exempt from idle reaping',
+        docs="""
+            Number of idle ebuild processors that are kept alive for reuse
+            regardless of --ebd-idle-timeout.
+        """)
+    group.add_argument(
+        '--ebd-max-idle', type=non_negative_int, metavar='N',
+        help='maximum number of idle ebuild processors',
+        docs="""
+            Maximum number of idle ebuild processors kept for reuse, released
+            processors exceeding it are shut down. By default there's no
+            limit.
+        """)
+    group.add_argument(
+        '--ebd-idle-timeout', type=float, metavar='SECONDS',
+        help='shut down ebuild processors idle for longer than SECONDS',
+        docs="""
+            Shut down idle ebuild processors beyond the --ebd-min-idle count
+            once they've been idle for SECONDS. By default idle processors are
+            kept until exit.
+        """)
+    return group
+
+
+def configure_ebd_pool(parser, options):
+    """Apply the options added via :obj:`add_ebd_pool_options`."""
+    try:
+        processor.configure_ebuild_processors(
+            min_size=options.ebd_min_idle, max_size=options.ebd_max_idle,
+            idle_timeout=options.ebd_idle_timeout)
+    except ValueError as e:
+        parser.error(e)
+
+
 class _SubParser(arghparse._SubParser):
 
     def add_parser(self, name, config=False, domain=False, **kwds):
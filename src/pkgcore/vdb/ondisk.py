@@ -7,6 +7,7 @@ from functools import partial
 
 from snakeoil import data_source
 from snakeoil.fileutils import readfile
+from snakeoil.klass import jit_attr
 from snakeoil.mappings import IndeterminantDict
 from snakeoil.osutils import listdir_dirs, pjoin
 
@@ -19,6 +20,7 @@ from ..package import base as pkg_base
 from ..repository import errors, prototype, wrapper
 from . import repo_ops
 from .contents import ContentsFile
+from .revdep import RevdepIndex
 
 
 class tree(prototype.tree):
@@ -63,6 +65,14 @@ class tree(prototype.tree):
 
         self.package_class = self.package_factory(self)
 
+    @jit_attr
+    def revdep_index(self):
+        """Reverse dependency index of the installed pkgs."""
+        location = None
+        if self.cache_location is not None:
+            location = pjoin(self.cache_location, 'revdep.json')
+        return RevdepIndex(self, location)
+
     def _get_categories(self, *optional_category):
         # return if optional_category is passed... cause it's not yet supported
         if optional_category:
@@ -215,6 +225,10 @@ class ConfiguredTree(wrapper.tree, tree):
         self.domain = domain
         self.domain_settings = domain_settings
 
+    @property
+    def revdep_index(self):
+        return self.raw_repo.revdep_index
+
     def _generate_operations(self, domain, pkg, **kwargs):
         pkg = pkg._raw_pkg
         return ebd.built_operations(
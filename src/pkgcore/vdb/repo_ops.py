@@ -114,6 +114,7 @@ class install(repo_ops.install):
     def finalize_data(self):
         os.rename(self.tmp_write_path, self.install_path)
         update_mtime(self.repo.location)
+        self.repo.revdep_index.add(self.new_pkg)
         return True
 
 
@@ -131,6 +132,7 @@ class uninstall(repo_ops.uninstall):
         update_mtime(self.repo.location)
         shutil.rmtree(self.remove_path)
         update_mtime(self.repo.location)
+        self.repo.revdep_index.remove(self.old_pkg)
         return True
 
 
@@ -152,8 +154,9 @@ class replace(repo_ops.replace, install, uninstall):
         # literal same fullver replacements), then wipe the unmerge
         # that minimizes the window for races, and gets the data in place
         # should unmerge somehow die.
-        uninstall.finalize_data(self)
-        install.finalize_data(self)
+        with self.repo.revdep_index.batch():
+            uninstall.finalize_data(self)
+            install.finalize_data(self)
         return True
 
 
@@ -0,0 +1,302 @@
+"""
+reverse dependency index of installed packages
+
+Finding the installed packages depending on a given atom otherwise requires
+loading and parsing the dependencies of every installed package. The index
+records the dependency atoms of each installed package along with the USE
+conditionals they're pulled in by and the USE flags the package was built
+with, keyed by the package keys they reference.
+
+It's persisted as JSON in the vdb cache location and kept current by the vdb
+repo operations; entries for package dirs modified behind our back (e.g. by
+other package managers) are detected via their mtime and reindexed on load.
+"""
+
+__all__ = ("RevdepIndex", "RevdepRestriction")
+
+import json
+import os
+from contextlib import contextmanager
+
+from snakeoil.fileutils import AtomicWriteFile
+from snakeoil.osutils import pjoin
+
+from ..ebuild import ebuild_src
+from ..ebuild.atom import atom
+from ..log import logger
+from ..restrictions import restriction
+
+_VERSION = 1
+
+dep_attrs = ('bdepend', 'depend', 'rdepend', 'pdepend')
+
+
+def _pkg_deps(pkg):
+    """Return the unevaluated dependency atoms of a pkg with their conditionals.
+
+    :return: mapping of dep attr to a list of (atom string, USE flags) pairs,
+        the flags (prefixed with '!' if negated) all being required for the
+        atom to be pulled in, empty if it's unconditionally required
+    """
+    deps = {}
+    for attr in dep_attrs:
+        try:
+            depset = ebuild_src.package._get_attr[attr](pkg)
+        except KeyError:
+            continue
+        l = [(str(node), list(map(str, restricts))) for node, restricts in
+             depset.find_cond_nodes(depset.restrictions, True)]
+        if l:
+            deps[attr] = l
+    return deps
+
+
+class RevdepIndex:
+    """Reverse dependency index for a vdb.
+
+    :param repo: raw vdb the index is for
+    :param location: path of the file the index is persisted to, if None it's
+        only kept in memory
+    """
+
+    def __init__(self, repo, location=None):
+        self.repo = repo
+        self.location = location
+        self._pkgs = None
+        self._keys = {}
+        self._atoms = {}
+        # nesting depth of batch() blocks and whether they deferred a flush
+        self._batching = 0
+        self._dirty = False
+
+    def _pkg_path(self, cpv):
+        category, pf = cpv.split('/', 1)
+        return pjoin(self.repo.location, category, pf)
+
+    def _mtime(self, cpv):
+        try:
+            return os.stat(self._pkg_path(cpv)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _read(self):
+        if self.location is None:
+            return {}
+        try:
+            with open(self.location) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (EnvironmentError, ValueError) as e:
+            logger.warning(f'failed reading revdep index {self.location!r}: {e}')
+            return {}
+        if data.get('version') != _VERSION:
+            return {}
+        return data['pkgs']
+
+    @contextmanager
+    def batch(self):
+        """Write the index once after all updates within the block are done."""
+        self._batching += 1
+        try:
+            yield self
+        finally:
+            self._batching -= 1
+            if not self._batching and self._dirty:
+                self.flush()
+
+    def _modified(self):
+        if self._batching:
+            self._dirty = True
+        else:
+            self.flush()
+
+    def flush(self):
+        """Write the index to disk."""
+        self._dirty = False
+        if self.location is None or self._pkgs is None:
+            return
+        f = None
+        try:
+            os.makedirs(os.path.dirname(self.location), exist_ok=True)
+            f = AtomicWriteFile(self.location, perms=0o644)
+            json.dump({'version': _VERSION, 'pkgs': self._pkgs}, f)
+            f.close()
+        except EnvironmentError as e:
+            logger.debug(f'failed writing revdep index {self.location!r}: {e}')
+        finally:
+            if f is not None:
+                f.discard()
+
+    def _load(self):
+        if self._pkgs is not None:
+            return
+        stored = self._read()
+        self._pkgs = {}
+        modified = False
+        for (category, package), versions in self.repo.versions.items():
+            for ver in versions:
+                cpv = f'{category}/{package}-{ver}'
+                entry = stored.pop(cpv, None)
+                if entry is None or entry['mtime'] != self._mtime(cpv):
+                    entry = self._index(category, package, ver)
+                    modified = True
+                self._add_entry(cpv, entry)
+        if modified or stored:
+            self._modified()
+
+    def _index(self, category, package, ver):
+        cpv = f'{category}/{package}-{ver}'
+        try:
+            pkg = self.repo.package_class(category, package, ver)
+            deps = _pkg_deps(pkg)
+            use = sorted(pkg.use)
+        except Exception as e:
+            logger.warning(f'failed indexing deps for {cpv}: {e}')
+            deps, use = {}, []
+        return {'mtime': self._mtime(cpv), 'use': use, 'deps': deps}
+
+    def _add_entry(self, cpv, entry):
+        self._pkgs[cpv] = entry
+        for key in self._entry_keys(entry):
+            self._keys.setdefault(key, set()).add(cpv)
+
+    def _entry_keys(self, entry):
+        return {self._atom(dep).key
+                for deps in entry['deps'].values() for dep, _ in deps}
+
+    def _atom(self, dep):
+        a = self._atoms.get(dep)
+        if a is None:
+            a = self._atoms[dep] = atom(dep)
+        return a
+
+    def add(self, pkg):
+        """Index an installed pkg, replacing any existing entry for it."""
+        self._load()
+        self._remove(pkg.cpvstr)
+        self._add_entry(pkg.cpvstr, self._index(pkg.category, pkg.package, pkg.fullver))
+        self._modified()
+
+    def remove(self, pkg):
+        """Drop an uninstalled pkg from the index."""
+        self._load()
+        if self._remove(pkg.cpvstr):
+            self._modified()
+
+    def _remove(self, cpv):
+        entry = self._pkgs.pop(cpv, None)
+        if entry is None:
+            return False
+        for key in self._entry_keys(entry):
+            cpvs = self._keys[key]
+            cpvs.discard(cpv)
+            if not cpvs:
+                del self._keys[key]
+        return True
+
+    def __contains__(self, cpv):
+        self._load()
+        return cpv in self._pkgs
+
+    def __len__(self):
+        self._load()
+        return len(self._pkgs)
+
+    def revdeps(self, cpv, target, inactive=False):
+        """Return the deps of an installed pkg intersecting an atom.
+
+        :param cpv: cpv string of the installed pkg
+        :param target: :obj:`pkgcore.ebuild.atom.atom` instance
+        :param inactive: include deps whose USE conditionals weren't enabled
+            when the pkg was built
+        :return: list of (dep attr, dep atom, USE flags) tuples
+        """
+        self._load()
+        entry = self._pkgs.get(cpv)
+        if entry is None:
+            return []
+        use = frozenset(entry['use'])
+        l = []
+        for attr in dep_attrs:
+            for dep, flags in entry['deps'].get(attr, ()):
+                if not inactive and not _enabled(flags, use):
+                    continue
+                dep = self._atom(dep)
+                if dep.intersects(target):
+                    l.append((attr, dep, flags))
+        return l
+
+    def blockers(self, cpv, attrs=dep_attrs):
+        """Return the blockers of an installed pkg enabled by its USE flags.
+
+        Note that blockers nested in any-of groups are included as well.
+
+        :param cpv: cpv string of the installed pkg
+        :param attrs: dep attrs to collect blockers from
+        :return: list of blocker atoms
+        """
+        self._load()
+        entry = self._pkgs.get(cpv)
+        if entry is None:
+            return []
+        use = frozenset(entry['use'])
+        l = []
+        for attr in attrs:
+            for dep, flags in entry['deps'].get(attr, ()):
+                if dep[0] == '!' and _enabled(flags, use):
+                    l.append(self._atom(dep))
+        return l
+
+    def dependants(self, target, inactive=False):
+        """Return the cpvs of all installed pkgs with deps intersecting an atom.
+
+        :param inactive: include pkgs with matching deps whose USE
+            conditionals weren't enabled when they were built
+        """
+        self._load()
+        return frozenset(
+            cpv for cpv in self._keys.get(target.key, ())
+            if self.revdeps(cpv, target, inactive=inactive))
+
+
+def _enabled(flags, use):
+    """Check if a set of USE conditionals is satisfied by enabled USE flags."""
+    for flag in flags:
+        if flag[0] == '!':
+            if flag[1:] in use:
+                return False
+        elif flag not in use:
+            return False
+    return True
+
+
+class RevdepRestriction(restriction.base):
+    """Match pkgs with dependencies intersecting an atom.
+
+    Installed pkgs are matched using the reverse dependency index of their
+    repo, all other pkgs fall back to a given restriction matching their deps.
+    """
+
+    __slots__ = ('type', 'negate', 'atom', 'fallback')
+    __inst_caching__ = False
+
+    def __init__(self, atom, fallback):
+        """
+        :param atom: :obj:`pkgcore.ebuild.atom.atom` instance
+        :param fallback: package restriction used for pkgs without an index
+        """
+        sf = object.__setattr__
+        sf(self, 'type', restriction.package_type)
+        sf(self, 'negate', False)
+        sf(self, 'atom', atom)
+        sf(self, 'fallback', fallback)
+
+    def match(self, pkg):
+        index = getattr(pkg.repo, 'revdep_index', None)
+        if index is None or pkg.cpvstr not in index:
+            return self.fallback.match(pkg)
+        return bool(index.revdeps(pkg.cpvstr, self.atom))
+
+    def __str__(self):
+        return f'revdep {self.atom}'
@@ -3,7 +3,7 @@ import operator
 from snakeoil.chksum import LazilyHashedPath
 from snakeoil.test import TestCase
 
-from pkgcore.cache import base, bulk, errors
+from pkgcore.cache import CacheStats, LazyKeyValueEntry, base, bulk, errors
 
 
 def _mk_chf_obj(**kwargs):
@@ -178,6 +178,26 @@ class BaseTest(TestCase):
         db["dar5"] = {"foo":"blah"}
         assert len(tracker) == 3
 
+    def test_stats(self):
+        self.cache = self.get_db()
+        stats = self.cache.stats = CacheStats()
+        self.cache['spork'] = {'foo': 'bar'}
+        self.cache['spork']
+        self.assertRaises(KeyError, operator.getitem, self.cache, 'foon')
+        assert stats.counts['hits'] == 1
+        assert stats.counts['misses'] == 1
+
+        entry = {'_mtime_': 100}
+        assert self.cache.validate_entry(entry, _chf_obj, None)
+        assert not self.cache.validate_entry(entry, _mk_chf_obj(mtime=1), None)
+        assert stats.counts['stale_chf'] == 1
+        assert stats.timings['lookup'] > 0
+        assert stats.timings['validate'] > 0
+
+        assert len(stats.summary()) == 2
+        stats.reset()
+        assert not any(stats.as_dict()['counts'].values())
+
 
 class TestBulk(BaseTest):
 
@@ -190,3 +210,47 @@ class TestBulk(BaseTest):
         # write a key outside of known keys
         db["dar"] = {"foo2":"dar"}
         assert list(db["dar"].items()) == []
+
+
+class TestLazyKeyValueEntry(TestCase):
+
+    data = 'EAPI=7\nKEYWORDS=amd64 ~x86\nSLOT=0\nUNKNOWN=1\n_mtime_=100'
+    known = frozenset(['EAPI', 'KEYWORDS', 'SLOT', '_mtime_', 'IUSE'])
+
+    def get_entry(self):
+        return LazyKeyValueEntry(self.data, self.known, {'_mtime_': int})
+
+    def test_getitem(self):
+        entry = self.get_entry()
+        assert entry['KEYWORDS'] == 'amd64 ~x86'
+        assert entry['_mtime_'] == 100
+        # only accessed keys are decoded
+        assert sorted(entry._data) == ['KEYWORDS', '_mtime_']
+        self.assertRaises(KeyError, operator.getitem, entry, 'UNKNOWN')
+        self.assertRaises(KeyError, operator.getitem, entry, 'IUSE')
+        assert entry.get('IUSE', '') == ''
+
+    def test_mutation(self):
+        entry = self.get_entry()
+        assert entry.pop('SLOT') == '0'
+        assert 'SLOT' not in entry
+        assert entry.pop('SLOT', None) is None
+        self.assertRaises(KeyError, operator.delitem, entry, 'SLOT')
+        entry['SLOT'] = '1'
+        assert entry['SLOT'] == '1'
+        entry['IUSE'] = 'foo'
+        del entry['EAPI']
+        assert dict(entry) == {
+            'SLOT': '1', 'IUSE': 'foo', 'KEYWORDS': 'amd64 ~x86', '_mtime_': 100}
+        assert len(entry) == 4
+
+    def test_duplicate_keys(self):
+        entry = LazyKeyValueEntry('SLOT=0\nSLOT=1\n', self.known)
+        assert entry['SLOT'] == '1'
+        assert list(entry) == ['SLOT']
+
+    def test_malformed(self):
+        for data in ('SLOT=0\nbad\n_mtime_=100', 'SLOT=0\n\nEAPI=7', 'SLOT=0\nbad'):
+            self.assertRaises(ValueError, LazyKeyValueEntry, data, self.known)
+        # trailing newlines are allowed
+        assert LazyKeyValueEntry('SLOT=0\n', self.known)['SLOT'] == '0'
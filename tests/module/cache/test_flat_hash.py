@@ -1,6 +1,10 @@
+import os
+
+import pytest
+from snakeoil.osutils import pjoin
 from snakeoil.test.mixins import TempDirMixin
 
-from pkgcore.cache import flat_hash
+from pkgcore.cache import errors, flat_hash
 
 from . import test_base
 from .test_util import GenericCacheMixin
@@ -23,3 +27,19 @@ class TestFlatHash(GenericCacheMixin, TempDirMixin):
     def get_db(self, readonly=False):
         return db(self.dir,
             auxdbkeys=self.cache_keys, readonly=readonly)
+
+    def test_corrupt_chf(self):
+        os.makedirs(pjoin(self.dir, 'cat'))
+        with open(pjoin(self.dir, 'cat', 'pkg-1'), 'w') as f:
+            f.write('SLOT=0\n_mtime_=garbage\n')
+        cache = self.get_db()
+        with pytest.raises(errors.CacheCorruption):
+            cache['cat/pkg-1']
+
+    def test_malformed(self):
+        os.makedirs(pjoin(self.dir, 'cat'))
+        with open(pjoin(self.dir, 'cat', 'pkg-1'), 'w') as f:
+            f.write('SLOT=0\ngarbage\n_mtime_=100\n')
+        cache = self.get_db()
+        with pytest.raises(errors.CacheCorruption):
+            cache['cat/pkg-1']
@@ -0,0 +1,84 @@
+import pytest
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.cache import CacheStats, errors, lru
+
+from . import test_base
+from .test_sqlite import db as sqlite_db
+from .test_util import GenericCacheMixin
+
+
+class db(lru.database):
+
+    def __setitem__(self, cpv, data):
+        data['_chf_'] = test_base._chf_obj
+        return lru.database.__setitem__(self, cpv, data)
+
+    def __getitem__(self, cpv):
+        d = dict(lru.database.__getitem__(self, cpv).items())
+        d.pop(f'_{self.chf_type}_', None)
+        return d
+
+
+class TestLRU(GenericCacheMixin, TempDirMixin):
+
+    def get_db(self, readonly=False, **kwargs):
+        backend = sqlite_db(self.dir, auxdbkeys=self.cache_keys, readonly=readonly)
+        return db(backend, **kwargs)
+
+    def test_eviction(self):
+        cache = self.get_db(max_entries=2)
+        for i in range(3):
+            cache[f'cat/pkg-{i}'] = {'SLOT': str(i)}
+        assert cache.kept == 0
+        for i in range(3):
+            assert cache[f'cat/pkg-{i}'] == {'SLOT': str(i)}
+        # least recently used entry was dropped
+        assert list(cache._entries) == ['cat/pkg-1', 'cat/pkg-2']
+        cache['cat/pkg-1']
+        cache['cat/pkg-0']
+        assert list(cache._entries) == ['cat/pkg-1', 'cat/pkg-0']
+
+    def test_byte_budget(self):
+        cache = self.get_db(max_entries=None, max_bytes=1)
+        cache['cat/pkg-1'] = {'SLOT': '0'}
+        assert cache['cat/pkg-1'] == {'SLOT': '0'}
+        assert cache.kept == 0
+        assert cache.size == 0
+        cache.commit()
+
+        cache = self.get_db(max_entries=None, max_bytes=2 ** 20)
+        cache['cat/pkg-1']
+        assert cache.kept == 1
+        assert 0 < cache.size <= 2 ** 20
+
+        with pytest.raises(errors.InitializationError):
+            self.get_db(max_entries=None)
+
+    def test_invalidation(self):
+        cache = self.get_db()
+        cache.stats = stats = CacheStats()
+        cache['cat/pkg-1'] = {'SLOT': '0'}
+        assert cache['cat/pkg-1'] == {'SLOT': '0'}
+        assert cache['cat/pkg-1'] == {'SLOT': '0'}
+        # second lookup doesn't hit the backend
+        assert stats.counts['hits'] == 2
+        assert cache.backend.stats is stats
+
+        cache['cat/pkg-1'] = {'SLOT': '1'}
+        assert cache.kept == 0
+        assert cache['cat/pkg-1'] == {'SLOT': '1'}
+        del cache['cat/pkg-1']
+        assert cache.kept == 0
+        assert 'cat/pkg-1' not in cache
+
+    def test_views(self):
+        cache = self.get_db()
+        cache['cat/pkg-1'] = {'SLOT': '0', 'EAPI': '7'}
+        entry = lru.database.__getitem__(cache, 'cat/pkg-1')
+        entry['SLOT'] = '1'
+        del entry['EAPI']
+        assert dict(entry) == {'SLOT': '1'}
+        # modifications don't affect the kept entry
+        entry = lru.database.__getitem__(cache, 'cat/pkg-1')
+        assert dict(entry) == {'SLOT': '0', 'EAPI': '7'}
@@ -0,0 +1,105 @@
+import os
+
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.cache import errors, flat_hash, packed
+
+from . import test_base
+from .test_util import GenericCacheMixin
+
+
+class db(packed.database):
+
+    chf_type = 'mtime'
+    eclass_chf_types = ('mtime',)
+
+    def __setitem__(self, cpv, data):
+        data['_chf_'] = test_base._chf_obj
+        return packed.database.__setitem__(self, cpv, data)
+
+    def __getitem__(self, cpv):
+        d = dict(packed.database.__getitem__(self, cpv).items())
+        d.pop(f'_{self.chf_type}_', None)
+        return d
+
+
+class TestPacked(GenericCacheMixin, TempDirMixin):
+
+    def get_db(self, readonly=False):
+        return db(self.dir,
+            auxdbkeys=self.cache_keys, readonly=readonly)
+
+    def test_roundtrip(self):
+        cache = self.get_db()
+        cache['cat/pkg-1'] = {'SLOT': '0', 'KEYWORDS': 'amd64 ~x86'}
+        cache['cat/pkg-2'] = {'SLOT': '0', 'EAPI': '7'}
+        cache['a/b-1'] = {'SLOT': '1'}
+        # pending entries are visible before being flushed
+        assert cache['cat/pkg-2'] == {'SLOT': '0', 'EAPI': '7'}
+        assert not os.path.exists(pjoin(self.dir, cache.filename))
+        cache.commit()
+
+        cache = self.get_db(readonly=True)
+        assert sorted(cache.keys()) == ['a/b-1', 'cat/pkg-1', 'cat/pkg-2']
+        assert 'cat/pkg-1' in cache
+        assert 'cat/pkg-3' not in cache
+        self.assertRaises(KeyError, cache.__getitem__, 'cat/pkg-3')
+        assert cache['cat/pkg-1'] == {'SLOT': '0', 'KEYWORDS': 'amd64 ~x86'}
+        assert cache['a/b-1'] == {'SLOT': '1'}
+
+    def test_lazy_decoding(self):
+        cache = self.get_db()
+        cache['cat/pkg-1'] = {'SLOT': '0', 'KEYWORDS': 'amd64 ~x86'}
+        cache.commit()
+        cache = self.get_db(readonly=True)
+        entry = packed.database.__getitem__(cache, 'cat/pkg-1')
+        # only the chf is decoded up front
+        assert sorted(entry._data) == ['_mtime_']
+        assert entry['SLOT'] == '0'
+        assert sorted(entry._data) == ['SLOT', '_mtime_']
+        assert entry['_mtime_'] == 100
+        assert entry.pop('KEYWORDS') == 'amd64 ~x86'
+        assert 'KEYWORDS' not in entry
+        assert sorted(entry) == ['SLOT', '_mtime_']
+
+    def test_update(self):
+        cache = self.get_db()
+        cache['cat/pkg-1'] = {'SLOT': '0'}
+        cache['cat/pkg-2'] = {'SLOT': '0'}
+        cache.commit()
+
+        cache = self.get_db()
+        del cache['cat/pkg-1']
+        self.assertRaises(KeyError, cache.__delitem__, 'cat/pkg-1')
+        cache['cat/pkg-2'] = {'SLOT': '2'}
+        cache['cat/pkg-3'] = {'SLOT': '3'}
+        assert sorted(cache.keys()) == ['cat/pkg-2', 'cat/pkg-3']
+        cache.commit()
+        cache = self.get_db(readonly=True)
+        assert sorted(cache.keys()) == ['cat/pkg-2', 'cat/pkg-3']
+        assert cache['cat/pkg-2'] == {'SLOT': '2'}
+
+    def test_corrupt(self):
+        with open(pjoin(self.dir, packed.database.filename), 'wb') as f:
+            f.write(b'garbage')
+        cache = self.get_db(readonly=True)
+        self.assertRaises(errors.CacheError, cache.__getitem__, 'cat/pkg-1')
+
+    def test_clone_md5_cache(self):
+        md5_dir = pjoin(self.dir, 'repo', 'metadata', 'md5-cache', 'cat')
+        os.makedirs(md5_dir)
+        with open(pjoin(md5_dir, 'pkg-1'), 'w') as f:
+            f.write(
+                'EAPI=7\nKEYWORDS=amd64\nSLOT=0\n'
+                '_eclasses_=foo\t2c95d6a8e0f1b1cbc4a8d0b3e4c5b0c1\n'
+                '_md5_=d41d8cd98f00b204e9800998ecf8427e\n')
+        source = flat_hash.md5_cache(pjoin(self.dir, 'repo'))
+        target = packed.database(pjoin(self.dir, 'packed'))
+        for k, v in source.items():
+            target[k] = v
+        target.commit()
+
+        target = packed.database(pjoin(self.dir, 'packed'), readonly=True)
+        assert list(target.keys()) == ['cat/pkg-1']
+        assert source['cat/pkg-1'] == dict(target['cat/pkg-1'].items())
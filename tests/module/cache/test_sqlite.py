@@ -0,0 +1,108 @@
+import pytest
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.cache import errors, sqlite
+
+from . import test_base
+from .test_util import GenericCacheMixin
+
+
+class db(sqlite.database):
+
+    def __setitem__(self, cpv, data):
+        data['_chf_'] = test_base._chf_obj
+        return sqlite.database.__setitem__(self, cpv, data)
+
+    def __getitem__(self, cpv):
+        d = dict(sqlite.database.__getitem__(self, cpv).items())
+        d.pop(f'_{self.chf_type}_', None)
+        return d
+
+
+class TestSqlite(GenericCacheMixin, TempDirMixin):
+
+    def get_db(self, readonly=False):
+        return db(self.dir,
+            auxdbkeys=self.cache_keys, readonly=readonly)
+
+    def test_persistence(self):
+        cache = self.get_db()
+        cache['cat/pkg-1'] = {'SLOT': '0', 'KEYWORDS': 'amd64 ~x86'}
+        cache['cat/pkg-2'] = {'SLOT': '1', 'EAPI': '7'}
+        # uncommitted entries are visible to the writer
+        assert cache['cat/pkg-2']['SLOT'] == '1'
+        cache.commit()
+        del cache
+
+        cache = self.get_db(readonly=True)
+        assert sorted(cache.keys()) == ['cat/pkg-1', 'cat/pkg-2']
+        assert 'cat/pkg-1' in cache
+        assert 'cat/pkg-3' not in cache
+        assert cache['cat/pkg-1'] == {'SLOT': '0', 'KEYWORDS': 'amd64 ~x86'}
+
+    def test_missing_readonly(self):
+        cache = self.get_db(readonly=True)
+        assert list(cache.keys()) == []
+        assert 'cat/pkg-1' not in cache
+        self.assertRaises(KeyError, cache.__getitem__, 'cat/pkg-1')
+
+    def test_delitem(self):
+        cache = self.get_db()
+        cache['cat/pkg-1'] = {'SLOT': '0'}
+        del cache['cat/pkg-1']
+        assert 'cat/pkg-1' not in cache
+        self.assertRaises(KeyError, cache.__delitem__, 'cat/pkg-1')
+
+    def test_sync_rate(self):
+        cache = self.get_db()
+        cache.set_sync_rate(2)
+        cache['cat/pkg-1'] = {'SLOT': '0'}
+        assert list(self.get_db(readonly=True).keys()) == []
+        cache['cat/pkg-2'] = {'SLOT': '0'}
+        assert sorted(self.get_db(readonly=True).keys()) == ['cat/pkg-1', 'cat/pkg-2']
+
+    def test_default_sync_rate(self):
+        cache = self.get_db()
+        cache['cat/pkg-1'] = {'SLOT': '0'}
+        assert list(self.get_db(readonly=True).keys()) == ['cat/pkg-1']
+
+    def test_sync(self):
+        cache = self.get_db()
+        cache.set_sync_rate(1000)
+        cache['cat/pkg-1'] = {'SLOT': '0'}
+        assert list(self.get_db(readonly=True).keys()) == []
+        cache.sync()
+        assert list(self.get_db(readonly=True).keys()) == ['cat/pkg-1']
+
+    def test_close(self):
+        cache = self.get_db()
+        cache.set_sync_rate(1000)
+        cache['cat/pkg-1'] = {'SLOT': '0'}
+        cache.close()
+        assert list(self.get_db(readonly=True).keys()) == ['cat/pkg-1']
+        # closing again is a no-op and the connection is reopened on demand
+        cache.close()
+        assert cache['cat/pkg-1'] == {'SLOT': '0'}
+
+    def test_rollback_on_del(self):
+        cache = self.get_db()
+        cache.set_sync_rate(1000)
+        cache['cat/pkg-1'] = {'SLOT': '0'}
+        del cache
+        assert list(self.get_db(readonly=True).keys()) == []
+
+    def test_corrupt_chf(self):
+        cache = self.get_db()
+        cache.connection.execute(
+            'INSERT INTO metadata (cpv, data) VALUES (?, ?)',
+            ('cat/pkg-1', 'SLOT=0\n_mtime_=garbage'))
+        with pytest.raises(errors.CacheCorruption):
+            cache['cat/pkg-1']
+
+    def test_malformed(self):
+        cache = self.get_db()
+        cache.connection.execute(
+            'INSERT INTO metadata (cpv, data) VALUES (?, ?)',
+            ('cat/pkg-1', 'SLOT=0\ngarbage\n_mtime_=100'))
+        with pytest.raises(errors.CacheCorruption):
+            cache['cat/pkg-1']
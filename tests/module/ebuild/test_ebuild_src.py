@@ -1,5 +1,7 @@
 import os
 import textwrap
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from functools import partial
 
 import pytest
@@ -592,3 +594,97 @@ class TestPackageFactory:
         # thus, modifying (popping _mtime_) _is_ valid
         assert cache2[pkg.cpvstr] == \
             {'_eclasses_': {'eclass1': (None, 100)}, 'marker': 2, '_mtime_': 200}
+
+    def test_validate_metadata(self):
+        ec = FakeEclassCache('/nonexistent/path')
+        pkgs = [
+            malleable_obj(cpvstr=f'dev-util/diffball-{x}', path='bollocks')
+            for x in range(10)]
+
+        class fake_cache(dict):
+            readonly = True
+            def validate_entry(self, data, *args):
+                return data['valid']
+
+        cache = fake_cache(
+            (pkg.cpvstr, {'valid': i % 2 == 0, 'marker': i})
+            for i, pkg in enumerate(pkgs))
+        del cache[pkgs[-2].cpvstr]
+
+        def update_metadata(pkg, ebp=None):
+            return {'regen': pkg.cpvstr}
+
+        pf = self.mkinst(
+            cache=(cache,), eclasses=ec, _update_metadata=update_metadata)
+        valid = pf.validate_metadata(pkgs, threads=3)
+        assert sorted(valid) == sorted(pkgs[i].cpvstr for i in (0, 2, 4, 6))
+        assert valid[pkgs[2].cpvstr]['marker'] == 2
+        assert not pf._primed
+
+        pf.validate_metadata(pkgs, threads=3, prime=True)
+        assert sorted(pf._primed) == sorted(valid)
+        # primed entries are used once, then dropped
+        cache[pkgs[0].cpvstr] = {'valid': True, 'marker': 'new'}
+        assert pf._get_metadata(pkgs[0])['marker'] == 0
+        assert pkgs[0].cpvstr not in pf._primed
+        assert pf._get_metadata(pkgs[0])['marker'] == 'new'
+        assert pf._get_metadata(pkgs[1]) == {'regen': pkgs[1].cpvstr}
+
+        # priming is bounded, keeping the first entries in package order
+        pf.clear_primed()
+        assert not pf._primed
+        pf.prime_limit = 2
+        pf.validate_metadata(pkgs, threads=3, prime=True)
+        assert list(pf._primed) == [pkgs[0].cpvstr, pkgs[2].cpvstr]
+        assert pf._get_metadata(pkgs[0])['marker'] == 'new'
+        pf.validate_metadata(pkgs[3:], threads=3, prime=True)
+        assert list(pf._primed) == [pkgs[2].cpvstr, pkgs[4].cpvstr]
+
+    def test_prefetch_metadata(self):
+        ec = FakeEclassCache('/nonexistent/path')
+        pkgs = [
+            malleable_obj(cpvstr=f'dev-util/diffball-{x}', path='bollocks')
+            for x in range(3)]
+        loaded = malleable_obj(cpvstr='dev-util/diffball-3', path='bollocks', data={})
+
+        class fake_cache(dict):
+            readonly = True
+            def validate_entry(self, *args):
+                return True
+
+        cache = fake_cache({pkgs[0].cpvstr: {'marker': 0}})
+        release = threading.Event()
+        regens = []
+
+        def update_metadata(pkg, ebp=None):
+            release.wait()
+            regens.append(pkg.cpvstr)
+            return {'regen': pkg.cpvstr}
+
+        pf = self.mkinst(
+            cache=(cache,), eclasses=ec, _update_metadata=update_metadata)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            futures = pf.prefetch_metadata(pkgs + [loaded], executor)
+            # pkgs with loaded or pending metadata are skipped
+            assert len(futures) == 3
+            assert not pf.prefetch_metadata(pkgs, executor)
+            # queued prefetches get cancelled and loaded directly
+            release.set()
+            assert pf._get_metadata(pkgs[2]) == {'regen': pkgs[2].cpvstr}
+            # running or finished ones are waited for
+            assert pf._get_metadata(pkgs[1]) == {'regen': pkgs[1].cpvstr}
+            assert pf._get_metadata(pkgs[0]) == {'marker': 0}
+        assert sorted(regens) == [pkgs[1].cpvstr, pkgs[2].cpvstr]
+        assert not pf._prefetching
+        assert not pf._primed
+
+        # prefetching stops once the limit of entries awaiting use is hit
+        pf.prime_limit = 2
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            futures = pf.prefetch_metadata(pkgs, executor)
+            assert len(futures) == 2
+            wait(futures)
+        assert sorted(pf._primed) == [pkgs[0].cpvstr, pkgs[1].cpvstr]
+        pf.clear_primed()
+        assert not pf._prefetching
+        assert not pf._primed
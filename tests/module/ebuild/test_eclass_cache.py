@@ -37,6 +37,15 @@ class TestBase(TestCase):
         assertRebuildResults(True, 'eclass1', 100)
         assertRebuildResults(False, 'eclass1', 200)
 
+    def test_rebuild_eclass_entry_memoized(self):
+        data = [(x, (('mtime', self.ec.eclasses[x].mtime),))
+                for x in ('eclass1', 'eclass2')]
+        got = self.ec.rebuild_cache_entry(data)
+        self.assertEqual(sorted(got), ['eclass1', 'eclass2'])
+        self.assertIdentical(got, self.ec.rebuild_cache_entry(list(data)))
+        self.assertIdentical(None, self.ec.rebuild_cache_entry(
+            [('eclass1', (('mtime', 1),))]))
+
     def test_get_eclass_data(self):
         keys = list(self.ec.eclasses.keys())
         data = self.ec.get_eclass_data([])
@@ -92,3 +101,58 @@ class TestStackedCaches(TestEclassCache):
         self.ec_locs = {"eclass1":self.loc1, "eclass2":self.loc2}
         # make a shadowed file to verify it's not seen
         open(pjoin(self.loc2, 'eclass1.eclass'), 'w').close()
+
+
+class TestConsumerIndex(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        for x in ("eclass1", "eclass2"):
+            open(pjoin(self.dir, f"{x}.eclass"), "w").close()
+            os.utime(pjoin(self.dir, f"{x}.eclass"), (100, 100))
+        self.ec = eclass_cache.cache(self.dir)
+        self.path = pjoin(self.dir, '.eclass_index')
+        self.index = eclass_cache.ConsumerIndex(self.path)
+
+    def test_consumers(self):
+        self.index.update('cat/a-1', self.ec.get_eclass_data(['eclass1']))
+        self.index.update('cat/b-1', self.ec.get_eclass_data(['eclass1', 'eclass2']))
+        self.assertEqual(self.index.consumers(['eclass1']), {'cat/a-1', 'cat/b-1'})
+        self.assertEqual(self.index.consumers(['eclass2']), {'cat/b-1'})
+        self.assertEqual(self.index.consumers(['eclass3']), set())
+
+        # updates replace the previously recorded inherits
+        self.index.update('cat/b-1', {})
+        self.assertEqual(self.index.consumers(['eclass2']), set())
+        self.index.discard('cat/a-1')
+        self.assertEqual(self.index.consumers(['eclass1']), set())
+        self.assertEqual(len(self.index), 1)
+
+    def test_persistence(self):
+        self.assertFalse(self.index.load())
+        self.index.update('cat/a-1', self.ec.get_eclass_data(['eclass1']))
+        self.index.update('cat/b-1', self.ec.get_eclass_data(['eclass2']))
+        self.index.write()
+
+        index = eclass_cache.ConsumerIndex(self.path)
+        self.assertTrue(index.load())
+        self.assertIn('cat/a-1', index)
+        self.assertEqual(index.changed_eclasses(self.ec), set())
+
+        # modified and removed eclasses are detected
+        os.utime(pjoin(self.dir, 'eclass1.eclass'), (200, 200))
+        os.unlink(pjoin(self.dir, 'eclass2.eclass'))
+        ec = eclass_cache.cache(self.dir)
+        changed = index.changed_eclasses(ec)
+        self.assertEqual(changed, {'eclass1', 'eclass2'})
+        self.assertEqual(index.consumers(changed), {'cat/a-1', 'cat/b-1'})
+
+        # indexes using different checksum types are ignored
+        index = eclass_cache.ConsumerIndex(self.path, chf_types=('md5',))
+        self.assertFalse(index.load())
+
+    def test_corrupt(self):
+        with open(self.path, 'w') as f:
+            f.write('{')
+        self.assertFalse(self.index.load())
+        self.assertEqual(len(self.index), 0)
@@ -0,0 +1,322 @@
+import gc
+import os
+import signal
+import subprocess
+import threading
+
+import pytest
+from snakeoil.osutils import pjoin
+
+from pkgcore.cache.flat_hash import md5_cache
+from pkgcore.ebuild import eclass_cache, processor, repository
+from pkgcore.ebuild.atom import atom
+from pkgcore.package.errors import MetadataException
+
+
+class TestProcessorPool:
+
+    @pytest.fixture(autouse=True)
+    def _setup(self):
+        self.pools = []
+        yield
+        for pool in self.pools:
+            for ebp in pool.active + pool.inactive:
+                ebp.shutdown_processor(force=True)
+
+    def pool(self, **kwargs):
+        pool = processor.ProcessorPool(**kwargs)
+        self.pools.append(pool)
+        return pool
+
+    def request(self, pool, **kwargs):
+        with processor._global_ebp_lock:
+            return pool.request(sandbox=False, **kwargs)
+
+    def release(self, pool, ebp):
+        with processor._global_ebp_lock:
+            return pool.release(ebp)
+
+    def test_reuse(self):
+        pool = self.pool()
+        ebp = self.request(pool)
+        assert pool.active == [ebp]
+        assert self.release(pool, ebp)
+        assert pool.inactive == [ebp]
+        # releasing unknown processors fails
+        assert not self.release(pool, ebp)
+        assert self.request(pool) is ebp
+        self.release(pool, ebp)
+
+        # userpriv processors aren't handed out for regular requests
+        other = self.request(pool, userpriv=True)
+        assert other is not ebp
+        self.release(pool, other)
+
+        assert pool.requests == 3
+        assert pool.reused == 1
+        assert pool.spawned == 2
+        assert pool.reuse_rate == pytest.approx(1 / 3)
+        assert pool.spawn_latency > 0
+        assert len(pool.summary()) == 2
+
+    def test_fd_pipes(self):
+        pool = self.pool()
+        ebp = self.request(pool)
+        self.release(pool, ebp)
+        # processors with custom fd mappings are neither reused nor kept
+        custom = self.request(pool, fd_pipes={1: 1})
+        assert custom is not ebp
+        self.release(pool, custom)
+        assert pool.inactive == [ebp]
+        assert custom.pid is None
+
+    def test_max_size(self):
+        pool = self.pool(max_size=1)
+        ebps = [self.request(pool) for _ in range(3)]
+        for ebp in ebps:
+            self.release(pool, ebp)
+        assert pool.inactive == ebps[:1]
+        assert [x.pid for x in ebps[1:]] == [None, None]
+
+    def test_idle_reaping(self):
+        pool = self.pool(min_size=1, idle_timeout=0)
+        ebps = [self.request(pool) for _ in range(3)]
+        for ebp in ebps:
+            self.release(pool, ebp)
+        # the most recently released processor is kept for the minimum size
+        assert pool.inactive == ebps[-1:]
+        assert pool.reaped == 2
+        assert [x.pid for x in ebps[:2]] == [None, None]
+
+    def test_configure(self):
+        pool = self.pool()
+        ebps = [self.request(pool) for _ in range(3)]
+        for ebp in ebps:
+            self.release(pool, ebp)
+        assert len(pool.inactive) == 3
+        with processor._global_ebp_lock:
+            # the least recently released processors exceeding the limits go
+            pool.configure(max_size=2)
+            assert pool.inactive == ebps[1:]
+            pool.configure(min_size=1, max_size=2, idle_timeout=0)
+            assert pool.inactive == ebps[2:]
+            assert pool.reaped == 1
+            assert [x.pid for x in ebps[:2]] == [None, None]
+            with pytest.raises(ValueError):
+                pool.configure(min_size=2, max_size=1)
+            with pytest.raises(ValueError):
+                pool.configure(min_size=-1)
+
+    def test_health_checks(self):
+        pool = self.pool()
+        ebp = self.request(pool)
+        self.release(pool, ebp)
+        os.killpg(ebp.pid, signal.SIGKILL)
+        os.waitpid(ebp.pid, 0)
+        replacement = self.request(pool)
+        assert replacement is not ebp
+        assert pool.unhealthy == 1
+        self.release(pool, replacement)
+
+        # processors idle for longer than the health interval are pinged
+        pool.health_interval = 0
+        assert self.request(pool) is replacement
+        assert replacement.is_responsive
+        self.release(pool, replacement)
+
+    def test_expect_timeout(self):
+        pool = self.pool()
+        ebp = self.request(pool)
+        results = []
+
+        def ping():
+            results.append(ebp.is_responsive)
+            os.kill(ebp.pid, signal.SIGSTOP)
+            ebp.write("alive")
+            results.append(ebp.expect("yep!", timeout=0.1))
+
+        # timeouts are honored off the main thread
+        thread = threading.Thread(target=ping)
+        thread.start()
+        thread.join()
+        os.kill(ebp.pid, signal.SIGCONT)
+        assert results == [True, False]
+        ebp.shutdown_processor(force=True)
+        self.release(pool, ebp)
+
+    def test_prewarm(self):
+        pool = self.pool(min_size=2)
+        threads = pool.prewarm(sandbox=False, wait=True)
+        assert len(threads) == 2
+        assert len(pool.inactive) == 2
+        assert pool.spawned == 2
+        # already warm
+        assert pool.prewarm(sandbox=False) == []
+
+        ebps = [self.request(pool) for _ in range(2)]
+        assert pool.reused == 2
+        assert pool.spawned == 2
+        for ebp in ebps:
+            self.release(pool, ebp)
+
+    def test_prewarm_pending(self):
+        pool = self.pool()
+        pool.prewarm(1, sandbox=False)
+        # requests wait on processors being prewarmed instead of spawning
+        ebp = self.request(pool)
+        assert pool.spawned == 1
+        assert pool.reused == 1
+        self.release(pool, ebp)
+
+    def test_clear_preloaded_eclasses(self):
+        pool = self.pool()
+        ebp = self.request(pool)
+        assert ebp.clear_preloaded_eclasses()
+        assert ebp.is_responsive
+        self.release(pool, ebp)
+
+
+class TestRequests:
+
+    @pytest.fixture(autouse=True)
+    def _setup(self, tmp_path):
+        self.location = str(tmp_path)
+        (tmp_path / 'profiles').mkdir()
+        (tmp_path / 'profiles' / 'categories').write_text('cat\n')
+        (tmp_path / 'metadata').mkdir()
+        (tmp_path / 'metadata' / 'layout.conf').write_text('masters =\n')
+        (tmp_path / 'eclass').mkdir()
+        (tmp_path / 'eclass' / 'foo.eclass').write_text('HOMEPAGE="https://foo"\n')
+        ebuilds = {
+            'good': 'inherit foo',
+            'other': 'inherit foo',
+            'unknown': 'inherit nonexistent',
+            'broken': 'die broken',
+        }
+        for pkg, data in ebuilds.items():
+            (tmp_path / 'cat' / pkg).mkdir(parents=True)
+            (tmp_path / 'cat' / pkg / f'{pkg}-1.ebuild').write_text(
+                f'EAPI=7\n{data}\nDESCRIPTION="{pkg}"\nSLOT=0\n')
+        ecache = eclass_cache.cache(pjoin(self.location, 'eclass'), location=self.location)
+        self.cache = md5_cache(self.location, readonly=False)
+        self.repo = repository.UnconfiguredTree(
+            self.location, eclass_cache=ecache, cache=(self.cache,))
+
+        self.pool = processor.ProcessorPool()
+        with processor._global_ebp_lock:
+            self.ebp = self.pool.request(sandbox=False)
+        yield
+        # regen helpers kept alive by failures' tracebacks release their
+        # processors on collection, which deadlocks if it happens while the
+        # global processor lock is held
+        gc.collect()
+        for ebp in self.pool.active + self.pool.inactive:
+            ebp.shutdown_processor(force=True)
+
+    def pkg(self, name):
+        return self.repo.match(atom(f'cat/{name}'), pkg_filter=None)[0]
+
+    def test_framing(self):
+        requests = [
+            self.ebp.submit('alive', reader=processor._reply_reader('yep!'))
+            for _ in range(3)]
+        assert len({x.id for x in requests}) == 3
+        assert self.ebp.pending_requests == 3
+        # replies are consumed in order up to the requested one
+        assert self.ebp.complete(requests[1])
+        assert [x.done for x in requests] == [True, True, False]
+        assert self.ebp.complete(requests[0])
+        self.ebp.complete()
+        assert self.ebp.pending_requests == 0
+        assert requests[2].result
+        assert self.ebp.is_responsive
+
+    def test_metadata(self):
+        assert self.ebp.set_eclass_paths(self.repo.eclass_cache)
+        requests = {
+            name: self.ebp.submit_get_keys(self.pkg(name))
+            for name in ('good', 'other')}
+        keys = self.ebp.complete(requests['good'])
+        assert keys['HOMEPAGE'] == 'https://foo'
+        assert keys['INHERITED'] == 'foo'
+        assert self.ebp.complete(requests['other'])['DESCRIPTION'] == 'other'
+        # reverting to requesting inherits from python
+        assert self.ebp.set_eclass_paths(None)
+        keys = self.ebp.get_keys(self.pkg('good'), self.repo.eclass_cache)
+        assert keys['HOMEPAGE'] == 'https://foo'
+
+    def test_failure(self):
+        assert self.ebp.set_eclass_paths(self.repo.eclass_cache)
+        requests = [
+            self.ebp.submit_get_keys(self.pkg(name))
+            for name in ('good', 'unknown', 'other')]
+        assert self.ebp.complete(requests[0])
+        with pytest.raises(processor.EbdError, match='nonexistent'):
+            self.ebp.complete(requests[1])
+        # die() kills the processor, losing the requests queued behind it
+        assert not self.ebp.pid
+        assert self.ebp.pending_requests == 0
+        with pytest.raises(processor.ProcessorError, match='died'):
+            self.ebp.complete(requests[2])
+
+    def test_pipelined_regen(self):
+        helper = repository._RegenOpHelper(self.repo, force=True)
+        helper.window = 2
+        pkgs = [self.pkg(x) for x in ('good', 'unknown', 'broken', 'other')]
+        failures = list(helper.pipelined(pkgs))
+        assert sorted(pkg.package for pkg, _e in failures) == ['broken', 'unknown']
+        assert all(isinstance(e, MetadataException) for _pkg, e in failures)
+        assert sorted(self.cache) == ['cat/good-1', 'cat/other-1']
+        assert self.cache['cat/good-1']['HOMEPAGE'] == 'https://foo'
+        assert 'foo' in helper.preloaded_eclasses
+        assert helper.ebp.pending_requests == 0
+
+    def test_pipelined_regen_disabled(self):
+        helper = self.repo._regen_operation_helper(pipeline_window=1)
+        assert helper.window == 1
+        assert helper.pipelined is None
+        assert self.repo._regen_operation_helper().pipelined is not None
+
+
+class TestGenerateEnvStr:
+
+    class Processor(processor.EbuildProcessor):
+        """Processor that isn't spawned, for env generation only."""
+
+        def __init__(self):
+            self._readonly_vars = frozenset(['RO'])
+
+        def __del__(self):
+            pass
+
+    def load(self, env, *names):
+        """Evaluate the env string in bash, returning the values of variables."""
+        data = self.Processor()._generate_env_str(env)
+        script = ''.join(f'printf "%s\\0" "${{{x}[@]-unset}}"\n' for x in names)
+        ret = subprocess.run(
+            ['bash', '-c', f'eval "$1"\n{script}', 'bash', data],
+            stdout=subprocess.PIPE, check=True)
+        return ret.stdout.decode().split('\0')[:-1]
+
+    def test_values(self):
+        env = {
+            'ALNUM': 'abc123',
+            'EMPTY': '',
+            'QUOTES': 'it\'s "quoted" $HOME `cmd`',
+            'ESCAPES': 'back\\slash \\n it\'s',
+            'NEWLINES': 'a\nb\n\n\'c\'\n',
+            'RO': 'readonly',
+        }
+        names = sorted(env)
+        expected = dict(env, RO='unset')
+        assert self.load(env, *names) == [expected[x] for x in names]
+
+    def test_arrays(self):
+        values = ('a b', "c'd", '', 'e\\nf\n', '"$g"')
+        assert self.load({'ARRAY': values}, 'ARRAY') == list(values)
+
+    def test_bad_values(self):
+        with pytest.raises(KeyError):
+            self.Processor()._generate_env_str({'1VAR': 'x'})
+        with pytest.raises(ValueError):
+            self.Processor()._generate_env_str({'VAR': 1})
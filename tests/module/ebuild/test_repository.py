@@ -1,15 +1,20 @@
 import os
+import shutil
+import subprocess
 import textwrap
 from unittest import mock
 
+import pytest
 from snakeoil.fileutils import touch
 from snakeoil.osutils import ensure_dirs, pjoin
 from snakeoil.test.mixins import TempDirMixin
 
+from pkgcore.cache import flat_hash
 from pkgcore.ebuild import eclass_cache
 from pkgcore.ebuild import errors as ebuild_errors
 from pkgcore.ebuild import repository, restricts
 from pkgcore.ebuild.atom import atom
+from pkgcore.operations import repo as repo_ops
 from pkgcore.repository import errors
 
 
@@ -211,6 +216,115 @@ class TestUnconfiguredTree(TempDirMixin):
             sorted(repo.pkg_masks))
 
 
+class TestRepoOperations(TempDirMixin):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.repo_dir = pjoin(self.dir, 'repo')
+        ensure_dirs(pjoin(self.repo_dir, 'profiles'))
+        ensure_dirs(pjoin(self.repo_dir, 'metadata'))
+        with open(pjoin(self.repo_dir, 'metadata', 'layout.conf'), 'w') as f:
+            f.write('masters =\n')
+
+    def mk_tree(self, cache=()):
+        epath = pjoin(self.repo_dir, 'eclass')
+        ensure_dirs(epath)
+        return repository.UnconfiguredTree(
+            self.repo_dir, cache=cache, eclass_cache=eclass_cache.cache(epath))
+
+    def test_eclass_index_location(self):
+        self.assertIdentical(None, self.mk_tree().operations._get_eclass_index())
+
+        # indexes for external caches are stored alongside them
+        external = flat_hash.database(pjoin(self.dir, 'cache'))
+        index = self.mk_tree(cache=(external,)).operations._get_eclass_index()
+        self.assertEqual(pjoin(self.dir, 'cache', '.eclass_index'), index.path)
+
+        # while repo internal caches don't get their repo polluted
+        user_cache = pjoin(self.dir, 'user')
+        with mock.patch('pkgcore.const.USER_CACHE_PATH', user_cache):
+            internal = flat_hash.md5_cache(self.repo_dir)
+            index = self.mk_tree(cache=(internal,)).operations._get_eclass_index()
+        assert index.path.startswith(user_cache + os.sep)
+
+    def git(self, *args):
+        return subprocess.run(
+            ['git', '-c', 'user.name=a', '-c', 'user.email=a@b', *args],
+            cwd=self.repo_dir, check=True, stdout=subprocess.PIPE,
+            encoding='utf8').stdout.strip()
+
+    @pytest.mark.skipif(shutil.which('git') is None, reason='requires git')
+    def test_git_changed_cpvs(self):
+        repo = self.mk_tree()
+        ops = repo.operations
+
+        self.git('init', '-q')
+        ensure_dirs(pjoin(repo.location, 'cat', 'pkg'))
+        touch(pjoin(repo.location, 'cat', 'pkg', 'pkg-1.ebuild'))
+        self.git('add', '.')
+        self.git('commit', '-q', '-m', 'first')
+        first = ops._git_head()
+        self.assertEqual(first, self.git('rev-parse', 'HEAD'))
+
+        touch(pjoin(repo.location, 'cat', 'pkg', 'pkg-2.ebuild'))
+        touch(pjoin(repo.location, 'cat', 'pkg', 'metadata.xml'))
+        self.git('rm', '-q', 'cat/pkg/pkg-1.ebuild')
+        self.git('add', '.')
+        self.git('commit', '-q', '-m', 'second')
+        second = ops._git_head()
+        self.assertEqual(
+            {'cat/pkg-1', 'cat/pkg-2'}, ops._git_changed_cpvs(first, second))
+        self.assertEqual(set(), ops._git_changed_cpvs(second, second))
+        self.assertIdentical(None, ops._git_changed_cpvs('0' * 40, second))
+
+    @pytest.mark.skipif(shutil.which('git') is None, reason='requires git')
+    def test_incremental_regen(self):
+        def write_ebuild(cpv, description, mtime):
+            cat, pkg = cpv.split('/')
+            path = pjoin(self.repo_dir, cat, pkg.rsplit('-', 1)[0])
+            ensure_dirs(path)
+            path = pjoin(path, f'{pkg}.ebuild')
+            with open(path, 'w') as f:
+                f.write(f'EAPI=7\nSLOT=0\nDESCRIPTION="{description}"\n')
+            os.utime(path, (mtime, mtime))
+
+        cache = flat_hash.database(pjoin(self.dir, 'cache'))
+        for cpv in ('cat/a-1', 'cat/b-1'):
+            write_ebuild(cpv, 'first', 1000)
+        self.git('init', '-q')
+        self.git('add', '.')
+        self.git('commit', '-q', '-m', 'first')
+
+        # track the pkgs the generic regen implementation gets passed
+        regen_cache = repo_ops.operations._cmd_api_regen_cache
+        targets = []
+        def _regen_cache(ops, pkgs=None, **kwargs):
+            targets.append(None if pkgs is None else sorted(x.cpvstr for x in pkgs))
+            return regen_cache(ops, pkgs=pkgs, **kwargs)
+
+        with mock.patch.object(repo_ops.operations, '_cmd_api_regen_cache', _regen_cache):
+            # no previous regen run exists so a full regen is done
+            assert self.mk_tree(cache=(cache,)).operations.regen_cache(incremental=True) == 0
+            assert targets.pop() is None
+            assert cache['cat/b-1']['DESCRIPTION'] == 'first'
+
+            write_ebuild('cat/b-1', 'second', 2000)
+            write_ebuild('cat/c-1', 'second', 2000)
+            self.git('add', '.')
+            self.git('commit', '-q', '-m', 'second')
+
+            # only the ebuilds changed since then get regenerated
+            assert self.mk_tree(cache=(cache,)).operations.regen_cache(incremental=True) == 0
+            assert targets.pop() == ['cat/b-1', 'cat/c-1']
+            assert cache['cat/a-1']['DESCRIPTION'] == 'first'
+            assert cache['cat/b-1']['DESCRIPTION'] == 'second'
+            assert cache['cat/c-1']['DESCRIPTION'] == 'second'
+
+            # nothing changed
+            assert self.mk_tree(cache=(cache,)).operations.regen_cache(incremental=True) == 0
+            assert targets.pop() == []
+
+
 class TestSlavedTree(TestUnconfiguredTree):
 
     def mk_tree(self, path, *args, **kwds):
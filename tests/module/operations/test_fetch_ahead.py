@@ -0,0 +1,197 @@
+import os
+import threading
+import time
+
+import pytest
+from snakeoil import data_source
+from snakeoil.chksum import get_handlers
+
+from pkgcore.fetch import custom, fetchable
+from pkgcore.operations import format, observer
+from pkgcore.operations.fetch_ahead import FetchAhead
+
+
+class Fetcher:
+
+    def __init__(self, fail=(), delay=0.0):
+        self.fail = set(fail)
+        self.delay = delay
+        self.fetched = []
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self, item):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            self.fetched.append(item)
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+        if item in self.fail:
+            return False
+        return f'{item}-fetched'
+
+
+class TestFetchAhead:
+
+    def test_results(self):
+        fetcher = Fetcher()
+        fetch_ahead = FetchAhead(['a', 'b', 'c'], fetcher, depth=1)
+        assert [fetch_ahead.get(i) for i in range(3)] == ['a-fetched', 'b-fetched', 'c-fetched']
+        fetch_ahead.shutdown()
+        assert fetcher.fetched == ['a', 'b', 'c']
+        assert fetch_ahead.failed == []
+
+    def test_depth(self):
+        fetcher = Fetcher()
+        fetch_ahead = FetchAhead(list('abcdef'), fetcher, depth=2)
+        fetch_ahead.get(0)
+        # only the requested item and the ones within depth are submitted
+        time.sleep(0.05)
+        assert fetcher.fetched == ['a', 'b', 'c']
+        fetch_ahead.get(1)
+        time.sleep(0.05)
+        assert fetcher.fetched == ['a', 'b', 'c', 'd']
+        fetch_ahead.shutdown()
+
+    def test_jobs(self):
+        fetcher = Fetcher(delay=0.05)
+        fetch_ahead = FetchAhead(list('abcd'), fetcher, depth=3, jobs=2)
+        for i in range(4):
+            fetch_ahead.get(i)
+        fetch_ahead.shutdown()
+        assert fetcher.max_running == 2
+
+        fetcher = Fetcher(delay=0.05)
+        fetch_ahead = FetchAhead(list('abcd'), fetcher, depth=3)
+        for i in range(4):
+            fetch_ahead.get(i)
+        fetch_ahead.shutdown()
+        assert fetcher.max_running == 1
+
+    def test_failures_reported_early(self):
+        events = []
+        fetcher = Fetcher(fail=('c',))
+        fetch_ahead = FetchAhead(
+            list('abcd'), fetcher, depth=3,
+            report=lambda event, item: events.append((event, item)))
+        fetch_ahead.get(0)
+        # wait for the failing fetch ahead of the current item to finish
+        while len(fetcher.fetched) < 4 or fetcher.running:
+            time.sleep(0.01)
+        assert fetch_ahead.get(1) == 'b-fetched'
+        assert ('failed', 'c') in events
+        assert fetch_ahead.failed == [2]
+        assert fetch_ahead.get(2) is False
+        # failures are only reported once
+        assert events.count(('failed', 'c')) == 1
+        fetch_ahead.shutdown()
+
+    def test_current_failure(self):
+        events = []
+        fetch_ahead = FetchAhead(
+            ['a'], Fetcher(fail=('a',)), depth=1,
+            report=lambda event, item: events.append((event, item)))
+        assert fetch_ahead.get(0) is False
+        assert fetch_ahead.failed == [0]
+        # the requested item's failure is left to the caller to report
+        assert ('failed', 'a') not in events
+        fetch_ahead.shutdown()
+
+    def test_stalls(self):
+        events = []
+        fetch_ahead = FetchAhead(
+            ['a', 'b'], Fetcher(delay=0.05), depth=1,
+            report=lambda event, item: events.append((event, item)))
+        fetch_ahead.get(0)
+        assert fetch_ahead.stalls == 1
+        assert events == [('waiting', 'a')]
+        time.sleep(0.1)
+        fetch_ahead.get(1)
+        # the next item was already fetched in the background
+        assert fetch_ahead.stalls == 1
+        assert fetch_ahead.stall_time > 0
+        fetch_ahead.shutdown()
+
+    def test_disabled(self):
+        fetcher = Fetcher()
+        fetch_ahead = FetchAhead(list('abc'), fetcher, depth=0)
+        fetch_ahead.get(0)
+        time.sleep(0.05)
+        assert fetcher.fetched == ['a']
+        fetch_ahead.shutdown()
+
+    def test_exceptions(self):
+        def fetch(item):
+            raise ValueError(item)
+
+        fetch_ahead = FetchAhead(['a', 'b'], fetch, depth=1)
+        with pytest.raises(ValueError):
+            fetch_ahead.get(0)
+        fetch_ahead.shutdown()
+
+    def test_refetch(self):
+        fetcher = Fetcher()
+        fetch_ahead = FetchAhead(['a', 'b'], fetcher, depth=1)
+        fetch_ahead.get(0)
+        assert fetch_ahead.get(0) == 'a-fetched'
+        fetch_ahead.shutdown()
+        assert fetcher.fetched.count('a') == 2
+
+
+class FakeRepo:
+
+    repo_id = 'gentoo'
+
+
+class FakePkg:
+
+    restrict = ()
+    cpvstr = 'cat/pkg-1'
+    repo = FakeRepo()
+
+
+class TestMirrorFetching:
+    """Fetch ahead from a file:// mirror using a real fetcher."""
+
+    @pytest.fixture(autouse=True)
+    def _setup(self, tmp_path):
+        self.mirror = tmp_path / 'mirror'
+        self.distdir = tmp_path / 'distdir'
+        self.mirror.mkdir()
+        self.fetchables = {}
+        for name in ('a.tar.gz', 'b.tar.gz', 'shared.tar.gz'):
+            data = name * 1000
+            (self.mirror / name).write_text(data)
+            chksums = {
+                chf: handler(data_source.data_source(data))
+                for chf, handler in get_handlers(('size', 'sha512')).items()}
+            self.fetchables[name] = fetchable(
+                name, uri=(f'file://{self.mirror / name}',), chksums=chksums)
+        self.fetcher = custom.fetcher(
+            str(self.distdir), 'curl -sf -o "${DISTDIR}/${FILE}" "${URI}"', userpriv=False)
+
+    def fetch(self, names):
+        op = format.fetch_base(
+            None, FakePkg(), [self.fetchables[x] for x in names], self.fetcher)
+        if not op.fetch_all(observer.null_output()):
+            return False
+        return op.verified_files
+
+    def test_fetch(self):
+        items = [('a.tar.gz', 'shared.tar.gz'), ('b.tar.gz', 'shared.tar.gz'), ('missing',)]
+        self.fetchables['missing'] = fetchable(
+            'missing', uri=(f'file://{self.mirror / "missing"}',), chksums={'size': 1})
+        fetch_ahead = FetchAhead(items, self.fetch, depth=2, jobs=3)
+        verified = fetch_ahead.get(0)
+        assert sorted(os.path.basename(x) for x in verified) == ['a.tar.gz', 'shared.tar.gz']
+        verified = fetch_ahead.get(1)
+        assert sorted(os.path.basename(x) for x in verified) == ['b.tar.gz', 'shared.tar.gz']
+        assert fetch_ahead.get(2) is False
+        fetch_ahead.shutdown()
+        assert fetch_ahead.failed == [2]
+        assert sorted(os.listdir(self.distdir)) == ['a.tar.gz', 'b.tar.gz', 'shared.tar.gz']
+        for name in ('a.tar.gz', 'b.tar.gz', 'shared.tar.gz'):
+            assert (self.distdir / name).read_text() == name * 1000
@@ -0,0 +1,124 @@
+import os
+import threading
+
+from pkgcore.operations import observer, regen
+
+
+class TestAffinityScheduler:
+
+    inherits = {
+        'a': ('eutils',),
+        'b': ('eutils',),
+        'c': ('cmake', 'eutils'),
+        'd': ('python',),
+        'e': None,
+    }
+
+    def test_grouping(self):
+        scheduler = regen.AffinityScheduler(self.inherits, self.inherits.get)
+        assert len(scheduler) == 5
+        worker = scheduler.add_worker()
+
+        # groups not requiring any eclasses to be loaded are preferred
+        assert scheduler.next(worker, ('python',)) == 'e'
+        assert scheduler.next(worker, ('python',)) == 'd'
+        # groups are fully handed out to the claiming worker
+        pkgs = [scheduler.next(worker, ('python',)) for _ in range(2)]
+        assert pkgs == ['a', 'b']
+        assert scheduler.next(worker, ('eutils',)) == 'c'
+        assert scheduler.next(worker) is None
+
+    def test_stealing(self):
+        pkgs = list(range(10))
+        scheduler = regen.AffinityScheduler(pkgs)
+        busy = scheduler.add_worker()
+        idle = scheduler.add_worker()
+        assert scheduler.next(busy) == 0
+        # all pkgs are in a single group owned by the busy worker
+        # half of the remaining pkgs are stolen from the tail of the queue
+        assert scheduler.next(idle) == 6
+        assert idle.steals == 1
+        assert list(busy.queue) == [1, 2, 3, 4, 5]
+        assert list(idle.queue) == [7, 8, 9]
+
+    def test_cancel(self):
+        scheduler = regen.AffinityScheduler(range(10))
+        worker = scheduler.add_worker()
+        scheduler.cancel()
+        assert list(scheduler.iter_worker(worker)) == []
+
+    def test_iter_worker(self):
+        scheduler = regen.AffinityScheduler(range(100))
+        workers = [scheduler.add_worker() for _ in range(4)]
+        seen = []
+        threads = [
+            threading.Thread(target=lambda w: seen.extend(scheduler.iter_worker(w)), args=(w,))
+            for w in workers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert sorted(seen) == list(range(100))
+        assert sum(w.count for w in workers) == 100
+
+
+class TestRegenRepository:
+
+    class FakeRepo:
+
+        def __init__(self):
+            self.helpers = []
+
+        def _regen_operation_helper(self, **kwargs):
+
+            class helper:
+                preloaded_eclasses = frozenset()
+
+                def __call__(self, pkg):
+                    if pkg == 'bad':
+                        raise ValueError(pkg)
+
+            self.helpers.append(kwargs)
+            return helper()
+
+    def test_regen(self):
+        repo = self.FakeRepo()
+        pkgs = ['good', 'bad']
+        errors = list(regen.regen_repository(
+            repo, pkgs, observer.null_output(), threads=4,
+            affinity=lambda pkg: None, force=True))
+        assert [(pkg, str(e)) for pkg, e in errors] == [('bad', 'bad')]
+        # threads are limited to the number of pkgs, extra kwargs go to the helpers
+        assert repo.helpers == [{'force': True}] * 2
+
+    class FakeProcessHelper:
+
+        def __init__(self):
+            self.stored = {}
+
+        @staticmethod
+        def key(pkg):
+            return pkg
+
+        def generate(self, keys):
+            for key in keys:
+                if key == 'bad':
+                    yield None, ValueError(key)
+                else:
+                    yield {'pid': os.getpid()}, None
+
+        def store(self, pkg, data):
+            self.stored[pkg] = data
+
+    def test_regen_processes(self):
+        repo = self.FakeRepo()
+        helper = self.FakeProcessHelper()
+        repo._regen_process_helper = lambda **kwargs: helper
+        pkgs = [f'pkg{i}' for i in range(40)] + ['bad']
+        errors = list(regen.regen_repository(
+            repo, pkgs, observer.null_output(), threads=2, processes=True))
+        assert [(pkg, str(e)) for pkg, e in errors] == [('bad', 'bad')]
+        # metadata is generated in worker processes and stored by the parent
+        assert sorted(helper.stored) == sorted(pkgs[:-1])
+        assert os.getpid() not in {x['pid'] for x in helper.stored.values()}
+        assert not repo.helpers
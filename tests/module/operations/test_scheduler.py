@@ -0,0 +1,141 @@
+import threading
+import time
+
+import pytest
+
+from pkgcore.operations.scheduler import BuildScheduler
+
+
+class FakeOp:
+
+    def __init__(self, name, desc='add'):
+        self.name = name
+        self.desc = desc
+
+    def __repr__(self):
+        return self.name
+
+
+class FakeGraph:
+    """merge_graph stand-in, deps map op names to (dep name, dep class) pairs."""
+
+    def __init__(self, names, deps=(), removes=()):
+        self.ops = tuple(FakeOp(x, 'remove' if x in removes else 'add') for x in names)
+        idx = {x: i for i, x in enumerate(names)}
+        self._deps = [[] for _ in names]
+        for name, dep, dep_class in deps:
+            self._deps[idx[name]].append((idx[dep], dep_class))
+
+    def deps(self, i, dep_classes=None):
+        return [j for j, c in self._deps[i] if dep_classes is None or c in dep_classes]
+
+    def ordering_deps(self, i):
+        return [j for j, c in self._deps[i] if c != 'post' and j < i]
+
+
+class Recorder:
+
+    def __init__(self, fail=(), delay=0.05):
+        self.fail = set(fail)
+        self.delay = delay
+        self.events = []
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def build(self, op):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            self.events.append(('build', op.name))
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+        if op.name in self.fail:
+            return False
+        return op.name.upper()
+
+    def merge(self, op, result):
+        assert threading.current_thread() is threading.main_thread()
+        self.events.append(('merge', op.name, result))
+
+    def index(self, *event):
+        for i, x in enumerate(self.events):
+            if x[:len(event)] == event:
+                return i
+        raise ValueError(event)
+
+
+class TestBuildScheduler:
+
+    def test_parallel(self):
+        graph = FakeGraph(
+            ['lib', 'tool', 'a', 'b', 'app'],
+            deps=[
+                ('a', 'lib', 'build'), ('b', 'lib', 'runtime'),
+                ('app', 'a', 'build'), ('app', 'tool', 'runtime'),
+                ('lib', 'app', 'post'),
+            ])
+        r = Recorder()
+        s = BuildScheduler(graph, r.build, r.merge, jobs=4)
+        assert s.run()
+        assert sorted(s.merged) == list(range(5))
+        assert r.max_running >= 2
+        # build deps are merged before building
+        assert r.index('merge', 'lib') < r.index('build', 'a')
+        assert r.index('merge', 'a') < r.index('build', 'app')
+        # runtime deps only have to be merged before merging
+        assert r.index('build', 'b') < r.index('merge', 'lib')
+        assert r.index('merge', 'tool') < r.index('merge', 'app')
+        assert ('merge', 'app', 'APP') in r.events
+
+    def test_jobs(self):
+        graph = FakeGraph(['a', 'b', 'c', 'd'])
+        r = Recorder()
+        assert BuildScheduler(graph, r.build, r.merge, jobs=1).run()
+        assert r.max_running == 1
+        r = Recorder()
+        assert BuildScheduler(graph, r.build, r.merge, jobs=2).run()
+        assert r.max_running == 2
+
+    def test_load_average(self):
+        graph = FakeGraph(['a', 'b', 'c'])
+        r = Recorder()
+        s = BuildScheduler(
+            graph, r.build, r.merge, jobs=3, load_average=2,
+            getloadavg=lambda: (4.0, 4.0, 4.0))
+        s.poll_interval = 0.01
+        assert s.run()
+        # with the load exceeded builds still progress one at a time
+        assert r.max_running == 1
+
+    def test_failures(self):
+        graph = FakeGraph(
+            ['a', 'b', 'c', 'd'],
+            deps=[('b', 'a', 'build'), ('c', 'b', 'runtime')])
+        r = Recorder(fail=['a'])
+        s = BuildScheduler(graph, r.build, r.merge, jobs=1, keep_going=True)
+        assert not s.run()
+        assert s.failed == [0]
+        assert sorted(s.skipped) == [1, 2]
+        assert s.merged == [3]
+
+        r = Recorder(fail=['a'])
+        s = BuildScheduler(graph, r.build, r.merge, jobs=1)
+        assert not s.run()
+        assert s.merged == []
+
+    def test_remove(self):
+        graph = FakeGraph(['a', 'old', 'b'], removes=['old'])
+        r = Recorder()
+        assert BuildScheduler(graph, r.build, r.merge, jobs=3).run()
+        assert ('merge', 'old', None) in r.events
+        assert ('build', 'old') not in r.events
+        assert r.index('merge', 'a') < r.index('merge', 'old')
+
+    def test_exceptions(self):
+        def build(op):
+            raise ValueError(op.name)
+        graph = FakeGraph(['a'])
+        with pytest.raises(ValueError):
+            BuildScheduler(graph, build, Recorder().merge).run()
@@ -0,0 +1,71 @@
+import json
+
+from pkgcore.ebuild import resolver
+from pkgcore.ebuild.atom import atom
+from pkgcore.test.misc import FakePkg, FakeRepo
+
+
+class TestMergeGraph:
+
+    def setup_method(self):
+        self.vdb = FakeRepo(repo_id='vdb', livefs=True)
+        self.src = FakeRepo(repo_id='src', livefs=False)
+        self.vdb.pkgs = [FakePkg('a/installed-1', repo=self.vdb)]
+        self.src.pkgs = [
+            FakePkg('a/x-1', repo=self.src, data={
+                'DEPEND': 'a/lib a/tool', 'RDEPEND': 'a/lib a/installed',
+                'PDEPEND': 'a/plugin'}),
+            FakePkg('a/lib-1', repo=self.src, data={'RDEPEND': 'a/base'}),
+            FakePkg('a/tool-1', repo=self.src, data={'RDEPEND': '|| ( a/missing a/base )'}),
+            FakePkg('a/base-1', repo=self.src),
+            FakePkg('a/plugin-1', repo=self.src, data={'RDEPEND': 'a/x'}),
+            FakePkg('a/installed-1', repo=self.src),
+        ]
+
+    def resolve(self, *targets):
+        r = resolver.upgrade_resolver([self.vdb], [self.src])
+        assert r.add_atoms([atom(x) for x in targets], finalize=True) == ()
+        return r.state.graph()
+
+    def test_graph(self):
+        graph = self.resolve('a/x')
+        pkgs = [op.pkg.cpvstr for op in graph.ops]
+        assert len(graph) == 5
+        idx = {pkg.split('-')[0]: i for i, pkg in enumerate(pkgs)}
+        edges = {(pkgs[i], pkgs[j], dep_class) for i, j, dep_class, _dep in graph.edges}
+        assert edges == {
+            ('a/x-1', 'a/lib-1', 'build'),
+            ('a/x-1', 'a/tool-1', 'build'),
+            ('a/x-1', 'a/lib-1', 'runtime'),
+            ('a/x-1', 'a/plugin-1', 'post'),
+            ('a/lib-1', 'a/base-1', 'runtime'),
+            ('a/tool-1', 'a/base-1', 'runtime'),
+            ('a/plugin-1', 'a/x-1', 'runtime'),
+        }
+        assert sorted(graph.deps(idx['a/x'], ('post',))) == [idx['a/plugin']]
+        assert graph.levels[idx['a/base']] == 0
+        assert graph.levels[idx['a/lib']] == graph.levels[idx['a/tool']] == 1
+        assert graph.levels[idx['a/x']] == 2
+        assert graph.levels[idx['a/plugin']] == 3
+
+        length, path = graph.critical_path()
+        assert length == 4
+        assert [pkgs[i] for i in path][::3] == ['a/base-1', 'a/plugin-1']
+        assert graph.critical_path(weight=lambda op: 2)[0] == 8
+
+    def test_export(self):
+        graph = self.resolve('a/lib', 'a/tool')
+        data = json.loads(graph.to_json())
+        assert data['levels'] == 2
+        assert data['critical_path']['length'] == 2
+        assert {x['pkg'] for x in data['nodes']} == {'a/lib-1', 'a/tool-1', 'a/base-1'}
+        assert all(x['class'] == 'runtime' for x in data['edges'])
+        assert len(data['edges']) == 2
+        dot = graph.to_dot()
+        assert dot.startswith('digraph merge_plan {')
+        assert dot.count(' -> ') == 2
+
+    def test_empty(self):
+        graph = self.resolve('a/installed')
+        assert graph.critical_path() == (0, [])
+        assert graph.to_dict()['levels'] == 0
@@ -0,0 +1,122 @@
+import json
+import os
+
+from pkgcore.ebuild import resolver
+from pkgcore.ebuild.atom import atom
+from pkgcore.resolver.memo import path_stamps, resolver_memo
+from pkgcore.test.misc import FakePkg, FakeRepo
+
+
+class TestResolverMemo:
+
+    def setup_method(self):
+        self.src = FakeRepo(repo_id='src', livefs=False)
+        self.vdb = FakeRepo(repo_id='vdb', livefs=True)
+        self.src.pkgs = [
+            FakePkg('a/x-1', repo=self.src, data={'RDEPEND': 'a/y'}),
+            FakePkg('a/y-1', repo=self.src),
+        ]
+        self.vdb.pkgs = [
+            FakePkg('a/x-1', repo=self.vdb, data={'RDEPEND': 'a/y'}),
+            FakePkg('a/y-1', repo=self.vdb),
+        ]
+
+    def resolve(self, memo, *atoms):
+        r = resolver.upgrade_resolver([self.vdb], [self.src], memo=memo)
+        assert r.add_atoms([atom(x) for x in atoms], finalize=True) == ()
+        return [str(x) for x in r.state.iter_ops()]
+
+    def test_settled(self, tmp_path):
+        path = str(tmp_path / 'memo.json')
+        memo = resolver_memo(path, 'fp')
+        assert not memo.load()
+        assert self.resolve(memo, 'a/x') == []
+        assert atom('a/x') in memo
+        memo.write()
+
+        memo = resolver_memo(path, 'fp')
+        assert memo.load()
+        assert self.resolve(memo, 'a/x') == []
+        assert memo.hits == 1
+
+        # different configuration
+        memo = resolver_memo(path, 'other')
+        assert not memo.load()
+        assert len(memo) == 0
+
+    def test_invalidation(self, tmp_path):
+        memo = resolver_memo(str(tmp_path / 'memo.json'))
+        self.resolve(memo, 'a/x')
+        assert atom('a/x') in memo
+
+        # new version of a dep
+        self.src.pkgs.append(FakePkg('a/y-2', repo=self.src))
+        memo.invalidate()
+        assert self.resolve(memo, 'a/x') == ['replace: ebuild src: a/y-1 with ebuild src: a/y-2']
+        assert memo.hits == 0
+        assert atom('a/x') not in memo
+
+    def test_pre_solved(self, tmp_path):
+        memo = resolver_memo(str(tmp_path / 'memo.json'))
+        # a/y is pre-solved by a/x's subtree and its deps weren't visited
+        self.resolve(memo, 'a/x', 'a/y')
+        assert atom('a/x') in memo
+        assert atom('a/y') not in memo
+
+        # the next run inserts a/x's memoized pkgs, pre-solving it again
+        self.resolve(memo, 'a/x', 'a/y')
+        assert memo.hits == 1
+        assert atom('a/y') not in memo
+
+        # resolved on its own it's memoized
+        self.resolve(memo, 'a/y')
+        assert atom('a/y') in memo
+
+    def test_replay(self, tmp_path):
+        memo = resolver_memo(str(tmp_path / 'memo.json'))
+        self.vdb.pkgs[0] = FakePkg('a/x-1', repo=self.vdb, data={'RDEPEND': 'a/y !a/z'})
+        self.resolve(memo, 'a/x')
+        assert atom('a/x') in memo
+
+        # the memoized pkgs and blockers are inserted into the state
+        r = resolver.upgrade_resolver([self.vdb], [self.src], memo=memo)
+        assert r.add_atoms([atom('a/x')]) == ()
+        assert memo.hits == 1
+        assert sorted(x.cpvstr for x in r.state.state.slot_dict['a/y']) == ['a/y-1']
+        assert r.state.match_atom(atom('a/y'))[0].repo is self.vdb
+
+        # a new target blocked by a memoized pkg fails to resolve
+        self.src.pkgs.append(FakePkg('a/z-1', repo=self.src))
+        r = resolver.upgrade_resolver([self.vdb], [self.src], memo=memo)
+        assert r.add_atoms([atom('a/x'), atom('a/z')])
+        assert memo.hits == 2
+
+    def test_replay_conflict(self, tmp_path):
+        memo = resolver_memo(str(tmp_path / 'memo.json'))
+        self.resolve(memo, 'a/x')
+        assert atom('a/x') in memo
+
+        # memoized pkgs conflicting with the state are resolved normally
+        self.src.pkgs.append(FakePkg('a/y-2', repo=self.src))
+        r = resolver.upgrade_resolver([self.vdb], [self.src], memo=memo)
+        assert r.add_atoms([atom('=a/y-2'), atom('a/x')], finalize=True) == ()
+        assert [str(x) for x in r.state.iter_ops()] == [
+            'replace: ebuild src: a/y-1 with ebuild src: a/y-2']
+        assert atom('a/x') not in memo
+
+    def test_corrupt(self, tmp_path):
+        path = tmp_path / 'memo.json'
+        path.write_text('{')
+        memo = resolver_memo(str(path))
+        assert not memo.load()
+        path.write_text(json.dumps({'version': 0, 'fingerprint': '', 'atoms': {'a/x': {}}}))
+        assert not memo.load()
+        assert len(memo) == 0
+
+    def test_path_stamps(self, tmp_path):
+        (tmp_path / 'sub').mkdir()
+        (tmp_path / 'sub' / 'file').write_text('data')
+        missing = str(tmp_path / 'missing')
+        stamps = dict(path_stamps([str(tmp_path), missing]))
+        assert stamps[missing] is None
+        assert stamps[os.path.join(str(tmp_path), 'sub', 'file')][1] == 4
@@ -1,7 +1,9 @@
 from snakeoil.test import TestCase
 
+from pkgcore.ebuild.atom import atom
 from pkgcore.resolver.pigeonholes import PigeonHoledSlots
 from pkgcore.restrictions import restriction
+from pkgcore.test.misc import FakePkg
 
 from .test_choice_point import fake_package
 
@@ -61,3 +63,38 @@ class SlotTesting(TestCase):
         self.assertFalse([], c.fill_slotting(p2))
         c.remove_slotting(p)
         c.remove_slotting(p2)
+
+    def test_atom_limiters(self):
+        c = PigeonHoledSlots()
+        pkgs = [
+            FakePkg('a/x-1', slot='1'), FakePkg('a/x-2', slot='2'),
+            FakePkg('a/x-3', slot='2'), FakePkg('a/y-1')]
+        for pkg in pkgs[:2] + pkgs[3:]:
+            self.assertEqual([], c.fill_slotting(pkg))
+        # slot conflicts are found via the (key, slot) index
+        self.assertEqual([pkgs[1]], c.fill_slotting(pkgs[2]))
+        self.assertIs(pkgs[1], c.get_conflicting_slot(pkgs[2]))
+
+        for a, matches in (
+                ('a/x', pkgs[:2]), ('a/x:2', [pkgs[1]]),
+                ('>=a/x-2', [pkgs[1]]), ('<a/x-2:2', []), ('a/z', [])):
+            self.assertEqual(matches, c.find_atom_matches(atom(a)), msg=a)
+
+        blockers = [atom('!a/x:1'), atom('!>=a/x-3'), atom('!a/x'), atom('!a/x:2')]
+        self.assertEqual([pkgs[0]], c.add_limiter(blockers[0]))
+        self.assertEqual([], c.add_limiter(blockers[1]))
+        self.assertEqual(pkgs[:2], c.add_limiter(blockers[2]))
+        self.assertEqual([pkgs[1]], c.add_limiter(blockers[3]))
+        self.assertEqual(
+            sorted(map(str, blockers[1:])), sorted(map(str, c.check_limiters(pkgs[2]))))
+        self.assertEqual(
+            sorted(map(str, blockers[:3:2])), sorted(map(str, c.check_limiters(pkgs[0]))))
+
+        for blocker in blockers:
+            self.assertIn(blocker, c)
+            c.remove_limiter(blocker)
+        self.assertFalse(c.limiters)
+        self.assertEqual([], c.check_limiters(pkgs[2]))
+        c.remove_slotting(pkgs[1])
+        self.assertEqual([], c.find_atom_matches(atom('a/x:2')))
+        self.assertEqual([], c.fill_slotting(pkgs[2]))
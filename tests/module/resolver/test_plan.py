@@ -1,8 +1,17 @@
+import os
+from unittest import mock
+
 from snakeoil.currying import post_curry
+from snakeoil.osutils import pjoin
 from snakeoil.test import TestCase
 
+from pkgcore.ebuild import resolver
+from pkgcore.ebuild.atom import atom
 from pkgcore.resolver import plan
-from pkgcore.test.misc import FakePkg
+from pkgcore.resolver.choice_point import choice_point
+from pkgcore.resolver.state import add_op, replace_op
+from pkgcore.test.misc import FakePkg, FakeRepo
+from pkgcore.vdb import ondisk
 
 
 class TestPkgSorting(TestCase):
@@ -27,3 +36,160 @@ class TestPkgSorting(TestCase):
 
     test_pkg_sort_lowest = post_curry(check_it, plan.pkg_sort_lowest,
         [11,9,1,6], [1,6,9,11])
+
+
+class TestBackjumping:
+
+    def resolve(self, resolver_cls):
+        src = FakeRepo(repo_id='src', livefs=False)
+        pkgs = [
+            ('a/r-1', 'a/p a/m'), ('a/p-1', ''), ('a/n-1', 'a/o'),
+            ('a/o-1', 'a/q'), ('a/q-1', '!a/p'),
+        ]
+        # every a/m version pulls in a/n via a different atom
+        for x in range(1, 6):
+            pkgs.extend(((f'a/m-{x}', f'a/k{x}'), (f'a/k{x}-1', 'a/n')))
+        src.pkgs = [FakePkg(cpv, repo=src, data={'RDEPEND': deps}) for cpv, deps in pkgs]
+        r = resolver_cls(
+            [src], plan.pkg_sort_highest, plan.merge_plan.prefer_highest_version_strategy)
+        return r, r.add_atoms([atom('a/r')])
+
+    @staticmethod
+    def frames(frame, target):
+        for x in frame.events:
+            if isinstance(x, plan.resolver_frame):
+                if x.atom == target:
+                    yield x
+                yield from TestBackjumping.frames(x, target)
+
+    def test_nogoods(self):
+        class no_backjumping(plan.merge_plan):
+            def _nogood(self, atom, limit_to_vdb):
+                return None
+
+        r, ret = self.resolve(plan.merge_plan)
+        _r2, ret2 = self.resolve(no_backjumping)
+        assert ret[0][0] == ret2[0][0] == atom('a/r')
+        # a/n is only resolved once, subsequent attempts fail immediately
+        assert r.backjumps == 4
+        assert len(list(self.frames(ret[1], atom('a/o')))) == 1
+        assert len(list(self.frames(ret2[1], atom('a/o')))) == 5
+        n_frames = list(self.frames(ret[1], atom('a/n')))
+        assert len(n_frames) == 5
+        # the culprit is the insertion of a/p
+        [(point, culprit)] = r.nogoods[(atom('a/n'), False)]
+        assert n_frames[0].conflict_point == point
+        assert culprit.pkg.cpvstr == 'a/p-1'
+        # the failure reverted the culprit, invalidating the nogood
+        assert r._nogood(atom('a/n'), False) is None
+
+    def test_nogood_culprits(self):
+        src = FakeRepo(repo_id='src', livefs=False)
+        src.pkgs = [FakePkg('a/c-1', repo=src)]
+        r = plan.merge_plan(
+            [src], plan.pkg_sort_highest, plan.merge_plan.prefer_highest_version_strategy)
+        state = r.state
+        culprits = [FakePkg('a/a-1'), FakePkg('a/b-1')]
+        for pkg in culprits:
+            add_op(choice_point(pkg.unversioned_atom, [pkg]), pkg).apply(state)
+
+        # a/c failed due to both earlier choices
+        stack = plan.resolver_stack()
+        frame = stack.add_frame(
+            'none', atom('a/c'), choice_point(atom('a/c'), []), r.default_dbs,
+            state.current_state, False)
+        frame.add_conflict(state.culprit_points(culprits))
+        assert frame.conflict_point == 1
+        r._record_nogood(frame)
+        assert r._nogood(atom('a/c'), False) == (0, 1)
+        assert r.add_atoms([atom('a/c')])
+        assert r.backjumps == 1
+
+        # replacing the first culprit keeps its op in the plan, but the nogood
+        # no longer applies and the atom resolves
+        pkg = FakePkg('a/a-2')
+        assert not replace_op(choice_point(pkg.unversioned_atom, [pkg]), pkg).apply(state)
+        assert r._nogood(atom('a/c'), False) is None
+        assert (atom('a/c'), False) not in r.nogoods
+        assert r.add_atoms([atom('a/c')]) == ()
+        assert r.state.match_atom(atom('a/c'))
+
+    def test_culprit_point(self):
+        r, _ret = self.resolve(plan.merge_plan)
+        state = r.state
+        pkg = FakePkg('a/z-1')
+        add_op(choice_point(atom('a/z'), [pkg]), pkg).apply(state)
+        assert state.culprit_point([pkg]) == state.current_state - 1
+        assert state.culprit_point([pkg, FakePkg('a/z-2')]) is None
+        assert state.culprit_points([pkg]) == (state.current_state - 1,)
+        assert state.culprit_points([FakePkg('a/z-2')]) is None
+
+
+class TestLoadVdbState:
+
+    def setup_method(self):
+        self.vdb = FakeRepo(repo_id='vdb', livefs=True)
+        self.src = FakeRepo(repo_id='src', livefs=False)
+        self.vdb.pkgs = [
+            FakePkg('a/x-1', repo=self.vdb, data={'RDEPEND': 'a/y !a/z'}),
+            FakePkg('a/y-1', repo=self.vdb),
+            # conflicts with an installed pkg
+            FakePkg('a/w-1', repo=self.vdb, data={'RDEPEND': '!a/y'}),
+        ]
+        self.src.pkgs = [
+            FakePkg('a/x-1', repo=self.src, data={'RDEPEND': 'a/y !a/z'}),
+            FakePkg('a/y-2', repo=self.src),
+            FakePkg('a/z-1', repo=self.src),
+        ]
+
+    def resolver(self):
+        return resolver.upgrade_resolver([self.vdb], [self.src])
+
+    def test_bulk(self):
+        r = self.resolver()
+        r.load_vdb_state(bulk=True)
+        assert r.vdb_preloaded
+        assert sorted(x.pkg.cpvstr for x in r.state.iter_ops(True)) == [
+            'a/w-1', 'a/x-1', 'a/y-1']
+        assert [str(x) for x in r.state.blockers_refcnt] == ['!a/z']
+
+        # installed blockers are respected
+        ret = r.add_atoms([atom('a/z')])
+        assert ret and ret[0][0] == atom('a/z')
+        r2 = self.resolver()
+        assert r2.add_atoms([atom('a/z')]) == ()
+
+    def test_consistency(self):
+        # without conflicting installed pkgs, both modes result in the same plan
+        self.vdb.pkgs = self.vdb.pkgs[:2]
+        ops = []
+        for bulk in (False, True):
+            r = self.resolver()
+            r.load_vdb_state(bulk=bulk)
+            assert r.add_atoms([atom('=a/y-2')], finalize=True) == ()
+            ops.append([str(x) for x in r.state.iter_ops()])
+        assert ops[0] == ops[1]
+        assert [x.desc for x in r.state.iter_ops()] == ['replace']
+
+    def test_vdb_blockers(self, tmpdir):
+        location = pjoin(str(tmpdir), 'vdb')
+        for cpv, data in (
+                ('a/x-1', {'USE': 'ssl', 'RDEPEND':
+                    '!a/z || ( !a/w a/y ) ssl? ( !a/v ) gtk? ( !a/u )'}),
+                ('a/y-1', {'RDEPEND': 'a/x'})):
+            path = pjoin(location, cpv)
+            os.makedirs(path)
+            data.update({'EAPI': '7', 'SLOT': '0'})
+            for k, v in data.items():
+                with open(pjoin(path, k), 'w') as f:
+                    f.write(v + '\n')
+
+        vdb = ondisk.tree(location, disable_cache=True)
+        r = resolver.upgrade_resolver([vdb], [self.src])
+        # the revdep index and the fallback result in the same blockers
+        for cpv, expected in (('a/x-1', ['!a/v', '!a/z']), ('a/y-1', [])):
+            pkg = vdb.match(atom(f'={cpv}'))[0]
+            assert pkg.cpvstr in vdb.revdep_index
+            assert sorted(map(str, r._vdb_blockers(pkg))) == expected
+            with mock.patch.object(ondisk.tree, 'revdep_index', None):
+                assert sorted(map(str, r._vdb_blockers(pkg))) == expected
@@ -0,0 +1,66 @@
+from concurrent.futures import Future
+
+from pkgcore.ebuild import resolver
+from pkgcore.ebuild.atom import atom
+from pkgcore.resolver.prefetch import metadata_prefetcher
+from pkgcore.test.misc import FakePkg, FakeRepo
+
+
+class PrefetchingRepo(FakeRepo):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prefetched = []
+        self.cleared = 0
+
+    def prefetch_metadata(self, restrict, executor, limit=None):
+        pkgs = sorted(self.itermatch(restrict), reverse=True)[:limit]
+        self.prefetched.extend(x.cpvstr for x in pkgs)
+        futures = []
+        for _pkg in pkgs:
+            future = Future()
+            future.set_result(None)
+            futures.append(future)
+        return futures
+
+    def clear_primed_metadata(self):
+        self.cleared += 1
+
+
+class TestMetadataPrefetcher:
+
+    def setup_method(self):
+        self.src = PrefetchingRepo(repo_id='src', livefs=False)
+        self.src.pkgs = [
+            FakePkg('a/x-1', repo=self.src, data={'RDEPEND': 'a/y !a/z'}),
+            FakePkg('a/y-1', repo=self.src, data={'RDEPEND': '|| ( a/w a/v )'}),
+            FakePkg('a/y-2', repo=self.src, data={'RDEPEND': '|| ( a/w a/v )'}),
+            FakePkg('a/y-3', repo=self.src, data={'RDEPEND': '|| ( a/w a/v )'}),
+            FakePkg('a/w-1', repo=self.src),
+            FakePkg('a/v-1', repo=self.src),
+            FakePkg('a/z-1', repo=self.src),
+        ]
+
+    def test_repos(self):
+        vdb = FakeRepo(repo_id='vdb', livefs=True)
+        prefetch = metadata_prefetcher([self.src, vdb, self.src])
+        assert prefetch.repos == [self.src]
+        assert prefetch
+        assert not metadata_prefetcher([vdb])
+        assert not metadata_prefetcher([self.src], depth=0)
+
+    def test_resolve(self):
+        prefetch = metadata_prefetcher([self.src], depth=2)
+        vdb = FakeRepo(repo_id='vdb', livefs=True)
+        r = resolver.upgrade_resolver([vdb], [self.src], prefetch=prefetch)
+        assert r.add_atoms([atom('a/x')], finalize=True) == ()
+        prefetch.shutdown()
+        # unused prefetched metadata is dropped
+        assert self.src.cleared == 1
+        # targets, deps including all alternatives, skipping blockers
+        assert self.src.prefetched == ['a/x-1', 'a/y-3', 'a/y-2', 'a/w-1', 'a/v-1']
+        assert prefetch.submitted == 5
+
+        # keys are only prefetched once
+        prefetch([atom('a/x'), atom('=a/y-1'), atom('!a/z')])
+        assert prefetch.submitted == 5
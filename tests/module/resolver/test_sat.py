@@ -0,0 +1,130 @@
+from itertools import combinations
+
+import pytest
+
+from pkgcore.ebuild import resolver
+from pkgcore.ebuild.atom import atom
+from pkgcore.resolver import plan, sat
+from pkgcore.resolver.cdcl import cdcl_solver
+from pkgcore.test.misc import FakePkg, FakeRepo
+
+
+class TestCdclSolver:
+
+    def test_sat(self):
+        s = cdcl_solver()
+        a, b, c = (s.new_var() for _ in range(3))
+        s.add_clause([a, b])
+        s.add_clause([-a, c])
+        s.add_clause([-c, -b])
+        assert s.solve()
+        assert s.value(a) or s.value(b)
+        assert not s.value(a) or s.value(c)
+        assert not (s.value(c) and s.value(b))
+
+    def test_pigeonhole(self):
+        # 4 pigeons can't fit in 3 holes
+        s = cdcl_solver()
+        holes = [[s.new_var() for _ in range(3)] for _ in range(4)]
+        for pigeon in holes:
+            s.add_clause(pigeon)
+        for hole in range(3):
+            for x, y in combinations(holes, 2):
+                s.add_clause([-x[hole], -y[hole]])
+        assert not s.solve()
+        assert s.conflicts
+
+    def test_requirements(self):
+        s = cdcl_solver()
+        a, b, c, d = (s.new_var() for _ in range(4))
+        # preferred literals are used first
+        s.require([b, c])
+        s.require([d], var=c)
+        s.add_clause([-b])
+        assert s.solve()
+        assert [s.value(x) for x in (a, b, c, d)] == [False, False, True, True]
+
+    def test_empty(self):
+        s = cdcl_solver()
+        s.add_clause([])
+        assert not s.solve()
+
+
+class TestSatMergePlan:
+
+    def resolve(self, cls, src, vdb, *atoms, kls=resolver.upgrade_resolver):
+        src_repo = FakeRepo(repo_id='src', livefs=False)
+        vdb_repo = FakeRepo(repo_id='vdb', livefs=True)
+        for repo, pkgs in ((src_repo, src), (vdb_repo, vdb)):
+            repo.pkgs = [
+                FakePkg(cpv, repo=repo, eapi='5', slot=data.get('SLOT', '0'), data=dict(data))
+                for cpv, data in pkgs]
+        r = kls([vdb_repo], [src_repo], resolver_cls=cls)
+        ret = r.add_atoms([atom(x) for x in atoms], finalize=True)
+        if ret:
+            return ret[0][0]
+        return [str(x) for x in r.state.iter_ops()]
+
+    def check(self, *args, **kwargs):
+        expected = self.resolve(plan.merge_plan, *args, **kwargs)
+        assert self.resolve(sat.sat_merge_plan, *args, **kwargs) == expected
+        return expected
+
+    @pytest.mark.parametrize('kls', (resolver.upgrade_resolver, resolver.min_install_resolver))
+    def test_matching(self, kls):
+        src = [('a/x-1', {'RDEPEND': 'a/y'}), ('a/y-1', {}), ('a/y-2', {})]
+        vdb = [('a/x-1', {'RDEPEND': 'a/y'}), ('a/y-1', {})]
+        ops = self.check(src, vdb, 'a/x', kls=kls)
+        if kls is resolver.upgrade_resolver:
+            assert ops == ['replace: ebuild src: a/y-1 with ebuild src: a/y-2']
+        else:
+            assert ops == []
+
+        # post deps are ordered after their parents
+        src = [('a/x-1', {'RDEPEND': 'a/y'}), ('a/y-1', {'PDEPEND': 'a/x'})]
+        assert self.check(src, [], 'a/x', kls=kls) == [
+            'add: ebuild src: a/y-1', 'add: ebuild src: a/x-1']
+
+    def test_blocker_on_installed(self):
+        src = [('a/x-1', {'RDEPEND': '|| ( a/z a/w ) >=a/y-2'}),
+               ('a/y-2', {'RDEPEND': '!a/w'}), ('a/z-1', {}), ('a/w-1', {})]
+        vdb = [('a/w-1', {})]
+        assert self.check(src, vdb, 'a/x') == atom('a/x')
+
+    def test_late_blocker(self):
+        # the default resolver fails since the blocker is only found after
+        # a/y-2 was chosen and it doesn't backtrack over siblings
+        src = [('a/x-1', {'RDEPEND': 'a/y a/q'}), ('a/y-1', {}),
+               ('a/y-2', {'RDEPEND': '!a/q'}), ('a/q-1', {})]
+        assert self.resolve(plan.merge_plan, src, [], 'a/x') == atom('a/x')
+        assert self.resolve(sat.sat_merge_plan, src, [], 'a/x') == [
+            'add: ebuild src: a/y-1', 'add: ebuild src: a/q-1', 'add: ebuild src: a/x-1']
+
+    def test_slots(self):
+        src = [('a/x-1', {'RDEPEND': 'a/y:1 a/y:2'}), ('a/y-1', {'SLOT': '1'}),
+               ('a/y-2', {'SLOT': '2'})]
+        ops = self.resolve(sat.sat_merge_plan, src, [], 'a/x')
+        assert sorted(ops[:2]) == ['add: ebuild src: a/y-1', 'add: ebuild src: a/y-2']
+        assert ops[2] == 'add: ebuild src: a/x-1'
+
+    def test_apply_conflict(self):
+        class kls(sat.sat_merge_plan):
+            # blocker rewrite the formula doesn't know about
+            def generate_mangled_blocker(self, choices, blocker):
+                return atom(blocker.key)
+
+        src = [('a/x-1', {'RDEPEND': 'a/y !a/y:1'}), ('a/y-1', {})]
+        assert self.resolve(kls, src, [], 'a/x') == atom('=a/x-1')
+
+    def test_no_matches(self):
+        assert self.check([], [], 'a/x') == atom('a/x')
+
+    def test_generate_kls(self):
+        kls = sat.generate_sat_resolver_kls(resolver.empty_tree_merge_plan)
+        assert issubclass(kls, sat.sat_merge_plan)
+        assert issubclass(kls, resolver.empty_tree_merge_plan)
+        assert sat.generate_sat_resolver_kls(kls) is kls
+        src = [('a/x-1', {})]
+        vdb = [('a/x-1', {})]
+        assert self.resolve(kls, src, vdb, 'a/x') == [
+            'replace: ebuild src: a/x-1 with ebuild src: a/x-1']
@@ -0,0 +1,59 @@
+import json
+
+from pkgcore.ebuild import resolver
+from pkgcore.ebuild.atom import atom
+from pkgcore.resolver import sat
+from pkgcore.resolver.stats import resolver_stats
+from pkgcore.test.misc import FakePkg, FakeRepo
+
+
+class TestResolverStats:
+
+    def resolve(self, src, *atoms, **kwds):
+        src_repo = FakeRepo(repo_id='src', livefs=False)
+        vdb_repo = FakeRepo(repo_id='vdb', livefs=True)
+        src_repo.pkgs = [FakePkg(cpv, repo=src_repo, data=data) for cpv, data in src]
+        stats = resolver_stats()
+        r = resolver.upgrade_resolver([vdb_repo], [src_repo], stats=stats, **kwds)
+        ret = r.add_atoms([atom(x) for x in atoms], finalize=True)
+        return r, ret, stats.report(r)
+
+    def test_report(self):
+        src = [
+            ('a/x-1', {'RDEPEND': 'a/y'}),
+            ('a/y-2', {'RDEPEND': 'a/w a/missing'}), ('a/y-1', {'RDEPEND': 'a/w'}),
+            ('a/w-1', {}),
+        ]
+        r, ret, report = self.resolve(src, 'a/x')
+        assert ret == ()
+        assert json.loads(json.dumps(report)) == report
+
+        per_atom = report['per_atom']
+        assert set(per_atom) == {'a/x', 'a/y', 'a/w', 'a/missing'}
+        assert per_atom['a/x']['calls'] == 1
+        # a/y-2 was tried first and its deps backtracked
+        assert per_atom['a/y']['choices'] == 2
+        assert per_atom['a/x']['time'] >= per_atom['a/x']['self_time']
+        assert report['atoms']['max_depth'] == 3
+        assert report['choices']['max_per_choice_point'] == 2
+        assert report['backtracks']['count'] > 0
+        assert report['backtracks']['max_depth'] >= 1
+        assert report['repo_cache']['src']['misses'] > 0
+        assert report['repo_cache']['src']['hits'] > 0
+        assert report['hottest'][0]['atom'] in per_atom
+        assert 'solver' not in report
+
+    def test_failure(self):
+        _r, ret, report = self.resolve([('a/x-1', {'RDEPEND': 'a/missing'})], 'a/x')
+        assert ret
+        assert report['per_atom']['a/missing']['failures'] == 1
+        assert report['atoms']['failures'] == 2
+
+    def test_sat(self):
+        src = [('a/x-1', {'RDEPEND': 'a/y'}), ('a/y-1', {})]
+        _r, ret, report = self.resolve(
+            src, 'a/x', resolver_cls=sat.sat_merge_plan)
+        assert ret == ()
+        assert report['solver']['solves'] == 1
+        assert report['solver']['vars'] == 2
+        assert report['per_atom'] == {}
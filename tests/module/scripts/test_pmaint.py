@@ -251,3 +251,17 @@ class TestRegen(TestCase, ArgParseMixin):
             'fake', '--threads', '2', domain=make_domain())
         self.assertTrue(isinstance(options.repos[0], util.SimpleTree))
         self.assertEqual(options.threads, 2)
+        self.assertEqual(options.pipeline_window, 4)
+        self.assertEqual(options.ebd_min_idle, 0)
+        self.assertIdentical(options.ebd_max_idle, None)
+        self.assertIdentical(options.ebd_idle_timeout, None)
+
+        options = self.parse(
+            'fake', '--ebd-min-idle', '1', '--ebd-max-idle', '4',
+            '--ebd-idle-timeout', '30', domain=make_domain())
+        self.assertEqual(options.ebd_min_idle, 1)
+        self.assertEqual(options.ebd_max_idle, 4)
+        self.assertEqual(options.ebd_idle_timeout, 30)
+
+        options = self.parse('fake', '--pipeline-window', '1', domain=make_domain())
+        self.assertEqual(options.pipeline_window, 1)
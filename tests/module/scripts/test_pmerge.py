@@ -1,9 +1,14 @@
 import pytest
+from snakeoil.test import TestCase
 
+from pkgcore.config import basics
+from pkgcore.config.hint import configurable
+from pkgcore.ebuild import formatter
 from pkgcore.ebuild.atom import atom
 from pkgcore.repository.util import SimpleTree
 from pkgcore.scripts import pmerge
 from pkgcore.test.misc import FakePkg, FakeRepo
+from pkgcore.test.scripts.helpers import ArgParseMixin
 from pkgcore.util.parserestrict import parse_match
 
 
@@ -87,3 +92,25 @@ class TestTargetParsing:
         assert a[0].key == 'foo/bar'
         assert a[0].match(atom('foo/bar:0'))
         assert not a[0].match(atom('foo/bar:2'))
+
+
+@configurable(typename='pkgset')
+def fake_set():
+    """Fake package set."""
+    return frozenset()
+
+
+class TestMain(TestCase, ArgParseMixin):
+
+    _argparser = pmerge.argparser
+    suppress_domain = True
+
+    def test_main_func(self):
+        assert self.parser.get_default('main_func') is pmerge.main
+
+    def test_list_sets(self):
+        self.assertOut(
+            ['world'], '--list-sets', '-q',
+            world=basics.HardCodedConfigSection({'class': fake_set}),
+            formatter=basics.HardCodedConfigSection(
+                {'class': formatter.BasicFormatter, 'default': True}))
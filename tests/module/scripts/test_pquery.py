@@ -1,3 +1,7 @@
+import os
+from unittest import mock
+
+from snakeoil.osutils import pjoin
 from snakeoil.test import TestCase
 
 from pkgcore.config import basics
@@ -6,6 +10,7 @@ from pkgcore.ebuild import atom
 from pkgcore.repository import util
 from pkgcore.scripts import pquery
 from pkgcore.test.scripts.helpers import ArgParseMixin
+from pkgcore.vdb.ondisk import tree
 
 
 class FakeDomain:
@@ -73,3 +78,40 @@ class CommandlineTest(TestCase, ArgParseMixin):
 
     def test_no_contents(self):
         self.assertOut([], '--contents', '--all', test_domain=domain_config)
+
+
+class TestIterRevdeps:
+
+    def test_index(self, tmpdir):
+        location = pjoin(str(tmpdir), 'vdb')
+        path = pjoin(location, 'app-misc', 'bar-2')
+        os.makedirs(path)
+        data = {
+            'EAPI': '7', 'SLOT': '0', 'USE': 'ssl',
+            'RDEPEND': 'dev-libs/foo:= ssl? ( >=dev-libs/foo-1 dev-libs/foo:= ) '
+                       'gtk? ( !ssl? ( dev-libs/foo ) ) gtk? ( >=dev-libs/foo-1 )',
+            'DEPEND': 'ssl? ( dev-libs/foo )',
+        }
+        for k, v in data.items():
+            with open(pjoin(path, k), 'w') as f:
+                f.write(v + '\n')
+        repo = tree(location, disable_cache=True)
+        [pkg] = repo
+        foo = atom.atom('dev-libs/foo')
+
+        def revdeps():
+            return [
+                (name, str(key), restricts if restricts is None else [str(x) for x in restricts])
+                for name, key, restricts in pquery.iter_revdeps(pkg, foo)]
+
+        assert 'app-misc/bar-2' in repo.revdep_index
+        indexed = revdeps()
+        # output matches parsing the pkg's deps
+        with mock.patch.object(tree, 'revdep_index', None):
+            assert indexed == revdeps()
+        assert ('depend', 'dev-libs/foo', []) in indexed
+        assert ('raw_depend', 'dev-libs/foo', []) in indexed
+
+        # pkgs without intersecting deps aren't parsed
+        with mock.patch.object(pquery, 'get_pkg_attr', side_effect=AssertionError):
+            assert not list(pquery.iter_revdeps(pkg, atom.atom('dev-libs/other')))
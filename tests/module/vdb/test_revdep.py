@@ -0,0 +1,132 @@
+import os
+import shutil
+from unittest import mock
+
+from snakeoil.osutils import pjoin
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.test.misc import FakePkg
+from pkgcore.vdb.ondisk import tree
+from pkgcore.vdb.revdep import RevdepIndex, RevdepRestriction
+
+
+class TestRevdepIndex:
+
+    def add_pkg(self, cpv, use='', **deps):
+        cat, pf = cpv.split('/')
+        path = pjoin(self.location, cat, pf)
+        os.makedirs(path)
+        data = {'EAPI': '7', 'SLOT': '0', 'USE': use}
+        data.update((k.upper(), v) for k, v in deps.items())
+        for k, v in data.items():
+            with open(pjoin(path, k), 'w') as f:
+                f.write(v + '\n')
+
+    def _setup(self, tmpdir):
+        self.location = pjoin(str(tmpdir), 'vdb')
+        self.cache = pjoin(str(tmpdir), 'cache', 'revdep.json')
+        self.add_pkg('dev-libs/foo-1')
+        self.add_pkg(
+            'app-misc/bar-2', use='ssl',
+            rdepend='dev-libs/foo ssl? ( >=dev-libs/foo-1 ) gtk? ( dev-libs/gtk )')
+        self.add_pkg(
+            'app-misc/baz-1',
+            depend='ssl? ( dev-libs/foo ) || ( app-misc/bar dev-libs/bar )')
+        self.add_pkg('app-misc/blocker-1', rdepend='!dev-libs/foo')
+        self.repo = tree(self.location, disable_cache=True)
+
+    def test_revdeps(self, tmpdir):
+        self._setup(tmpdir)
+        index = RevdepIndex(self.repo)
+        foo = atom('dev-libs/foo')
+        assert index.dependants(foo) == {'app-misc/bar-2', 'app-misc/blocker-1'}
+        assert index.dependants(foo, inactive=True) == {
+            'app-misc/bar-2', 'app-misc/baz-1', 'app-misc/blocker-1'}
+        assert index.dependants(atom('app-misc/bar')) == {'app-misc/baz-1'}
+        assert not index.dependants(atom('dev-libs/gtk'))
+        assert index.dependants(atom('dev-libs/gtk'), inactive=True) == {'app-misc/bar-2'}
+        assert [(attr, str(dep), flags) for attr, dep, flags in
+                index.revdeps('app-misc/bar-2', foo)] == [
+            ('rdepend', 'dev-libs/foo', []),
+            ('rdepend', '>=dev-libs/foo-1', ['ssl'])]
+        assert [(attr, str(dep), flags) for attr, dep, flags in
+                index.revdeps('app-misc/baz-1', foo, inactive=True)] == [
+            ('depend', 'dev-libs/foo', ['ssl'])]
+        assert not index.revdeps('app-misc/baz-1', foo)
+        assert not index.revdeps('dev-libs/missing-1', foo)
+        assert [str(x) for x in index.blockers('app-misc/blocker-1')] == ['!dev-libs/foo']
+        assert not index.blockers('app-misc/blocker-1', ['depend'])
+        assert not index.blockers('app-misc/bar-2')
+        assert len(index) == 4
+        assert 'dev-libs/foo-1' in index
+
+    def test_persistence(self, tmpdir):
+        self._setup(tmpdir)
+        foo = atom('dev-libs/foo')
+        index = RevdepIndex(self.repo, self.cache)
+        assert index.dependants(foo) == {'app-misc/bar-2', 'app-misc/blocker-1'}
+        assert os.path.exists(self.cache)
+
+        # stored entries are reused while pkg dirs are unmodified
+        index = RevdepIndex(self.repo, self.cache)
+        index._index = None
+        assert index.dependants(foo) == {'app-misc/bar-2', 'app-misc/blocker-1'}
+
+        # pkgs modified out of band are reindexed
+        path = pjoin(self.location, 'app-misc', 'baz-1')
+        with open(pjoin(path, 'USE'), 'w') as f:
+            f.write('ssl\n')
+        os.utime(path, ns=(0, 0))
+        repo = tree(self.location, disable_cache=True)
+        assert RevdepIndex(repo, self.cache).dependants(foo) == {
+            'app-misc/bar-2', 'app-misc/baz-1', 'app-misc/blocker-1'}
+
+    def test_add_remove(self, tmpdir):
+        self._setup(tmpdir)
+        foo = atom('dev-libs/foo')
+        index = RevdepIndex(self.repo, self.cache)
+        assert index.dependants(foo) == {'app-misc/bar-2', 'app-misc/blocker-1'}
+        self.add_pkg('app-misc/new-1', pdepend='>=dev-libs/foo-1')
+        index.add(FakePkg('app-misc/new-1'))
+        shutil.rmtree(pjoin(self.location, 'app-misc', 'bar-2'))
+        index.remove(FakePkg('app-misc/bar-2'))
+        index.remove(FakePkg('app-misc/missing-1'))
+        assert index.dependants(foo) == {'app-misc/new-1', 'app-misc/blocker-1'}
+        repo = tree(self.location, disable_cache=True)
+        assert RevdepIndex(repo, self.cache).dependants(foo) == {
+            'app-misc/new-1', 'app-misc/blocker-1'}
+
+    def test_batch(self, tmpdir):
+        self._setup(tmpdir)
+        foo = atom('dev-libs/foo')
+        index = RevdepIndex(self.repo, self.cache)
+        assert index.dependants(foo) == {'app-misc/bar-2', 'app-misc/blocker-1'}
+        self.add_pkg('app-misc/new-1', pdepend='>=dev-libs/foo-1')
+        shutil.rmtree(pjoin(self.location, 'app-misc', 'bar-2'))
+        with mock.patch.object(index, 'flush', wraps=index.flush) as flush:
+            with index.batch():
+                with index.batch():
+                    index.remove(FakePkg('app-misc/bar-2'))
+                index.add(FakePkg('app-misc/new-1'))
+                assert not flush.called
+            flush.assert_called_once_with()
+        repo = tree(self.location, disable_cache=True)
+        assert RevdepIndex(repo, self.cache).dependants(foo) == {
+            'app-misc/new-1', 'app-misc/blocker-1'}
+
+    def test_vdb(self, tmpdir):
+        self._setup(tmpdir)
+        repo = tree(self.location, cache_location=pjoin(str(tmpdir), 'cache'))
+        assert repo.revdep_index.location == self.cache
+        assert repo.revdep_index is repo.revdep_index
+        assert tree(self.location, disable_cache=True).revdep_index.location is None
+
+    def test_restriction(self, tmpdir):
+        self._setup(tmpdir)
+        foo = atom('dev-libs/foo')
+        restrict = RevdepRestriction(foo, atom('app-misc/other'))
+        assert sorted(x.cpvstr for x in self.repo.itermatch(restrict)) == [
+            'app-misc/bar-2', 'app-misc/blocker-1']
+        # pkgs without an index use the fallback restriction
+        assert restrict.match(FakePkg('app-misc/other-1'))
+        assert not restrict.match(FakePkg('app-misc/bar-2'))